@@ -2,12 +2,20 @@
 from __future__ import annotations
 
 import importlib
+import os
+from functools import lru_cache
 
 
-def get_filter(filter: str = "color2gray", implementation: str = "python"):
+def get_filter(
+    filter: str = "color2gray",
+    implementation: str = "python",
+    workers: int = None,
+    instrument: bool = None,
+):
     """Return the filter function by name
 
     Assumes filters are named e.g.in3110_instapy.python_filters.python_color2gray.
+    Backends are imported on first use, and resolved filters are cached.
 
     Args:
 
@@ -15,18 +23,100 @@ def get_filter(filter: str = "color2gray", implementation: str = "python"):
             The name of the filter ('color2gray' or 'color2sepia')
         implementation (str):
             The name of the implementation (python, cython, etc.)
+            Prefix with 'parallel-' (e.g. 'parallel-numba')
+            to run the implementation on multiple cores.
+            'auto' picks the fastest available implementation
+            for each image's size (see in3110_instapy.registry).
+        workers (int):
+            The number of workers for 'parallel-' implementations
+            (default: number of cpus).
+            With 'auto', the chosen implementation runs on this many cores.
+        instrument (bool):
+            Record metrics of each call (see in3110_instapy.metrics)
+            (default: True if $INSTAPY_METRICS is set)
 
     Returns:
         filter_function (function):
             The filter function, which should take an image
             (a 3D numpy array of uint8)
             and return the filtered image
-            (numpy array of same shape and type as input)
+            (numpy array of same shape and type as input).
+            Every filter function accepts an `out` array to write
+            the filtered image into, `layout="planar"` for planar
+            (3, H, W) images, and color2sepia accepts
+            `inplace=True` to overwrite the input image.
     """
 
-    # get the module (instapy.python_filters)
-    module = importlib.import_module(f"in3110_instapy.{implementation}_filters")
-    # construct filter function name (python_color2gray)
-    filter_name = f"{implementation}_{filter}"
-    # return the resolved function (instapy.python.python_color2gray)
-    return getattr(module, filter_name)
+    if instrument is None:
+        instrument = _metrics_enabled()
+    return _resolve_filter(filter, implementation, workers, bool(instrument))
+
+
+@lru_cache(maxsize=None)
+def _resolve_filter(filter: str, implementation: str, workers: int, instrument: bool):
+    """Import and return a filter function (see get_filter)
+
+    Memoized, so each backend is imported (and compiled) once,
+    and later calls are a dictionary lookup.
+    Failed imports aren't cached, and are retried on the next call.
+    """
+    if implementation.startswith("parallel-"):
+        from .parallel import get_parallel_filter
+
+        filter_function = get_parallel_filter(
+            filter, implementation[len("parallel-") :], workers=workers
+        )
+    elif implementation == "auto":
+        from .registry import auto_filter
+
+        filter_function = auto_filter(filter, workers)
+    else:
+        from .registry import get_backend
+
+        backend = get_backend(implementation)
+        # get the module (instapy.python_filters)
+        module = importlib.import_module(backend["module"])
+        # construct filter function name (python_color2gray)
+        filter_name = f"{implementation}_{filter}"
+        # the resolved function (instapy.python.python_color2gray)
+        filter_function = getattr(module, filter_name)
+        if not backend["planar"]:
+            from .buffers import planar_views
+
+            # without planar kernels, planar images are filtered through interleaved views
+            filter_function = planar_views(filter_function)
+
+    if instrument:
+        from .metrics import instrument as instrument_filter
+
+        filter_function = instrument_filter(filter_function, filter, implementation)
+    return filter_function
+
+
+def _metrics_enabled() -> bool:
+    """Whether filters are instrumented by default ($INSTAPY_METRICS)"""
+    return os.environ.get("INSTAPY_METRICS", "").lower() in {"1", "true", "yes", "on"}
+
+
+def pipeline(*stages: str, fuse: bool = True):
+    """Return a pipeline applying several filters in turn
+
+    Consecutive gray/sepia stages are fused into a single pass over the image.
+
+    Example:
+        pipeline("scale:2", "sepia:k=0.5", "gray")(image)
+
+    Args:
+        *stages (str):
+            The stages: 'gray', 'sepia', 'sepia:k=<amount>' or 'scale:<factor>'
+        fuse (bool):
+            Whether to fuse consecutive gray/sepia stages
+            (fused results are exactly those of running the filters in turn)
+
+    Returns:
+        pipeline (in3110_instapy.pipelines.Pipeline):
+            callable, which takes an image and returns the filtered image
+    """
+    from .pipelines import Pipeline
+
+    return Pipeline(*stages, fuse=fuse)
@@ -0,0 +1,200 @@
+"""batch processing of many image files
+
+Each worker process imports (and compiles) the filter once,
+then decodes, filters and encodes one image at a time,
+so with several workers the stages of different images overlap.
+"""
+from __future__ import annotations
+
+import glob
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from . import io
+
+# file suffixes picked up when the source is a directory
+image_suffixes = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".ppm", ".webp"}
+
+
+def find_images(source: str) -> list:
+    """Find the image files in a directory, or matching a glob pattern
+
+    Args:
+        source (str): a directory or a glob pattern (e.g. 'photos/*.jpg')
+    Returns:
+        list: the sorted image file paths
+    """
+    if os.path.isdir(source):
+        files = [
+            path
+            for path in Path(source).iterdir()
+            if path.is_file() and path.suffix.lower() in image_suffixes
+        ]
+    else:
+        files = [Path(name) for name in glob.glob(source, recursive=True)]
+        files = [path for path in files if path.is_file()]
+    return sorted(files)
+
+
+def source_root(source: str) -> Path:
+    """The directory that the files found from `source` are relative to
+
+    The directory itself, or the part of a glob pattern before its first wildcard
+    (e.g. 'photos' for 'photos/**/*.jpg').
+    """
+    if os.path.isdir(source):
+        return Path(source)
+    root = []
+    for part in Path(source).parts:
+        if glob.has_magic(part):
+            break
+        root.append(part)
+    else:
+        # a single file
+        root = root[:-1]
+    return Path(*root) if root else Path(".")
+
+
+def is_up_to_date(file: Path, out_file: Path) -> bool:
+    """Whether `out_file` exists and is newer than `file`"""
+    try:
+        return out_file.stat().st_mtime >= file.stat().st_mtime
+    except FileNotFoundError:
+        return False
+
+
+def _init_worker(filter_name: str, implementation: str, threads: int) -> None:
+    """Import and warm up the filter once per worker process"""
+    from . import get_filter
+
+    if implementation == "numba":
+        import numba
+
+        # don't run more threads than our share of the cpus
+        numba.set_num_threads(max(1, min(threads, numba.config.NUMBA_NUM_THREADS)))
+    get_filter(filter_name, implementation)(io.random_image(8, 8))
+
+
+def _filter_file(
+    file: str,
+    out_file: str,
+    implementation: str,
+    filter_name: str,
+    scale: float,
+    fast_gray: bool = False,
+    encoder_options: dict = None,
+) -> str:
+    """Filter one file (runs in a worker process)"""
+    from .cli import run_filter
+
+    run_filter(
+        file,
+        out_file=out_file,
+        implementation=implementation,
+        filter=filter_name,
+        scale=scale,
+        fast_gray=fast_gray,
+        encoder_options=encoder_options,
+    )
+    return out_file
+
+
+def run_batch(
+    source: str,
+    out_dir: str,
+    implementation: str = "numpy",
+    filter: str = "color2gray",
+    scale: float = 1,
+    processes: int = None,
+    force: bool = False,
+    fast_gray: bool = False,
+    encoder_options: dict = None,
+) -> dict:
+    """Filter all images in a directory (or matching a glob) into `out_dir`
+
+    Outputs newer than their input are skipped, unless `force` is True.
+    The outputs mirror the paths of the inputs under the source directory
+    (or the part of the glob before its first wildcard),
+    so files of the same name in different directories don't overwrite each other.
+    A file that fails is reported and counted, the others are still filtered.
+
+    Args:
+        source (str): a directory or a glob pattern
+        out_dir (str): the directory to write the filtered images to
+        implementation (str): the filter implementation
+        filter (str): the name of the filter ('color2gray' or 'color2sepia')
+        scale (float): factor to downscale images by
+        processes (int): the number of worker processes (default: number of cpus)
+        force (bool): filter images even if their output is up to date
+        fast_gray (bool): decode straight to gray instead of filtering (see run_filter)
+        encoder_options (dict): options for io.write_image, e.g. {'quality': 85}
+    Returns:
+        dict: counts of 'filtered', 'skipped' and 'failed' images,
+            the 'errors' (file and message of each failure),
+            the elapsed 'seconds' and 'images_per_second'
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    root = source_root(source)
+    jobs = []
+    skipped = 0
+    for file in find_images(source):
+        out_file = out_dir / file.relative_to(root)
+        out_file.parent.mkdir(parents=True, exist_ok=True)
+        if not force and is_up_to_date(file, out_file):
+            skipped += 1
+        else:
+            jobs.append((str(file), str(out_file)))
+
+    errors = []
+    start = time.perf_counter()
+    if jobs and implementation == "auto":
+        from .registry import load_calibration
+
+        # calibrate once here (if needed), the workers load it from disk
+        load_calibration(filter)
+    if jobs:
+        threads = max(1, (os.cpu_count() or 1) // processes)
+        # spawn, since forking after numba has started its threads can deadlock
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=min(processes, len(jobs)),
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(filter, implementation, threads),
+        ) as pool:
+            futures = [
+                pool.submit(
+                    _filter_file,
+                    file,
+                    out_file,
+                    implementation,
+                    filter,
+                    scale,
+                    fast_gray,
+                    encoder_options,
+                )
+                for file, out_file in jobs
+            ]
+            for (file, _), future in zip(jobs, futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append((file, f"{type(e).__name__}: {e}"))
+    seconds = time.perf_counter() - start
+    filtered = len(jobs) - len(errors)
+
+    return {
+        "filtered": filtered,
+        "skipped": skipped,
+        "failed": len(errors),
+        "errors": errors,
+        "seconds": seconds,
+        "images_per_second": filtered / seconds if seconds > 0 else 0.0,
+    }
@@ -0,0 +1,611 @@
+"""benchmarks of every filter implementation
+
+Times each (filter, implementation, image size) with warmup calls
+and repeated measurements, and reports the min, median and 95th percentile
+time, the throughput in megapixels per second, and the peak memory
+allocated by one call.
+Results can be written as JSON or CSV, to compare between releases.
+With `--layouts interleaved planar`, each image is also timed
+in planar (3, H, W) layout, to compare the planar kernels with the interleaved ones.
+
+Results can also be saved as a baseline for the machine they ran on
+(`--save-baseline`), and later runs compared against it (`--compare`):
+a result is a regression when its median is more than `threshold` slower
+and a one-sided Mann-Whitney U test on the call times says it is
+significantly slower. Regressions make the command exit with status 1.
+
+Run as `python -m in3110_instapy.benchmark --help` (or `instapy benchmark`).
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import functools
+import hashlib
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from importlib import metadata
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from . import get_filter, io
+
+# (width, height) of the benchmarked image sizes, from thumbnail to 50 MP
+image_sizes = {
+    "thumbnail": (160, 120),
+    "vga": (640, 480),
+    "hd": (1920, 1080),
+    "12mp": (4000, 3000),
+    "50mp": (8660, 5774),
+}
+
+filter_names = ["color2gray", "color2sepia"]
+
+# image memory layouts: interleaved (H, W, 3) and planar (3, H, W)
+layouts = ["interleaved", "planar"]
+
+implementations = [
+    "python",
+    "numpy",
+    "numba",
+    "integer",
+    "lut",
+    "cython",
+    "parallel-numpy",
+    "parallel-numba",
+    "parallel-integer",
+    "parallel-lut",
+    "parallel-cython",
+]
+
+# the pure python implementation takes tens of seconds on large images,
+# so by default it is only run on images up to this many pixels
+python_max_pixels = 1920 * 1080
+
+# the fields of each result, in CSV column order
+result_fields = [
+    "filter",
+    "implementation",
+    "layout",
+    "size",
+    "width",
+    "height",
+    "warmup",
+    "repeat",
+    "min",
+    "median",
+    "p95",
+    "mean",
+    "megapixels_per_second",
+    "peak_memory_bytes",
+]
+
+# the fields identifying a result, to match results between runs
+result_key_fields = ("filter", "implementation", "layout", "size", "width", "height")
+# for results saved before a key field was added
+result_key_defaults = {"layout": "interleaved"}
+
+# where baselines are stored, one file per machine fingerprint
+default_baseline_dir = os.environ.get("INSTAPY_BENCHMARK_DIR", ".benchmarks")
+
+
+def cpu_model() -> str:
+    """The cpu model name, e.g. 'Intel(R) Core(TM) i7-8565U CPU @ 1.80GHz'
+
+    platform.processor() is empty on Linux (and just the architecture on macOS),
+    so the model is read from /proc/cpuinfo on Linux and sysctl on macOS.
+    Falls back to platform.processor(), or platform.machine().
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            with open("/proc/cpuinfo") as f:
+                for line in f:
+                    # 'model name' on x86, 'Model' or 'Hardware' on some ARM boards
+                    key, _, value = line.partition(":")
+                    if key.strip() in {"model name", "Model", "Hardware"} and value.strip():
+                        return value.strip()
+        except OSError:
+            pass
+    elif sys.platform == "darwin":
+        try:
+            return subprocess.run(
+                ["sysctl", "-n", "machdep.cpu.brand_string"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            pass
+    return platform.processor() or platform.machine()
+
+
+def machine_info() -> dict:
+    """Describe the machine and library versions the benchmarks ran with"""
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": cpu_model(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+    }
+    # the installed version, without importing numba (which takes seconds)
+    try:
+        info["numba"] = metadata.version("numba")
+    except metadata.PackageNotFoundError:
+        info["numba"] = None
+    return info
+
+
+def machine_fingerprint(info: dict = None) -> str:
+    """A short id of the machine, to only compare results from the same machine
+
+    Made from the cpu, core count and python/numpy/numba versions,
+    but not the hostname, so identical machines share baselines.
+    """
+    if info is None:
+        info = machine_info()
+    fields = ["processor", "machine", "cpu_count", "python", "numpy", "numba"]
+    text = json.dumps([info.get(field) for field in fields])
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def time_calls(
+    filter_function: Callable, image: np.array, warmup: int = 1, repeat: int = 5
+) -> list:
+    """Time `repeat` calls of filter_function(image), after `warmup` calls
+
+    Returns:
+        list: the time (in seconds) of each call
+    """
+    for _ in range(warmup):
+        filter_function(image)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        filter_function(image)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def peak_memory(filter_function: Callable, image: np.array) -> int:
+    """The peak memory (in bytes) allocated during one call
+
+    Measured with tracemalloc, which sees numpy's allocations,
+    but not memory allocated inside numba or Cython code.
+    """
+    tracemalloc.start()
+    try:
+        # resets the peak too, like reset_peak (Python 3.9+)
+        tracemalloc.clear_traces()
+        before = tracemalloc.get_traced_memory()[0]
+        filter_function(image)
+        return tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+
+def summarize(times: list, pixels: int) -> dict:
+    """Statistics of a list of call times for an image with `pixels` pixels"""
+    median = float(np.median(times))
+    return {
+        "min": float(np.min(times)),
+        "median": median,
+        "p95": float(np.percentile(times, 95)),
+        "mean": float(np.mean(times)),
+        "megapixels_per_second": pixels / median / 1e6 if median > 0 else float("inf"),
+    }
+
+
+def benchmark_filter(
+    filter_function: Callable,
+    image: np.array,
+    warmup: int = 1,
+    repeat: int = 5,
+    memory: bool = True,
+) -> dict:
+    """Benchmark one filter function on one image
+
+    Args:
+        filter_function (callable): the filter to time
+        image (np.array): the image to filter
+        warmup (int): untimed calls before measuring (e.g. for JIT compilation)
+        repeat (int): timed calls
+        memory (bool): also measure the peak memory of one call
+    Returns:
+        dict: the 'min', 'median', 'p95' and 'mean' time (in seconds),
+            'megapixels_per_second' (from the median)
+            and 'peak_memory_bytes' (None if not measured)
+    """
+    times = time_calls(filter_function, image, warmup=warmup, repeat=repeat)
+    result = summarize(times, image.size // 3)
+    # measured separately, since tracing slows down the calls
+    result["peak_memory_bytes"] = peak_memory(filter_function, image) if memory else None
+    result["times"] = times
+    return result
+
+
+def run_benchmarks(
+    sizes: list = None,
+    implementations: list = implementations,
+    filters: list = filter_names,
+    warmup: int = 1,
+    repeat: int = 5,
+    memory: bool = True,
+    images: dict = None,
+    max_python_pixels: int = python_max_pixels,
+    verbose: bool = True,
+    layouts: list = ("interleaved",),
+) -> dict:
+    """Benchmark every combination of filter, implementation and image size
+
+    Implementations that aren't available (e.g. Cython not compiled)
+    are skipped, and so is the python implementation on images
+    larger than `max_python_pixels`
+    (unless it is the only implementation asked for).
+
+    Args:
+        sizes (list): names from `image_sizes` (default: all)
+        implementations (list): implementations, as passed to get_filter
+        filters (list): filter names
+        warmup (int): untimed calls before measuring
+        repeat (int): timed calls
+        memory (bool): measure peak memory
+        images (dict): extra images to benchmark on, by name
+        max_python_pixels (int): largest image to run python on (None: no limit)
+        verbose (bool): print each result as it is measured
+        layouts (list): 'interleaved' and/or 'planar' (see io.to_planar)
+    Returns:
+        dict: 'machine' info and a list of 'results'
+    """
+    if sizes is None:
+        sizes = list(image_sizes)
+    test_images = {}
+    for size in sizes:
+        width, height = image_sizes[size]
+        test_images[size] = io.random_image(width, height)
+    test_images.update(images or {})
+
+    results = []
+    skipped = []
+    for size, image in test_images.items():
+        height, width = image.shape[:2]
+        for layout in layouts:
+            layout_image = io.to_planar(image) if layout == "planar" else image
+            for filter_name in filters:
+                for implementation in implementations:
+                    if (
+                        implementation == "python"
+                        and len(implementations) > 1
+                        and max_python_pixels is not None
+                        and width * height > max_python_pixels
+                    ):
+                        continue
+                    try:
+                        filter_function = functools.partial(
+                            get_filter(filter_name, implementation), layout=layout
+                        )
+                    except ImportError as e:
+                        skipped.append(implementation)
+                        if verbose and skipped.count(implementation) == 1:
+                            print(f"Skipping {implementation}: {e}", file=sys.stderr)
+                        continue
+                    result = {
+                        "filter": filter_name,
+                        "implementation": implementation,
+                        "layout": layout,
+                        "size": size,
+                        "width": width,
+                        "height": height,
+                        "warmup": warmup,
+                        "repeat": repeat,
+                    }
+                    result.update(
+                        benchmark_filter(
+                            filter_function, layout_image, warmup, repeat, memory
+                        )
+                    )
+                    results.append(result)
+                    if verbose:
+                        print(format_result(result))
+
+    return {"machine": machine_info(), "results": results}
+
+
+def format_result(result: dict) -> str:
+    """One line describing a benchmark result"""
+    layout = " planar" if result.get("layout") == "planar" else ""
+    line = (
+        f"{result['implementation']:>16}{layout} {result['filter']} {result['size']}"
+        f" ({result['width']}x{result['height']}):"
+        f" median {result['median'] * 1e3:.3f}ms, min {result['min'] * 1e3:.3f}ms,"
+        f" p95 {result['p95'] * 1e3:.3f}ms,"
+        f" {result['megapixels_per_second']:.2f} MP/s"
+    )
+    if result.get("peak_memory_bytes") is not None:
+        line += f", peak {result['peak_memory_bytes'] / 2**20:.1f} MiB"
+    return line
+
+
+def write_json(report: dict, filename: str) -> None:
+    """Write a benchmark report (from run_benchmarks) as JSON"""
+    with open(filename, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def write_csv(report: dict, filename: str) -> None:
+    """Write the results of a benchmark report as CSV, one row per result"""
+    with open(filename, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=result_fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(report["results"])
+
+
+def baseline_path(baseline_dir: str = None, fingerprint: str = None) -> Path:
+    """The baseline file for a machine fingerprint (default: this machine)"""
+    if baseline_dir is None:
+        baseline_dir = default_baseline_dir
+    if fingerprint is None:
+        fingerprint = machine_fingerprint()
+    return Path(baseline_dir) / f"baseline-{fingerprint}.json"
+
+
+def save_baseline(report: dict, baseline_dir: str = None) -> Path:
+    """Save a benchmark report as the baseline for the machine it ran on
+
+    Returns:
+        Path: the baseline file
+    """
+    path = baseline_path(baseline_dir, machine_fingerprint(report["machine"]))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    write_json(report, path)
+    return path
+
+
+def load_baseline(baseline_dir: str = None, fingerprint: str = None) -> dict:
+    """Load the baseline report for a machine fingerprint
+
+    Returns:
+        dict: the baseline report, or None if there is none
+    """
+    path = baseline_path(baseline_dir, fingerprint)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _ranks(values: list) -> list:
+    """Ranks (from 1) of values, with ties given their average rank"""
+    order = sorted(range(len(values)), key=lambda i: values[i])
+    ranks = [0.0] * len(values)
+    i = 0
+    while i < len(order):
+        j = i
+        while j + 1 < len(order) and values[order[j + 1]] == values[order[i]]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[order[k]] = (i + j) / 2 + 1
+        i = j + 1
+    return ranks
+
+
+def _exact_u_cdf(u: float, m: int, n: int) -> float:
+    """P(U <= u) for samples of size m and n without ties (exact)"""
+    # counts[k] = number of orderings of m and n values giving U = k,
+    # built up with counts(m, n) = counts(m - 1, n) shifted by n + counts(m, n - 1)
+    table = {}
+
+    def counts(m, n):
+        if (m, n) not in table:
+            if m == 0 or n == 0:
+                table[m, n] = [1]
+            else:
+                a, b = counts(m - 1, n), counts(m, n - 1)
+                c = [0] * (m * n + 1)
+                for k, count in enumerate(a):
+                    c[k + n] += count
+                for k, count in enumerate(b):
+                    c[k] += count
+                table[m, n] = c
+        return table[m, n]
+
+    c = counts(m, n)
+    return sum(c[: int(math.floor(u)) + 1]) / sum(c)
+
+
+def mann_whitney_u(slower: list, faster: list) -> tuple:
+    """One-sided Mann-Whitney U test that `slower` tends to be larger than `faster`
+
+    Uses the exact distribution for small samples without ties,
+    and the normal approximation (with tie correction) otherwise.
+
+    Returns:
+        tuple: (U, p), where U counts the pairs with slower > faster
+            (ties count half) and p is the p-value
+    """
+    m, n = len(slower), len(faster)
+    if m == 0 or n == 0:
+        raise ValueError("Both samples need at least one value")
+    ranks = _ranks(list(slower) + list(faster))
+    u = sum(ranks[:m]) - m * (m + 1) / 2
+    ties = len(set(ranks)) < m + n
+    if not ties and m * n <= 400:
+        # P(U >= u) = P(U' <= m n - u), U' = m n - U has the same distribution
+        return u, _exact_u_cdf(m * n - u, m, n)
+
+    # normal approximation, with tie correction and continuity correction
+    total = m + n
+    tie_sizes = [ranks.count(r) for r in set(ranks)]
+    tie_term = sum(t**3 - t for t in tie_sizes) / (total * (total - 1))
+    variance = m * n / 12 * (total + 1 - tie_term)
+    if variance == 0:
+        return u, 1.0
+    z = (u - m * n / 2 - 0.5) / math.sqrt(variance)
+    return u, 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def _result_key(result: dict) -> tuple:
+    """The key fields of a result, to match it between runs"""
+    return tuple(
+        result.get(field, result_key_defaults.get(field)) for field in result_key_fields
+    )
+
+
+def compare_reports(
+    baseline: dict, report: dict, threshold: float = 0.1, alpha: float = 0.05
+) -> list:
+    """Compare a benchmark report with a baseline report
+
+    Args:
+        baseline (dict): the baseline report
+        report (dict): the new report
+        threshold (float): relative slowdown of the median to flag (0.1 = 10%)
+        alpha (float): significance level of the Mann-Whitney U test
+    Returns:
+        list: a comparison dict for each result in both reports,
+            with the result's key fields, the 'baseline' and 'median' times,
+            the relative 'slowdown', the 'p' value and whether it is a 'regression'
+    """
+    baseline_results = {_result_key(result): result for result in baseline["results"]}
+    comparisons = []
+    for result in report["results"]:
+        key = _result_key(result)
+        if key not in baseline_results:
+            continue
+        old = baseline_results[key]
+        slowdown = result["median"] / old["median"] - 1
+        _, p = mann_whitney_u(result["times"], old["times"])
+        comparison = dict(zip(result_key_fields, key))
+        comparison.update(
+            baseline=old["median"],
+            median=result["median"],
+            slowdown=slowdown,
+            p=p,
+            regression=slowdown > threshold and p < alpha,
+        )
+        comparisons.append(comparison)
+    return comparisons
+
+
+def format_comparison(comparison: dict) -> str:
+    """One line describing a comparison with the baseline"""
+    status = "REGRESSION" if comparison["regression"] else "ok"
+    layout = " planar" if comparison.get("layout") == "planar" else ""
+    return (
+        f"{status:>10} {comparison['implementation']}{layout} {comparison['filter']}"
+        f" {comparison['size']}: {comparison['baseline'] * 1e3:.3f}ms"
+        f" -> {comparison['median'] * 1e3:.3f}ms"
+        f" ({comparison['slowdown']:+.1%}, p={comparison['p']:.3f})"
+    )
+
+
+def main(argv=None):
+    """Parse the command-line and run the benchmarks"""
+    parser = argparse.ArgumentParser(
+        prog="instapy benchmark",
+        description="Benchmark the filter implementations",
+    )
+    parser.add_argument(
+        "--sizes",
+        nargs="*",
+        choices=list(image_sizes),
+        default=list(image_sizes),
+        help="Image sizes to benchmark (default: all)",
+    )
+    parser.add_argument(
+        "--implementations",
+        nargs="+",
+        default=implementations,
+        help="Implementations to benchmark (default: all available)",
+    )
+    parser.add_argument(
+        "--filters", nargs="+", choices=filter_names, default=filter_names
+    )
+    parser.add_argument("--image", nargs="*", default=[], help="Image files to benchmark on too")
+    parser.add_argument(
+        "--layouts",
+        nargs="+",
+        choices=layouts,
+        default=["interleaved"],
+        help="Image memory layouts to benchmark (default: interleaved)",
+    )
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed calls before measuring")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed calls")
+    parser.add_argument("--no-memory", action="store_true", help="Don't measure peak memory")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    parser.add_argument("--csv", help="Write the results to this CSV file")
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Save the results as the baseline for this machine",
+    )
+    parser.add_argument(
+        "--compare",
+        action="store_true",
+        help="Compare with this machine's baseline, exit with status 1 on regressions",
+    )
+    parser.add_argument(
+        "--baseline-dir",
+        default=default_baseline_dir,
+        help=f"Directory of baselines (default: {default_baseline_dir})",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative slowdown counted as a regression (default: 0.1)",
+    )
+    parser.add_argument(
+        "--alpha",
+        type=float,
+        default=0.05,
+        help="Significance level of the regression test (default: 0.05)",
+    )
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        # fail before running the benchmarks if there is nothing to compare with
+        baseline = load_baseline(args.baseline_dir)
+        if baseline is None:
+            path = baseline_path(args.baseline_dir)
+            sys.exit(f"No baseline for this machine at {path}, run with --save-baseline first")
+
+    report = run_benchmarks(
+        sizes=args.sizes,
+        implementations=args.implementations,
+        filters=args.filters,
+        warmup=args.warmup,
+        repeat=args.repeat,
+        memory=not args.no_memory,
+        images={filename: io.read_image(filename) for filename in args.image},
+        layouts=args.layouts,
+    )
+    if args.json:
+        write_json(report, args.json)
+    if args.csv:
+        write_csv(report, args.csv)
+    if args.save_baseline:
+        path = save_baseline(report, args.baseline_dir)
+        print(f"Saved baseline to {path}")
+    if baseline is not None:
+        comparisons = compare_reports(baseline, report, args.threshold, args.alpha)
+        for comparison in comparisons:
+            print(format_comparison(comparison))
+        regressions = [c for c in comparisons if c["regression"]]
+        if regressions:
+            sys.exit(f"{len(regressions)} performance regression(s)")
+    return report
+
+
+if __name__ == "__main__":
+    main()
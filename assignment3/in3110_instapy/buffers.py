@@ -0,0 +1,156 @@
+"""output buffers shared by the filter implementations
+
+Every filter takes an optional `out` array to write the result into,
+so callers filtering many same-size images can reuse one buffer.
+
+The filters also take a stack of same-size images, shape (N, H, W, 3)
+(see `batched`), so many small images can be filtered with one call,
+and planar images, shape (3, H, W), with each channel in its own plane,
+when called with `layout="planar"` (see `planar_views`).
+"""
+from __future__ import annotations
+
+import functools
+
+import numpy as np
+
+
+def output_array(out: np.array, shape: tuple) -> np.array:
+    """Return `out`, or a new uint8 array if `out` is None
+
+    Raises ValueError if `out` doesn't have the right shape and dtype,
+    since the compiled kernels don't check their bounds.
+
+    Args:
+        out (np.array): the output array given by the caller, or None
+        shape (tuple): the shape of the filtered image
+    Returns:
+        np.array: the array to write the filtered image into
+    """
+    if out is None:
+        return np.empty(shape, dtype=np.uint8)
+    if out.shape != tuple(shape):
+        raise ValueError(f"out must have shape {tuple(shape)}, got {out.shape}")
+    if out.dtype != np.uint8:
+        raise ValueError(f"out must have dtype uint8, got {out.dtype}")
+    if not out.flags.writeable:
+        raise ValueError("out must be writeable")
+    return out
+
+
+def sepia_output(image: np.array, out: np.array, inplace: bool) -> np.array:
+    """Return the output array for a sepia filter
+
+    Args:
+        image (np.array): the image to filter
+        out (np.array): the output array given by the caller, or None
+        inplace (bool): write the result into `image` itself
+    Returns:
+        np.array: the array to write the filtered image into
+    """
+    if inplace:
+        if out is not None:
+            raise ValueError("Specify at most one of out and inplace")
+        out = image
+    return output_array(out, image.shape)
+
+
+def _as_rows(array: np.array, name: str) -> np.array:
+    """View a (N, H, W, ...) stack as (N * H, W, ...), without copying"""
+    rows = array.reshape((-1,) + array.shape[2:])
+    if not np.may_share_memory(rows, array):
+        raise ValueError(f"{name} must be contiguous to filter a stack of images")
+    return rows
+
+
+# image memory layouts: interleaved (H, W, 3) and planar (3, H, W)
+layouts = ("interleaved", "planar")
+
+
+def is_planar(image: np.array, layout: str) -> bool:
+    """Whether `layout` is planar, checking that `image` has its shape
+
+    The layout is always given by the caller, since a (3, H, 3) array
+    could be either.
+
+    Raises:
+        ValueError: for unknown layouts, or planar images not of shape (3, H, W)
+    """
+    if layout not in layouts:
+        raise ValueError(f"Unknown {layout=}, must be 'interleaved' or 'planar'")
+    if layout == "planar" and (image.ndim != 3 or image.shape[0] != 3):
+        raise ValueError(f"Planar images must have shape (3, H, W), got {image.shape}")
+    return layout == "planar"
+
+
+def interleaved_view(planes: np.array) -> np.array:
+    """View a planar (3, H, W) array as (H, W, 3), without copying"""
+    return np.moveaxis(planes, 0, -1)
+
+
+def _filter_planes(filter_function, planes, args, kwargs):
+    """Filter a planar image with a filter that only takes interleaved images
+
+    The filter is given interleaved views of the planes (and of `out`).
+    """
+    out = kwargs.get("out")
+    if out is not None and out.ndim == 3:
+        kwargs["out"] = interleaved_view(out)
+    result = filter_function(interleaved_view(planes), *args, **kwargs)
+    if result.ndim == 2:
+        return result
+    if out is not None:
+        return out
+    if kwargs.get("inplace"):
+        return planes
+    return np.ascontiguousarray(np.moveaxis(result, -1, 0))
+
+
+def planar_views(filter_function):
+    """Let a filter without planar kernels take planar images
+
+    Called with `layout="planar"`, the filter is given interleaved views
+    of the planes; otherwise the call is passed through unchanged.
+    get_filter wraps the filters of backends not registered as `planar`
+    (see registry.py), the others take `layout` themselves.
+    """
+
+    @functools.wraps(filter_function)
+    def filter_image(image, *args, layout: str = "interleaved", **kwargs):
+        if is_planar(image, layout):
+            return _filter_planes(filter_function, image, args, kwargs)
+        return filter_function(image, *args, **kwargs)
+
+    return filter_image
+
+
+def batched(filter_function):
+    """Let a filter take a stack of images, shape (N, H, W, 3)
+
+    The filters work pixel by pixel, so the stack is filtered
+    as one tall image of N * H rows, and the result is reshaped back
+    to (N, H, W) or (N, H, W, 3).
+    Single images, shape (H, W, 3), are passed through unchanged.
+
+    `out` (which must be passed by keyword) and `inplace`
+    must be views that can be reshaped without a copy.
+    """
+
+    @functools.wraps(filter_function)
+    def filter_stack(image, *args, **kwargs):
+        if image.ndim != 4:
+            return filter_function(image, *args, **kwargs)
+        if kwargs.get("layout", "interleaved") != "interleaved":
+            raise ValueError("Stacks of planar images aren't supported")
+        n, height = image.shape[:2]
+        if kwargs.get("inplace"):
+            rows = _as_rows(image, "image")
+        else:
+            # a copy is fine when the result doesn't go into `image`
+            rows = image.reshape((n * height,) + image.shape[2:])
+        if kwargs.get("out") is not None:
+            kwargs["out"] = _as_rows(kwargs["out"], "out")
+        result = filter_function(rows, *args, **kwargs)
+        return result.reshape((n, height) + result.shape[1:])
+
+    return filter_stack
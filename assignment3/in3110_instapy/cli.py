@@ -2,13 +2,13 @@
 from __future__ import annotations
 
 import argparse
+import os
 import sys
+import time
 
 import in3110_instapy as ins
-import numpy as np
-from PIL import Image
 
-from . import io
+from .profiling import format_stage_timings, stage_timer
 
 
 def run_filter(
@@ -16,27 +16,389 @@ def run_filter(
     out_file: str = None,
     implementation: str = "python",
     filter: str = "color2gray",
-    scale: int = 1,
-) -> None:
-    """Run the selected filter"""
-    # load the image from a file
-    image = Image.open(file)
-    if scale != 1:
-        # Resize image, if needed
-        image = image.resize((image.width // int(scale), image.height // int(scale)))
-
-
-    # Apply the filter
-    image = np.asarray(image)
-    filter = ins.get_filter(filter, implementation)
-    filtered = filter(image)
-
-    if out_file:
-        io.write_image(filtered, out_file)
-        # save the file
+    scale: float = 1,
+    workers: int = None,
+    stream: bool = False,
+    memory_budget: int = None,
+    profile: bool = False,
+    fast_gray: bool = False,
+    encoder_options: dict = None,
+) -> dict | None:
+    """Run the selected filter
+
+    If `workers` is given, the filter runs on that many cores.
+    If `stream` is True, the image is filtered in strips of rows
+    using at most `memory_budget` bytes per strip (see io.stream_filter).
+    Every frame of animated images (GIF, APNG, TIFF) is filtered
+    (see frames.filter_animation).
+    If `profile` is True, the time of each stage (decode, resize, filter, encode)
+    is printed to stderr as a line of JSON, and returned (otherwise None is returned).
+    If `fast_gray` is True and the filter is color2gray, the image is decoded
+    straight to gray (luma, with slightly different weights) instead of filtered
+    (see io.decode_image).
+    `encoder_options` (quality, optimize, progressive, compress_level)
+    are passed to io.write_image.
+    """
+    # imported here, so `instapy --help` doesn't import numpy
+    from . import frames, io
+    from .resize import resize_area
+
+    timings = {} if profile else None
+    # 'auto' picks the implementation for each image, and runs it on `workers` cores
+    if workers and implementation != "auto" and not implementation.startswith("parallel-"):
+        implementation = f"parallel-{implementation}"
+    filter_name = filter
+    with stage_timer(timings, "import"):
+        filter = ins.get_filter(filter_name, implementation, workers=workers)
+
+    if stream:
+        if not out_file:
+            raise ValueError("Streaming needs an output file")
+        if scale != 1:
+            raise ValueError("Streaming doesn't support scaling")
+        # decoding, filtering and encoding are interleaved
+        with stage_timer(timings, "stream"):
+            io.stream_filter(
+                filter,
+                file,
+                out_file,
+                gray=filter_name == "color2gray",
+                memory_budget=memory_budget,
+            )
+    elif out_file and frames.is_animated(file):
+        if scale != 1:
+            raise ValueError("Scaling animated images isn't supported")
+        # decoding, filtering and encoding of the frames overlap
+        with stage_timer(timings, "frames"):
+            frames.filter_animation(filter, file, out_file, gray=filter_name == "color2gray")
     else:
-        # not asked to save, display it instead
-        io.display(filtered)
+        # decoding to gray is the filter
+        gray = fast_gray and filter_name == "color2gray"
+        # load the image from a file, decoded at reduced size if downscaling
+        with stage_timer(timings, "decode"):
+            image, size = io.decode_image(file, scale=scale, gray=gray)
+        if scale != 1:
+            with stage_timer(timings, "resize"):
+                image = resize_area(image, size)
+
+        if gray:
+            filtered = image
+        else:
+            # gray files are decoded to one channel
+            io.check_rgb(image, file)
+            # Apply the filter
+            with stage_timer(timings, "filter"):
+                filtered = filter(image)
+
+        if out_file:
+            # save the file, gray images go to the encoder as they are
+            with stage_timer(timings, "encode"):
+                io.write_image(filtered, out_file, **(encoder_options or {}))
+        else:
+            # not asked to save, display it instead
+            with stage_timer(timings, "display"):
+                io.display(filtered)
+
+    if profile:
+        print(
+            format_stage_timings(
+                timings, file=str(file), implementation=implementation, filter=filter_name
+            ),
+            file=sys.stderr,
+        )
+        return timings
+
+
+def run_warmup(cache_dir: str = None) -> float:
+    """Compile the numba kernels for all supported signatures
+
+    The compiled kernels are stored in numba's on-disk cache,
+    so later processes load them instead of compiling.
+
+    Args:
+        cache_dir (str): directory for the numba cache
+            (default: next to the installed package, or $NUMBA_CACHE_DIR)
+    Returns:
+        float: the time (in seconds) it took
+    """
+    if cache_dir:
+        # must be set before numba is imported
+        os.environ["NUMBA_CACHE_DIR"] = cache_dir
+
+    start = time.perf_counter()
+    from . import io, numba_filters
+
+    # the interleaved and planar kernels
+    n_signatures = numba_filters.compile_kernels()
+    # run them once to check they work
+    image = io.random_image(8, 8)
+    numba_filters.numba_color2gray(image)
+    numba_filters.numba_color2sepia(image)
+    elapsed = time.perf_counter() - start
+
+    print(f"Compiled {n_signatures} numba kernel signatures in {elapsed:.2f}s")
+    return elapsed
+
+
+def warmup_main(argv=None):
+    """Parse the command-line for `instapy warmup` and call run_warmup"""
+    parser = argparse.ArgumentParser(
+        prog="instapy warmup",
+        description="Precompile the numba kernels into the on-disk cache",
+    )
+    parser.add_argument("--cache-dir", help="Directory for the numba cache")
+    args = parser.parse_args(argv)
+    run_warmup(args.cache_dir)
+
+
+def add_encoder_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the options of the output encoder and of fast gray decoding"""
+    parser.add_argument(
+        "--quality", type=int, help="JPEG/WebP quality, 1-95 (default: 75)"
+    )
+    parser.add_argument(
+        "--optimize",
+        help="Optimize the JPEG/PNG encoding (smaller files, slower to write)",
+        action="store_true",
+    )
+    parser.add_argument("--progressive", help="Write progressive JPEGs", action="store_true")
+    parser.add_argument(
+        "--compress-level",
+        type=int,
+        choices=range(10),
+        metavar="0-9",
+        help="PNG compression level (lower is faster, default: 6)",
+    )
+    parser.add_argument(
+        "--fast-gray",
+        help="Decode straight to gray instead of filtering"
+        " (faster, but uses the luma weights 0.299, 0.587, 0.114)",
+        action="store_true",
+    )
+
+
+def encoder_options(args: argparse.Namespace) -> dict:
+    """The io.write_image options from parsed arguments"""
+    return {
+        "quality": args.quality,
+        "optimize": args.optimize,
+        "progressive": args.progressive,
+        "compress_level": args.compress_level,
+    }
+
+
+def batch_main(argv=None):
+    """Parse the command-line for `instapy batch` and call run_batch"""
+    from .batch import run_batch
+
+    parser = argparse.ArgumentParser(
+        prog="instapy batch",
+        description="Filter every image in a directory (or matching a glob)",
+    )
+    parser.add_argument("source", help="Directory or glob pattern of images to filter")
+    parser.add_argument("out_dir", help="Directory to write the filtered images to")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("-g", "--gray", help="Select gray filter", action="store_true")
+    group.add_argument("-se", "--sepia", help="Select sepia filter", action="store_true")
+    parser.add_argument("-sc", "--scale", type=float, default=1, help="Scale factor to downscale images by")
+    parser.add_argument(
+        "-i",
+        "--implementation",
+        default="numpy",
+        help="The implementation (default: numpy)",
+        choices=["python", "numpy", "numba", "integer", "lut", "cython", "auto"],
+    )
+    parser.add_argument(
+        "-j",
+        "--processes",
+        type=int,
+        help="Number of worker processes (default: number of cpus)",
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        help="Filter images even if the output is up to date",
+        action="store_true",
+    )
+    add_encoder_arguments(parser)
+    args = parser.parse_args(argv)
+
+    stats = run_batch(
+        args.source,
+        args.out_dir,
+        implementation=args.implementation,
+        filter="color2sepia" if args.sepia else "color2gray",
+        scale=args.scale,
+        processes=args.processes,
+        force=args.force,
+        fast_gray=args.fast_gray,
+        encoder_options=encoder_options(args),
+    )
+    for file, error in stats["errors"]:
+        print(f"Failed to filter {file}: {error}", file=sys.stderr)
+    print(
+        f"Filtered {stats['filtered']} images ({stats['skipped']} up to date)"
+        f" in {stats['seconds']:.2f}s: {stats['images_per_second']:.1f} images/s"
+    )
+    if stats["failed"]:
+        sys.exit(f"{stats['failed']} image(s) failed")
+
+
+def rawvideo_main(argv=None):
+    """Parse the command-line for `instapy rawvideo` and filter stdin to stdout"""
+    from .frames import default_prefetch, filter_raw_stream
+
+    parser = argparse.ArgumentParser(
+        prog="instapy rawvideo",
+        description="Filter raw rgb24 video frames from stdin to stdout"
+        " (ffmpeg -f rawvideo -pix_fmt rgb24)",
+    )
+    parser.add_argument("--width", type=int, required=True, help="Frame width")
+    parser.add_argument("--height", type=int, required=True, help="Frame height")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("-g", "--gray", help="Select gray filter", action="store_true")
+    group.add_argument("-se", "--sepia", help="Select sepia filter", action="store_true")
+    parser.add_argument(
+        "-i",
+        "--implementation",
+        default="numpy",
+        help="The implementation (default: numpy)",
+    )
+    parser.add_argument(
+        "--pix-fmt",
+        choices=["rgb24", "gray"],
+        help="Pixel format of the output (default: gray for the gray filter, else rgb24)",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=default_prefetch,
+        help=f"Frames to decode ahead of the filter (default: {default_prefetch})",
+    )
+    args = parser.parse_args(argv)
+
+    filter_name = "color2sepia" if args.sepia else "color2gray"
+    if args.sepia and args.pix_fmt == "gray":
+        parser.error("sepia frames can't be written as gray")
+    count = filter_raw_stream(
+        ins.get_filter(filter_name, args.implementation),
+        args.width,
+        args.height,
+        gray=filter_name == "color2gray",
+        rgb_output=args.pix_fmt == "rgb24",
+        prefetch=args.prefetch,
+    )
+    print(f"Filtered {count} frames", file=sys.stderr)
+
+
+def serve_main(argv=None):
+    """Parse the command-line for `instapy serve` and run the HTTP service"""
+    from .server import serve
+
+    parser = argparse.ArgumentParser(
+        prog="instapy serve",
+        description="Serve the filters over HTTP (POST an image to /color2gray or /color2sepia)",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000)")
+    parser.add_argument(
+        "-i",
+        "--implementation",
+        default="numpy",
+        help="The default implementation (default: numpy)",
+    )
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=64,
+        help="Requests handled at a time, more are rejected with 503 (default: 64)",
+    )
+    parser.add_argument(
+        "--max-batch",
+        type=int,
+        default=16,
+        help="Most same-size images filtered in one call (default: 16)",
+    )
+    parser.add_argument(
+        "--batch-delay",
+        type=float,
+        default=2,
+        help="Milliseconds to wait for more same-size images (default: 2)",
+    )
+    parser.add_argument(
+        "--max-body",
+        type=float,
+        default=64,
+        help="Largest upload accepted, in MiB (default: 64)",
+    )
+    parser.add_argument("--threads", type=int, help="Threads for decoding, filtering and encoding")
+    args = parser.parse_args(argv)
+
+    serve(
+        args.host,
+        args.port,
+        implementation=args.implementation,
+        max_pending=args.max_pending,
+        max_batch=args.max_batch,
+        batch_delay=args.batch_delay / 1000,
+        max_body_bytes=int(args.max_body * 2**20),
+        threads=args.threads,
+    )
+
+
+def calibrate_main(argv=None):
+    """Parse the command-line for `instapy calibrate` and calibrate 'auto'"""
+    from . import registry
+
+    parser = argparse.ArgumentParser(
+        prog="instapy calibrate",
+        description="Time the available implementations, to pick the fastest with '-i auto'",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Timed calls per implementation and size")
+    args = parser.parse_args(argv)
+
+    calibration = registry.calibrate(repeat=args.repeat)
+    for filter_name, by_size in calibration["seconds"].items():
+        for pixels, seconds in by_size.items():
+            fastest = min(seconds, key=seconds.get)
+            print(f"{filter_name} {int(pixels):,} pixels: {fastest} ({seconds[fastest] * 1e3:.3f}ms)")
+    print(f"Saved calibration to {registry.calibration_path()}")
+
+
+def benchmark_main(argv=None):
+    """Parse the command-line for `instapy benchmark` and run the benchmarks"""
+    from .benchmark import main
+
+    main(argv)
+
+
+# subcommands, selected by the first argument
+subcommands = {
+    "warmup": warmup_main,
+    "batch": batch_main,
+    "benchmark": benchmark_main,
+    "calibrate": calibrate_main,
+    "rawvideo": rawvideo_main,
+    "serve": serve_main,
+}
+
+# listed in `instapy --help`, since subcommands are dispatched before argparse
+subcommand_descriptions = {
+    "warmup": "precompile the numba kernels into the on-disk cache",
+    "batch": "filter every image in a directory (or matching a glob)",
+    "benchmark": "benchmark the filter implementations",
+    "calibrate": "time the available implementations, for '-i auto'",
+    "rawvideo": "filter raw rgb24 video frames from stdin to stdout",
+    "serve": "serve the filters over HTTP",
+}
+
+
+def subcommands_epilog() -> str:
+    """The list of subcommands, for the epilog of `instapy --help`"""
+    lines = ["subcommands (run `instapy <subcommand> --help` for their options):"]
+    for name in subcommands:
+        lines.append(f"  {name:<12}{subcommand_descriptions[name]}")
+    return "\n".join(lines)
 
 
 def main(argv=None):
@@ -44,7 +406,14 @@ def main(argv=None):
     if argv is None:
         argv = sys.argv[1:]
 
-    parser = argparse.ArgumentParser()
+    if argv and argv[0] in subcommands:
+        return subcommands[argv[0]](argv[1:])
+
+    parser = argparse.ArgumentParser(
+        prog="instapy",
+        epilog=subcommands_epilog(),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
 
     # filename is positional and required
     parser.add_argument("file", help="The filename to apply filter to")
@@ -53,11 +422,41 @@ def main(argv=None):
     group = parser.add_mutually_exclusive_group()
     group.add_argument("-g", "--gray", help="Select gray filter", action="store_true")
     group.add_argument("-se", "--sepia", help="Select sepia filter", action="store_true")
-    parser.add_argument("-sc", "--scale", help="Scale factor to resize image")
-    parser.add_argument("-i ", "--implementation", help="The implementation", choices={"python", "numpy", "numba"})
+    parser.add_argument("-sc", "--scale", type=float, help="Scale factor to downscale image by")
+    implementations = ["python", "numpy", "numba", "integer", "lut", "cython"]
+    parser.add_argument(
+        "-i",
+        "--implementation",
+        help="The implementation",
+        choices=implementations + [f"parallel-{name}" for name in implementations] + ["auto"],
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="Number of cores to run the filter on "
+        "(default: all cores for parallel- implementations, otherwise 1)",
+    )
+
+    parser.add_argument(
+        "--stream",
+        help="Filter the image in strips, to limit memory use",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=float,
+        help="Memory to use per strip when streaming, in MiB (default: 256)",
+    )
+    parser.add_argument(
+        "--profile",
+        help="Print the time of each stage (decode, resize, filter, encode) as JSON to stderr",
+        action="store_true",
+    )
+    add_encoder_arguments(parser)
 
     # parse arguments and call run_filter
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     if not args.scale:
         args.scale = 1
@@ -70,6 +469,18 @@ def main(argv=None):
     else:
         args.filter = "color2gray"
         
-    run_filter(args.file, args.implementation, args.filter, args.scale, args.out)
+    run_filter(
+        args.file,
+        out_file=args.out,
+        implementation=args.implementation,
+        filter=args.filter,
+        scale=args.scale,
+        workers=args.workers,
+        stream=args.stream,
+        memory_budget=int(args.memory_budget * 2**20) if args.memory_budget else None,
+        profile=args.profile,
+        fast_gray=args.fast_gray,
+        encoder_options=encoder_options(args),
+    )
 
 
@@ -1,37 +1,101 @@
-"""Cython implementation of filter functions"""
+"""Cython implementation of filter functions
+
+Compiled ahead of time by setup.py, so there is no JIT warm-up.
+The loops use typed memoryviews, run without the GIL,
+and split the rows between OpenMP threads with prange.
+"""
 from __future__ import annotations
 
 import cython as C
-import numpy as np
-from cython.cimports.libc.stdint import uint8_t
 
 if not C.compiled:
     raise ImportError(
         "Cython module not compiled! Check setup.py and make sure this package has been installed, not just imported in-place."
     )
 
+import numpy as np
+from cython.cimports.libc.stdint import uint8_t
+from cython.parallel import prange
+
+from .buffers import batched, output_array, sepia_output
+
 # we may need a 'const uint8_t' type to make sure we accept 'read-only' arrays
 const_uint8_t = C.typedef("const uint8_t")
 float64_t = C.typedef(C.double)
 
 
-def cython_color2gray(image):
+@batched
+@C.boundscheck(False)
+@C.wraparound(False)
+def cython_color2gray(image: const_uint8_t[:, :, :], out=None):
     """Convert rgb pixel array to grayscale
 
     Args:
         image (np.array)
+        out (np.array): array to write the result into (optional)
     Returns:
         np.array: gray_image
     """
-    ...
+    height: C.Py_ssize_t = image.shape[0]
+    width: C.Py_ssize_t = image.shape[1]
+    i: C.Py_ssize_t
+    j: C.Py_ssize_t
+
+    gray_image = output_array(out, (height, width))
+    gray: uint8_t[:, :] = gray_image
 
+    for i in prange(height, nogil=True):
+        for j in range(width):
+            gray[i, j] = C.cast(
+                uint8_t,
+                0.21 * image[i, j, 0] + 0.72 * image[i, j, 1] + 0.07 * image[i, j, 2],
+            )
 
-def cython_color2sepia(image):
+    return gray_image
+
+
+@batched
+@C.boundscheck(False)
+@C.wraparound(False)
+def cython_color2sepia(image, out=None, inplace: C.bint = False):
     """Convert rgb pixel array to sepia
 
     Args:
         image (np.array)
+        out (np.array): array to write the result into (optional)
+        inplace (bool): write the result into `image` (optional)
     Returns:
-        np.array: gray_image
+        np.array: sepia_image
     """
-    ...
+    sepia_image = sepia_output(image, out, inplace)
+    # each pixel is read before it is written, so `sepia` may alias `rgb`
+    rgb: const_uint8_t[:, :, :] = image
+    sepia: uint8_t[:, :, :] = sepia_image
+
+    height: C.Py_ssize_t = rgb.shape[0]
+    width: C.Py_ssize_t = rgb.shape[1]
+    y: C.Py_ssize_t
+    x: C.Py_ssize_t
+    r: float64_t
+    g: float64_t
+    b: float64_t
+    red: float64_t
+    green: float64_t
+    blue: float64_t
+
+    for y in prange(height, nogil=True):
+        for x in range(width):
+            r = rgb[y, x, 0]
+            g = rgb[y, x, 1]
+            b = rgb[y, x, 2]
+
+            red = r * 0.393 + g * 0.769 + b * 0.189
+            green = r * 0.349 + g * 0.686 + b * 0.168
+            blue = r * 0.272 + g * 0.534 + b * 0.131
+
+            # clip before casting, so values above 255 don't wrap around
+            sepia[y, x, 0] = C.cast(uint8_t, min(255.0, red))
+            sepia[y, x, 1] = C.cast(uint8_t, min(255.0, green))
+            sepia[y, x, 2] = C.cast(uint8_t, min(255.0, blue))
+
+    return sepia_image
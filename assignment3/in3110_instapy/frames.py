@@ -0,0 +1,292 @@
+"""filtering sequences of frames
+
+Animated images (GIF, APNG, multi-page TIFF) and raw video streams
+(rgb24 frames, as read and written by ffmpeg's `rawvideo` format)
+are filtered a frame at a time.
+
+Decoding, filtering and encoding run at the same time:
+a decoder thread reads frames into a bounded queue,
+the calling thread filters them, and an encoder thread writes them.
+The frames are read into and filtered into a fixed set of buffers,
+which are reused once a frame has been written,
+so a long stream doesn't allocate memory for every frame
+(only when the frame size changes, e.g. in a multi-page TIFF).
+
+For example, to filter a video with ffmpeg:
+
+    ffmpeg -i in.mp4 -f rawvideo -pix_fmt rgb24 - \\
+        | instapy rawvideo --width 1920 --height 1080 --sepia -i numba \\
+        | ffmpeg -f rawvideo -pix_fmt rgb24 -s 1920x1080 -r 30 -i - out.mp4
+"""
+from __future__ import annotations
+
+import queue
+import sys
+import threading
+from typing import Callable
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+# number of frames decoded ahead of (and waiting to be encoded behind) the filter
+default_prefetch = 2
+
+
+def filter_frames(
+    read_frame: Callable,
+    filter_function: Callable,
+    write_frame: Callable,
+    in_shape: tuple,
+    out_shape: tuple,
+    prefetch: int = default_prefetch,
+) -> int:
+    """Filter frames with decoding, filtering and encoding overlapping
+
+    Frames are read into, and filtered into, `prefetch + 1` reused buffers each.
+    If a filter function raises, the decoder and encoder threads are stopped
+    before the error is re-raised.
+
+    Args:
+        read_frame (callable): read_frame(buffer) reads the next frame and
+            returns (frame, info), where `frame` is usually `buffer`,
+            or a new array if the frame has another shape;
+            or returns None at the end
+        filter_function (callable): filter_function(frame, out=buffer)
+        write_frame (callable): write_frame(buffer, info) writes a filtered frame,
+            the buffer is reused once it returns
+        in_shape (tuple): the shape of the first frame
+        out_shape (tuple): the shape of the first filtered frame
+            (later frames keep its number of channels)
+        prefetch (int): the number of frames that can wait
+            to be filtered, and to be written
+    Returns:
+        int: the number of frames filtered
+    """
+    prefetch = max(1, prefetch)
+    free_in = queue.Queue()
+    free_out = queue.Queue()
+    for _ in range(prefetch + 1):
+        free_in.put(np.empty(in_shape, dtype=np.uint8))
+        free_out.put(np.empty(out_shape, dtype=np.uint8))
+    decoded = queue.Queue(maxsize=prefetch)
+    filtered = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    errors = []
+
+    def decode():
+        try:
+            while not stop.is_set():
+                buffer = free_in.get()
+                if stop.is_set():
+                    break
+                item = read_frame(buffer)
+                if item is None:
+                    break
+                decoded.put(item)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            decoded.put(None)
+
+    def encode():
+        while True:
+            item = filtered.get()
+            if item is None:
+                return
+            buffer, info = item
+            if not errors:
+                try:
+                    write_frame(buffer, info)
+                except BaseException as e:
+                    errors.append(e)
+                    stop.set()
+            # always hand the buffer back, so the filter loop can't block
+            free_out.put(buffer)
+
+    decoder = threading.Thread(target=decode, daemon=True)
+    encoder = threading.Thread(target=encode, daemon=True)
+    decoder.start()
+    encoder.start()
+
+    count = 0
+    finished = False
+    try:
+        while not stop.is_set():
+            item = decoded.get()
+            if item is None:
+                finished = True
+                break
+            frame, info = item
+            out = free_out.get()
+            if out.shape[:2] != frame.shape[:2]:
+                # the frame size changed, the old buffers are dropped as they come back
+                out = np.empty(frame.shape[:2] + out.shape[2:], dtype=out.dtype)
+            filter_function(frame, out=out)
+            free_in.put(frame)
+            filtered.put((out, info))
+            count += 1
+    finally:
+        stop.set()
+        filtered.put(None)
+        encoder.join()
+        # let the decoder see `stop`, if it is waiting for a buffer,
+        # and drain the frames it decoded ahead until it has finished,
+        # so it can't block on the full queue
+        free_in.put_nowait(np.empty(in_shape, dtype=np.uint8))
+        if not finished:
+            while decoded.get() is not None:
+                pass
+        decoder.join()
+    if errors:
+        raise errors[0]
+    return count
+
+
+def output_shape(shape: tuple, gray: bool) -> tuple:
+    """The shape of filtered frames of `shape`"""
+    return shape[:2] if gray else shape
+
+
+def _filter_to_rgb(filter_function: Callable) -> Callable:
+    """Wrap a gray filter to write all three channels of an rgb `out`"""
+
+    def filter_rgb(frame, out):
+        filter_function(frame, out=out[..., 0])
+        out[..., 1] = out[..., 0]
+        out[..., 2] = out[..., 0]
+        return out
+
+    return filter_rgb
+
+
+def read_exactly(stream, buffer: np.array) -> bool:
+    """Fill `buffer` from a binary stream
+
+    Returns:
+        bool: True if it was filled, False at the end of the stream
+    Raises:
+        ValueError: if the stream ends in the middle of the buffer
+    """
+    view = memoryview(buffer).cast("B")
+    filled = 0
+    while filled < len(view):
+        n = stream.readinto(view[filled:])
+        if not n:
+            if filled == 0:
+                return False
+            raise ValueError(f"Stream ended in the middle of a frame ({filled}/{len(view)} bytes)")
+        filled += n
+    return True
+
+
+def filter_raw_stream(
+    filter_function: Callable,
+    width: int,
+    height: int,
+    input=None,
+    output=None,
+    gray: bool = False,
+    rgb_output: bool = False,
+    prefetch: int = default_prefetch,
+) -> int:
+    """Filter a stream of raw rgb24 frames (e.g. ffmpeg's `-f rawvideo -pix_fmt rgb24`)
+
+    Args:
+        filter_function (callable): the filter, which must accept an `out` array
+        width, height (int): the frame size
+        input: binary stream to read frames from (default: stdin)
+        output: binary stream to write filtered frames to (default: stdout)
+        gray (bool): whether the filter returns a single channel
+        rgb_output (bool): write gray frames as rgb24 instead of gray (one byte per pixel)
+        prefetch (int): frames to decode ahead / encode behind the filter
+    Returns:
+        int: the number of frames filtered
+    """
+    if input is None:
+        input = sys.stdin.buffer
+    if output is None:
+        output = sys.stdout.buffer
+    in_shape = (height, width, 3)
+    out_shape = output_shape(in_shape, gray and not rgb_output)
+    if gray and rgb_output:
+        filter_function = _filter_to_rgb(filter_function)
+
+    def read_frame(buffer):
+        return (buffer, {}) if read_exactly(input, buffer) else None
+
+    def write_frame(buffer, info):
+        output.write(memoryview(buffer).cast("B"))
+
+    count = filter_frames(read_frame, filter_function, write_frame, in_shape, out_shape, prefetch)
+    output.flush()
+    return count
+
+
+def is_animated(filename: str) -> bool:
+    """Whether an image file has more than one frame"""
+    with Image.open(filename) as image:
+        return getattr(image, "n_frames", 1) > 1
+
+
+def filter_animation(
+    filter_function: Callable,
+    filename: str,
+    out_file: str,
+    gray: bool = False,
+    prefetch: int = default_prefetch,
+) -> int:
+    """Filter every frame of an animated GIF, APNG or multi-page TIFF
+
+    The frame durations and loop count are kept.
+    The filtered frames are held until all are written,
+    since the encoders need all frames at once.
+    Frames can have different sizes (e.g. the pages of a TIFF).
+
+    Args:
+        filter_function (callable): the filter, which must accept an `out` array
+        filename (str): the image file to filter
+        out_file (str): the file to write the filtered frames to
+        gray (bool): whether the filter returns a single channel
+        prefetch (int): frames to decode ahead of the filter
+    Returns:
+        int: the number of frames filtered
+    """
+    image = Image.open(filename)
+    in_shape = (image.height, image.width, 3)
+    frames = ImageSequence.Iterator(image)
+    filtered = []
+    durations = []
+
+    def read_frame(buffer):
+        frame = next(frames, None)
+        if frame is None:
+            return None
+        array = np.asarray(frame.convert("RGB"))
+        if buffer.shape != array.shape:
+            buffer = np.empty_like(array)
+        np.copyto(buffer, array)
+        return buffer, {"duration": frame.info.get("duration")}
+
+    def write_frame(buffer, info):
+        # fromarray shares the buffer's memory, which is about to be reused
+        filtered.append(Image.fromarray(buffer).copy())
+        durations.append(info["duration"])
+
+    with image:
+        loop = image.info.get("loop")
+        count = filter_frames(
+            read_frame,
+            filter_function,
+            write_frame,
+            in_shape,
+            output_shape(in_shape, gray),
+            prefetch,
+        )
+
+    options = {"save_all": True, "append_images": filtered[1:]}
+    if all(duration is not None for duration in durations):
+        options["duration"] = durations
+    if loop is not None:
+        options["loop"] = loop
+    filtered[0].save(out_file, **options)
+    return count
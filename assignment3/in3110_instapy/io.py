@@ -5,18 +5,143 @@ as numpy arrays
 """
 from __future__ import annotations
 
+import mmap
+import sys
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from pathlib import Path
+
 import numpy as np
 from PIL import Image
 
+from .buffers import interleaved_view, is_planar  # noqa: F401 (re-exported)
+
+# default memory budget for streaming (bytes)
+default_memory_budget = 256 * 1024 * 1024
+# estimated working memory per pixel of a strip:
+# input and output, plus the float64 temporaries of the numpy filters
+streaming_bytes_per_pixel = 64
+# formats that can be written a strip at a time, by file suffix
+streamable_suffixes = {".npy", ".ppm", ".pgm"}
+
+
+def decode_image(filename: str, scale: float = 1, gray: bool = False) -> tuple:
+    """Decode an image file, at reduced size if it will be downscaled
+
+    JPEG images are decoded at the smallest of 1/2, 1/4 or 1/8 scale
+    that is at least the downscaled size (PIL's draft mode),
+    which is much faster than decoding the whole image.
+
+    With `gray=True` the image is decoded to one channel of luma.
+    JPEG images store luma separately, so the color channels
+    are then not decoded at all. The luma weights (0.299, 0.587, 0.114)
+    are not color2gray's (0.21, 0.72, 0.07), so this is opt-in.
+
+    Returns:
+        tuple: (image, size), the decoded rgb array (gray for gray files)
+            and the (width, height) to downscale it to
+    """
+    image = Image.open(filename)
+    mode = "L" if gray else "RGB"
+    size = image.size
+    if scale != 1:
+        from .resize import scaled_size
+
+        size = scaled_size(image.width, image.height, scale)
+    # only changes JPEG decoding
+    image.draft(mode, size)
+    if image.mode not in (mode, "L"):
+        # e.g. palette or alpha images (gray images stay gray)
+        image = image.convert(mode)
+    # shares the decoded bytes, without another copy
+    return np.asarray(image), size
+
+
+def read_image(filename: str, scale: float = 1, gray: bool = False) -> np.array:
+    """Read an image file to an rgb array
+
+    If `scale` is given, the image is downscaled by that factor.
+    JPEG images are then decoded at reduced size (see decode_image).
+    If `gray` is True, the image is read as a gray (H, W) array of luma.
+    """
+    image, size = decode_image(filename, scale, gray)
+    if scale == 1:
+        return image
+
+    from .resize import resize_area
+
+    return resize_area(image, size)
+
+
+def to_pil_image(array: np.array, layout: str = "interleaved") -> Image.Image:
+    """A PIL image of an array, sharing its memory when it is contiguous
+
+    uint8 gray arrays, shape (H, W) or (H, W, 1), become 'L' images directly,
+    and planar arrays (`layout="planar"`) are converted to interleaved.
+    Other arrays (e.g. RGBA or uint16) are left to Image.fromarray.
+    """
+    if is_planar(array, layout):
+        array = from_planar(array)
+    if array.ndim == 3 and array.shape[2] == 1:
+        array = array[:, :, 0]
+    if (
+        array.dtype == np.uint8
+        and array.flags.c_contiguous
+        and (array.ndim == 2 or (array.ndim == 3 and array.shape[2] == 3))
+    ):
+        mode = "L" if array.ndim == 2 else "RGB"
+        height, width = array.shape[:2]
+        return Image.frombuffer(mode, (width, height), array, "raw", mode, 0, 1)
+    return Image.fromarray(array)
+
+
+def write_image(
+    array: np.array,
+    filename,
+    format: str = None,
+    quality: int = None,
+    optimize: bool = False,
+    progressive: bool = False,
+    compress_level: int = None,
+    layout: str = "interleaved",
+) -> None:
+    """Write a numpy pixel array to a file
 
-def read_image(filename: str) -> np.array:
-    """Read an image file to an rgb array"""
-    return np.asarray(Image.open(filename))
+    The encoder options are only passed to PIL when given,
+    and formats that don't use an option ignore it.
 
+    Args:
+        array (np.array): an rgb, gray or planar image
+        filename: the file name, or a binary file object (with `format`)
+        format (str): the image format (default: from the file suffix)
+        quality (int): JPEG/WebP quality, 1-95 (PIL's default is 75)
+        optimize (bool): optimize JPEG Huffman tables or PNG encoding (slower to encode)
+        progressive (bool): write a progressive JPEG
+        compress_level (int): PNG zlib level, 0-9 (lower is faster, PIL's default is 6)
+        layout (str): 'interleaved', or 'planar' for a (3, H, W) image
+    """
+    options = {}
+    if quality is not None:
+        options["quality"] = quality
+    if optimize:
+        options["optimize"] = True
+    if progressive:
+        options["progressive"] = True
+    if compress_level is not None:
+        options["compress_level"] = compress_level
+    return to_pil_image(array, layout).save(filename, format=format, **options)
 
-def write_image(array: np.array, filename: str) -> None:
-    """Write a numpy pixel array to a file"""
-    return Image.fromarray(array).save(filename)
+
+def check_rgb(image: np.array, filename: str = "The image") -> None:
+    """Raise ValueError unless `image` has 3 channels, shape (H, W, 3)
+
+    Gray files are decoded (and memory-mapped) with one channel,
+    which the color filters can't take.
+    """
+    if image.ndim != 3 or image.shape[2] != 3:
+        raise ValueError(
+            f"{filename} has shape {image.shape}, the filters need an rgb image (H, W, 3)"
+        )
 
 
 def random_image(width: int = 320, height: int = 180) -> np.array:
@@ -24,6 +149,330 @@ def random_image(width: int = 320, height: int = 180) -> np.array:
     return np.random.randint(0, 255, size=(height, width, 3), dtype=np.uint8)
 
 
+def to_planar(image: np.array, out: np.array = None) -> np.array:
+    """Copy an interleaved (H, W, 3) image to planar layout, shape (3, H, W)
+
+    Each channel is a contiguous plane, which the filters
+    with planar kernels (numpy, numba) can vectorize.
+    Pass `layout="planar"` to the filters along with the planes.
+
+    Args:
+        image (np.array): the interleaved image
+        out (np.array): a (3, H, W) array to write the planes into (optional)
+    Returns:
+        np.array: the planes
+    """
+    if out is None:
+        out = np.empty((3,) + image.shape[:2], dtype=image.dtype)
+    np.copyto(interleaved_view(out), image)
+    return out
+
+
+def from_planar(planes: np.array, out: np.array = None) -> np.array:
+    """Copy a planar (3, H, W) image back to interleaved layout, shape (H, W, 3)
+
+    Args:
+        planes (np.array): the planar image
+        out (np.array): a (H, W, 3) array to write the image into (optional)
+    Returns:
+        np.array: the interleaved image
+    """
+    if out is None:
+        out = np.empty(planes.shape[1:] + (3,), dtype=planes.dtype)
+    np.copyto(out, interleaved_view(planes))
+    return out
+
+
 def display(array: np.array):
     """Show an image array on the screen"""
     Image.fromarray(array).show()
+
+
+def _close_shared(shm: shared_memory.SharedMemory) -> None:
+    """Close a shared memory segment, if no arrays still use it
+
+    If arrays still use it, it stays mapped until they are garbage-collected.
+    """
+    try:
+        shm.close()
+    except BufferError:
+        pass
+
+
+@contextmanager
+def shared_array(shape: tuple, dtype=np.uint8):
+    """Create an array in a new shared memory segment
+
+    Pass the handle to other processes, which use `attach_shared(handle)`
+    to get the same array without copying it.
+    The segment is removed when the `with` block ends.
+
+    Example:
+        with io.shared_array(image.shape) as (shared, handle):
+            shared[...] = image
+            pool.submit(work, handle)
+
+    Args:
+        shape (tuple): the shape of the array
+        dtype: the dtype of the array
+    Yields:
+        tuple: (array, handle), where handle is a dict
+            with the segment's 'name', and the array's 'shape' and 'dtype'
+    """
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    shm = shared_memory.SharedMemory(create=True, size=max(1, nbytes))
+    array = None
+    try:
+        array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        yield array, {"name": shm.name, "shape": tuple(shape), "dtype": dtype.str}
+    finally:
+        del array
+        _close_shared(shm)
+        shm.unlink()
+
+
+@contextmanager
+def share_array(array: np.array):
+    """Copy an array into a new shared memory segment (see shared_array)
+
+    Yields:
+        tuple: (shared array, handle)
+    """
+    with shared_array(array.shape, array.dtype) as (shared, handle):
+        shared[...] = array
+        yield shared, handle
+
+
+@contextmanager
+def attach_shared(handle: dict):
+    """The array in a shared memory segment, from its handle (see shared_array)
+
+    Writes to the array are seen by every process using the segment.
+
+    Args:
+        handle (dict): the segment's 'name', and the array's 'shape' and 'dtype'
+    Yields:
+        np.array: the shared array
+    """
+    options = {}
+    if sys.version_info >= (3, 13):
+        # only the creating process should remove the segment
+        options["track"] = False
+    shm = shared_memory.SharedMemory(name=handle["name"], **options)
+    try:
+        yield np.ndarray(handle["shape"], dtype=handle["dtype"], buffer=shm.buf)
+    finally:
+        _close_shared(shm)
+
+
+def _raw_offset(image: Image.Image) -> int:
+    """The file offset of the pixels, if `image` is stored as plain rows
+
+    That is, uncompressed, top-to-bottom, RGB or L pixels with no padding
+    (e.g. PPM, PGM and uncompressed TIFF).
+
+    Returns:
+        int: the offset, or None if the pixels can't be memory-mapped
+    """
+    if image.mode not in {"RGB", "L"} or not image.tile:
+        return None
+    row_bytes = image.width * len(image.mode)
+    first_offset = None
+    for tile in image.tile:
+        codec, extents, offset, args = tile
+        if isinstance(args, str):
+            args = (args,)
+        rawmode = args[0]
+        stride = args[1] if len(args) > 1 else 0
+        orientation = args[2] if len(args) > 2 else 1
+        x0, y0, x1, y1 = extents
+        if (
+            codec != "raw"
+            or rawmode != image.mode
+            or stride not in (0, row_bytes)
+            or orientation != 1
+            or (x0, x1) != (0, image.width)
+        ):
+            return None
+        if first_offset is None:
+            first_offset = offset - y0 * row_bytes
+        elif offset != first_offset + y0 * row_bytes:
+            # strips aren't stored one after the other
+            return None
+    return first_offset
+
+
+def _mapped_layout(filename: str) -> tuple:
+    """The (offset, shape) of the pixels in a file that can be memory-mapped
+
+    Returns:
+        tuple: (offset, shape), or None if the file must be decoded
+    """
+    if Path(filename).suffix.lower() == ".npy":
+        with open(filename, "rb") as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                read_header = np.lib.format.read_array_header_1_0
+            else:
+                read_header = np.lib.format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(f)
+            offset = f.tell()
+        if fortran_order or dtype != np.uint8:
+            raise ValueError(f"{filename} must be a C-ordered uint8 array")
+        return offset, shape
+
+    with Image.open(filename) as image:
+        offset = _raw_offset(image)
+        if offset is None:
+            return None
+        shape = (image.height, image.width)
+        if image.mode == "RGB":
+            shape = shape + (3,)
+        return offset, shape
+
+
+def _map_image(filename: str) -> tuple:
+    """Memory-map the pixels of an image file
+
+    Returns:
+        tuple: (array, mmap, offset), or None if the file must be decoded
+    """
+    layout = _mapped_layout(filename)
+    if layout is None:
+        return None
+    offset, shape = layout
+    with open(filename, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    array = np.frombuffer(mapped, dtype=np.uint8, count=int(np.prod(shape)), offset=offset)
+    return array.reshape(shape), mapped, offset
+
+
+def open_image_rows(filename: str) -> np.array:
+    """Open an image file as an array, without reading all of it if possible
+
+    .npy files and uncompressed images (PPM, PGM, uncompressed TIFF)
+    are memory-mapped, so rows are only read from disk when accessed.
+    Other formats (e.g. JPEG, PNG) can't be decoded in parts,
+    and are decoded into memory.
+
+    Args:
+        filename (str): the image file
+    Returns:
+        np.array: (height, width, 3) or (height, width) uint8 array (read-only)
+    """
+    mapped = _map_image(filename)
+    if mapped is not None:
+        return mapped[0]
+    return read_image(filename)
+
+
+def _release_pages(mapped: mmap.mmap, start: int, stop: int) -> None:
+    """Tell the OS we are done with bytes [start:stop] of a mapping,
+    so they no longer count towards our memory use"""
+    if not hasattr(mmap, "MADV_DONTNEED"):
+        return
+    # madvise needs a page-aligned start
+    start -= start % mmap.PAGESIZE
+    if stop > start:
+        mapped.madvise(mmap.MADV_DONTNEED, start, stop - start)
+
+
+def _write_header(f, filename: str, shape: tuple) -> None:
+    """Write the header of a .npy, .ppm or .pgm file"""
+    if Path(filename).suffix.lower() == ".npy":
+        header = {"descr": "|u1", "fortran_order": False, "shape": tuple(shape)}
+        np.lib.format.write_array_header_1_0(f, header)
+    else:
+        # binary portable pixmap (RGB) or graymap (L)
+        magic = "P6" if len(shape) == 3 else "P5"
+        f.write(f"{magic}\n{shape[1]} {shape[0]}\n255\n".encode("ascii"))
+
+
+def strip_rows(width: int, memory_budget: int = None) -> int:
+    """The number of rows to filter at a time to stay within `memory_budget` bytes"""
+    if memory_budget is None:
+        memory_budget = default_memory_budget
+    return max(1, memory_budget // (max(1, width) * streaming_bytes_per_pixel))
+
+
+def stream_filter(
+    filter_function,
+    filename: str,
+    out_file: str,
+    gray: bool = False,
+    memory_budget: int = None,
+) -> None:
+    """Filter an image file strip by strip, with bounded memory
+
+    Memory-mapped inputs (see `open_image_rows`) are read a strip at a time,
+    and each strip's pages are released once it is filtered.
+    Each strip is filtered into one reused buffer, which is appended
+    to the output file, if it is .npy, .ppm or .pgm.
+    Other input and output formats need the whole image in memory
+    for decoding / encoding, so only the filter itself is done in strips.
+    The input mapping is closed when done.
+
+    Args:
+        filter_function (callable): the filter,
+            which must accept an `out` array
+        filename (str): the image file to filter
+        out_file (str): the file to write the filtered image to
+        gray (bool): whether the filter returns a single channel
+        memory_budget (int): bytes to use for each strip
+            (default: `default_memory_budget`)
+    Raises:
+        ValueError: if the image is gray (one channel)
+    """
+    mapped = _map_image(filename)
+    if mapped is not None:
+        image, input_map, offset = mapped
+    else:
+        image, input_map, offset = read_image(filename), None, 0
+    mapped = None
+    try:
+        check_rgb(image, filename)
+        _stream_strips(filter_function, image, input_map, offset, out_file, gray, memory_budget)
+    finally:
+        if input_map is not None:
+            # the array must be gone before its mapping can be closed
+            del image
+            try:
+                input_map.close()
+            except BufferError:
+                # still viewed from the traceback of an error, unmapped when that is freed
+                pass
+
+
+def _stream_strips(filter_function, image, input_map, offset, out_file, gray, memory_budget):
+    """Filter `image` strip by strip into `out_file` (see stream_filter)"""
+    height, width = image.shape[:2]
+    shape = (height, width) if gray else (height, width, 3)
+    rows = strip_rows(width, memory_budget)
+    row_bytes = image[:1].nbytes
+
+    streamed = Path(out_file).suffix.lower() in streamable_suffixes
+    if streamed:
+        f = open(out_file, "wb")
+        _write_header(f, out_file, shape)
+        strip = np.empty((rows,) + shape[1:], dtype=np.uint8)
+    else:
+        filtered = np.empty(shape, dtype=np.uint8)
+
+    try:
+        for start in range(0, height, rows):
+            stop = min(start + rows, height)
+            if streamed:
+                out = strip[: stop - start]
+                filter_function(image[start:stop], out=out)
+                f.write(out.data)
+            else:
+                filter_function(image[start:stop], out=filtered[start:stop])
+            if input_map is not None:
+                _release_pages(input_map, offset + start * row_bytes, offset + stop * row_bytes)
+    finally:
+        if streamed:
+            f.close()
+
+    if not streamed:
+        write_image(filtered, out_file)
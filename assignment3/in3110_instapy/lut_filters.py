@@ -0,0 +1,130 @@
+"""lookup-table implementation of image filters
+
+Each output channel is a weighted sum of the three input channels,
+so it can be computed as T_r[r] + T_g[g] + T_b[b],
+where each table holds the 256 possible products of one channel.
+The tables are built once per (filter, k) and kept in an LRU cache.
+
+The tables hold the same float64 products as the python implementation
+computes, added in the same order, so the results are byte-identical.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+
+import numpy as np
+
+from .buffers import batched, output_array, sepia_output
+
+# number of pixels handled per band, bounds the size of the float temporaries
+band_pixels = 1 << 16
+
+# the sepia matrix of the python implementation (k=1)
+reference_sepia_matrix = (
+    (0.393, 0.769, 0.189),
+    (0.349, 0.686, 0.168),
+    (0.272, 0.534, 0.131),
+)
+
+
+def _tables(matrix: tuple) -> np.array:
+    """Tables of weight * value for each output and input channel
+
+    Returns:
+        np.array: (outputs, 3, 256) float64 array,
+            where tables[o, c, v] = matrix[o][c] * v
+    """
+    values = np.arange(256, dtype=np.uint8)
+    # multiply uint8 values by python floats, like the python implementation
+    return np.array([[weight * values for weight in row] for row in matrix])
+
+
+@lru_cache(maxsize=1)
+def gray_tables() -> np.array:
+    """The (1, 3, 256) tables for color2gray"""
+    return _tables(((0.21, 0.72, 0.07),))
+
+
+@lru_cache(maxsize=16)
+def sepia_tables(k: float = 1) -> np.array:
+    """The (3, 3, 256) tables for color2sepia with an amount `k` of sepia"""
+    if not 0 <= k <= 1:
+        raise ValueError(f"k must be between [0-1], got {k=}")
+    if k == 1:
+        matrix = reference_sepia_matrix
+    else:
+        # same as numpy_color2sepia
+        matrix = (
+            (1 - ((1 - 0.393) * k), 0.769 * k, 0.189 * k),
+            (0.349 * k, 1 - ((1 - 0.686) * k), 0.168 * k),
+            (0.272 * k, 0.534 * k, 1 - ((1 - 0.131) * k)),
+        )
+    return _tables(matrix)
+
+
+def _apply_tables(image: np.array, tables: np.array, out: np.array) -> None:
+    """Write the sums of table lookups for each output channel into `out`"""
+    height, width, _ = image.shape
+    channels = tables.shape[0]
+    if out.ndim == 2:
+        out = out[..., None]
+
+    rows = max(1, band_pixels // max(1, width))
+    acc = np.empty((rows, width), dtype=np.float64)
+    tmp = np.empty_like(acc)
+    # when writing over the input, read each band from a copy
+    overlap = np.shares_memory(image, out)
+    band_copy = np.empty((rows, width, 3), dtype=np.uint8) if overlap else None
+
+    for start in range(0, height, rows):
+        stop = min(start + rows, height)
+        n = stop - start
+        band = image[start:stop]
+        if overlap:
+            band = band_copy[:n]
+            band[...] = image[start:stop]
+        for o in range(channels):
+            a = acc[:n]
+            t = tmp[:n]
+            np.take(tables[o, 0], band[..., 0], out=a)
+            np.take(tables[o, 1], band[..., 1], out=t)
+            a += t
+            np.take(tables[o, 2], band[..., 2], out=t)
+            a += t
+            np.minimum(a, 255, out=a)
+            np.copyto(out[start:stop, :, o], a, casting="unsafe")
+
+
+@batched
+def lut_color2gray(image: np.array, out: np.array = None) -> np.array:
+    """Convert rgb pixel array to grayscale
+
+    Args:
+        image (np.array)
+        out (np.array): array to write the result into (optional)
+    Returns:
+        np.array: gray_image
+    """
+    gray_image = output_array(out, image.shape[:2])
+    _apply_tables(image, gray_tables(), gray_image)
+    return gray_image
+
+
+@batched
+def lut_color2sepia(
+    image: np.array, k: float = 1, out: np.array = None, inplace: bool = False
+) -> np.array:
+    """Convert rgb pixel array to sepia
+
+    Args:
+        image (np.array)
+        k (float): amount of sepia (optional)
+        out (np.array): array to write the result into (optional)
+        inplace (bool): write the result into `image` (optional)
+    Returns:
+        np.array: sepia_image
+    """
+    tables = sepia_tables(float(k))
+    sepia_image = sepia_output(image, out, inplace)
+    _apply_tables(image, tables, sepia_image)
+    return sepia_image
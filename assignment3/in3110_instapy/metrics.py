@@ -0,0 +1,205 @@
+"""metrics of filter calls
+
+Filters returned by `get_filter(..., instrument=True)`
+(or with $INSTAPY_METRICS=1) record, per filter and implementation:
+
+- the number of calls, and of calls that raised an error
+- the number of pixels filtered
+- a histogram of the call durations
+- the bytes allocated for output images (calls without `out=`)
+
+Filters that aren't instrumented are returned unwrapped, so they have no overhead.
+The metrics can be exported as a JSON snapshot or in the Prometheus text format,
+e.g. for node_exporter's textfile collector.
+"""
+from __future__ import annotations
+
+import functools
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable
+
+# upper bounds (in seconds) of the duration histogram buckets
+duration_buckets = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    math.inf,
+)
+
+# metrics by (filter, implementation)
+_metrics = {}
+_lock = threading.Lock()
+
+
+def _new_metrics() -> dict:
+    """Zeroed metrics for one filter and implementation"""
+    return {
+        "calls": 0,
+        "errors": 0,
+        "pixels": 0,
+        "bytes_allocated": 0,
+        "seconds": 0.0,
+        "buckets": [0] * len(duration_buckets),
+    }
+
+
+def record(
+    filter_name: str,
+    implementation: str,
+    seconds: float,
+    pixels: int = 0,
+    bytes_allocated: int = 0,
+    error: bool = False,
+) -> None:
+    """Record one filter call"""
+    bucket = bisect_left(duration_buckets, seconds)
+    with _lock:
+        metrics = _metrics.get((filter_name, implementation))
+        if metrics is None:
+            metrics = _metrics[filter_name, implementation] = _new_metrics()
+        metrics["calls"] += 1
+        metrics["errors"] += error
+        metrics["pixels"] += pixels
+        metrics["bytes_allocated"] += bytes_allocated
+        metrics["seconds"] += seconds
+        metrics["buckets"][bucket] += 1
+
+
+def instrument(filter_function: Callable, filter_name: str, implementation: str) -> Callable:
+    """Wrap a filter function to record metrics of each call
+
+    Args:
+        filter_function (callable): the filter
+        filter_name (str): the filter name, e.g. 'color2gray'
+        implementation (str): the implementation name, e.g. 'numba'
+    Returns:
+        callable: the wrapped filter
+    """
+
+    @functools.wraps(filter_function)
+    def instrumented(image, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = filter_function(image, *args, **kwargs)
+        except BaseException:
+            record(filter_name, implementation, time.perf_counter() - start, error=True)
+            raise
+        seconds = time.perf_counter() - start
+        # a new output array was allocated, unless the result is the input
+        # or an `out` array passed in
+        allocated = result.nbytes
+        if result is image or any(result is arg for arg in args + tuple(kwargs.values())):
+            allocated = 0
+        record(
+            filter_name,
+            implementation,
+            seconds,
+            pixels=image.size // 3,
+            bytes_allocated=allocated,
+        )
+        return result
+
+    return instrumented
+
+
+def reset() -> None:
+    """Forget all recorded metrics"""
+    with _lock:
+        _metrics.clear()
+
+
+def snapshot() -> dict:
+    """The recorded metrics, as a JSON-serializable dict
+
+    Returns:
+        dict: with 'buckets' (the histogram bucket bounds, None for +inf)
+            and 'filters': a list of metrics, one per filter and implementation
+    """
+    with _lock:
+        filters = []
+        for (filter_name, implementation), metrics in sorted(_metrics.items()):
+            entry = {"filter": filter_name, "implementation": implementation}
+            entry.update(metrics)
+            entry["buckets"] = list(metrics["buckets"])
+            filters.append(entry)
+    return {
+        "buckets": [None if math.isinf(b) else b for b in duration_buckets],
+        "filters": filters,
+    }
+
+
+def to_json() -> str:
+    """The recorded metrics as JSON (see snapshot)"""
+    return json.dumps(snapshot(), indent=2)
+
+
+def to_prometheus() -> str:
+    """The recorded metrics in the Prometheus text exposition format"""
+    filters = snapshot()["filters"]
+    lines = []
+
+    counters = [
+        ("calls", "instapy_filter_calls_total", "Number of filter calls"),
+        ("errors", "instapy_filter_errors_total", "Number of filter calls that raised an error"),
+        ("pixels", "instapy_filter_pixels_total", "Number of pixels filtered"),
+        (
+            "bytes_allocated",
+            "instapy_filter_allocated_bytes_total",
+            "Bytes allocated for filter output images",
+        ),
+    ]
+    for key, name, help in counters:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} counter")
+        for entry in filters:
+            lines.append(f"{name}{{{_labels(entry)}}} {entry[key]}")
+
+    name = "instapy_filter_duration_seconds"
+    lines.append(f"# HELP {name} Duration of filter calls")
+    lines.append(f"# TYPE {name} histogram")
+    for entry in filters:
+        labels = _labels(entry)
+        cumulative = 0
+        for bound, count in zip(duration_buckets, entry["buckets"]):
+            cumulative += count
+            le = "+Inf" if math.isinf(bound) else repr(bound)
+            lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {entry['seconds']!r}")
+        lines.append(f"{name}_count{{{labels}}} {entry['calls']}")
+    return "\n".join(lines) + "\n"
+
+
+def _labels(entry: dict) -> str:
+    return f'filter="{entry["filter"]}",implementation="{entry["implementation"]}"'
+
+
+def write_metrics(filename: str) -> None:
+    """Write the recorded metrics to a file
+
+    The format is Prometheus text for files ending in .prom, and JSON otherwise.
+    The file is replaced atomically, so readers never see a partial file.
+    """
+    if str(filename).endswith(".prom"):
+        text = to_prometheus()
+    else:
+        text = to_json()
+    tmp_file = f"{filename}.tmp"
+    with open(tmp_file, "w") as f:
+        f.write(text)
+    os.replace(tmp_file, filename)
@@ -1,64 +1,190 @@
-"""numba-optimized filters"""
+"""numba-optimized filters
+
+The kernels are compiled in nopython mode, run their rows in parallel
+with `prange`, and are cached on disk (cache=True),
+so the compilation is only paid once per machine.
+They are compiled lazily, for the array types they are first called with,
+so importing this module compiles nothing. `compile_kernels`
+(run by `instapy warmup` once after installing) compiles them for every
+supported array type, so later processes only load them from the cache.
+
+Each kernel writes into a caller-supplied output array;
+the numba_color2* functions allocate one if it isn't given.
+
+Planar images, shape (3, H, W), have their own kernels,
+whose inner loops read contiguous channel planes,
+so LLVM can vectorize them (the interleaved kernels read every third byte).
+
+fastmath is not enabled, since reordering the float operations
+would change the truncated result on some pixels,
+and the filters should match the python implementation exactly.
+"""
 from __future__ import annotations
 
+import itertools
+
 import numpy as np
-from numba import jit
+from numba import njit, prange, types
 
-@jit(nopython=True)
-def numba_color2gray(image: np.array) -> np.array:
-    """Convert rgb pixel array to grayscale
+from .buffers import batched, is_planar, output_array, sepia_output
 
-    Args:
-        image (np.array)
-    Returns:
-        np.array: gray_image
+
+def _array_types(ndim: int) -> list:
+    """uint8 array types with `ndim` dimensions, for every supported layout
+
+    C-contiguous or any layout ('A', e.g. slices), writable or read-only
+    (e.g. arrays from PIL images)
     """
+    return [
+        types.Array(types.uint8, ndim, layout, readonly=readonly)
+        for layout, readonly in itertools.product("CA", (False, True))
+    ]
+
+
+def _output_types(ndim: int) -> list:
+    """writable uint8 output array types with `ndim` dimensions"""
+    return [types.Array(types.uint8, ndim, layout) for layout in "CA"]
+
+
+# (image, output) signatures compiled for each kernel by compile_kernels
+gray_signatures = [
+    types.void(image_type, out_type)
+    for image_type, out_type in itertools.product(_array_types(3), _output_types(2))
+]
+sepia_signatures = [
+    types.void(image_type, out_type)
+    for image_type, out_type in itertools.product(_array_types(3), _output_types(3))
+]
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def color2gray_kernel(image: np.array, gray_image: np.array) -> None:
+    """Write the grayscale of rgb `image` into `gray_image`"""
     height, width, _ = image.shape
 
+    for i in prange(height):
+        for j in range(width):
+            gray_image[i, j] = int(
+                0.21 * image[i, j, 0] + 0.72 * image[i, j, 1] + 0.07 * image[i, j, 2]
+            )
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def color2sepia_kernel(image: np.array, sepia_image: np.array) -> None:
+    """Write the sepia of rgb `image` into `sepia_image`"""
+    height, width, _ = image.shape
+
+    for y in prange(height):
+        for x in range(width):
+            r = image[y, x, 0]
+            g = image[y, x, 1]
+            b = image[y, x, 2]
+
+            red_channel = int(r * 0.393 + g * 0.769 + b * 0.189)
+            green_channel = int(r * 0.349 + g * 0.686 + b * 0.168)
+            blue_channel = int(r * 0.272 + g * 0.534 + b * 0.131)
+
+            sepia_image[y, x, 0] = min(255, red_channel)
+            sepia_image[y, x, 1] = min(255, green_channel)
+            sepia_image[y, x, 2] = min(255, blue_channel)
 
-    gray_image = np.empty((height, width), dtype=np.uint8)
 
-    for i in range(height):
+# the planar kernels have the same signatures: (3, H, W) in, (H, W) or (3, H, W) out
+@njit(parallel=True, nogil=True, cache=True)
+def color2gray_planar_kernel(planes: np.array, gray_image: np.array) -> None:
+    """Write the grayscale of planar rgb `planes` into `gray_image`"""
+    _, height, width = planes.shape
+    red = planes[0]
+    green = planes[1]
+    blue = planes[2]
+
+    for i in prange(height):
         for j in range(width):
-            red, green, blue = image[i, j]
-            gray_value = int(0.21 * red + 0.72 * green + 0.07 * blue)
-            gray_image[i, j] = gray_value
+            gray_image[i, j] = int(0.21 * red[i, j] + 0.72 * green[i, j] + 0.07 * blue[i, j])
 
-    return gray_image
 
+@njit(parallel=True, nogil=True, cache=True)
+def color2sepia_planar_kernel(planes: np.array, sepia_planes: np.array) -> None:
+    """Write the sepia of planar rgb `planes` into planar `sepia_planes`"""
+    _, height, width = planes.shape
 
-def numba_color2sepia(image: np.array) -> np.array:
-    """Convert rgb pixel array to sepia
+    for y in prange(height):
+        for x in range(width):
+            r = planes[0, y, x]
+            g = planes[1, y, x]
+            b = planes[2, y, x]
+
+            red_channel = int(r * 0.393 + g * 0.769 + b * 0.189)
+            green_channel = int(r * 0.349 + g * 0.686 + b * 0.168)
+            blue_channel = int(r * 0.272 + g * 0.534 + b * 0.131)
+
+            sepia_planes[0, y, x] = min(255, red_channel)
+            sepia_planes[1, y, x] = min(255, green_channel)
+            sepia_planes[2, y, x] = min(255, blue_channel)
+
+
+def compile_kernels() -> int:
+    """Compile every kernel for all supported signatures
+
+    The compiled kernels are stored in numba's on-disk cache
+    (or loaded from it, if already there).
 
-    Args:
-        image (np.array)
     Returns:
-        np.array: sepia_image
+        int: the number of kernel signatures compiled
     """
-    sepia_image = np.empty_like(image)
-    shape =  np.asarray((np.shape(image)))
+    kernels = [
+        (color2gray_kernel, gray_signatures),
+        (color2sepia_kernel, sepia_signatures),
+        (color2gray_planar_kernel, gray_signatures),
+        (color2sepia_planar_kernel, sepia_signatures),
+    ]
+    for kernel, signatures in kernels:
+        for signature in signatures:
+            kernel.compile(signature)
+    return sum(len(signatures) for _, signatures in kernels)
 
-    sepia_matrix = [
-    [ 0.393, 0.769, 0.189],
-    [ 0.349, 0.686, 0.168],
-    [ 0.272, 0.534, 0.131],
-]
-    for y in range(shape[0]):
-        for x in range(shape[1]):
-            r, g, b = image[y, x]
-           
-            red_channel = int(r * sepia_matrix[0][0] + g * sepia_matrix[0][1] + b * sepia_matrix[0][2])
-            green_channel = int(r * sepia_matrix[1][0] + g * sepia_matrix[1][1] + b * sepia_matrix[1][2])
-            blue_channel = int(r * sepia_matrix[2][0] + g * sepia_matrix[2][1] + b * sepia_matrix[2][2])
-           
-            sepia_image[y, x] = (
-                min(255, red_channel),
-                min(255, green_channel),
-                min(255, blue_channel)
-            )
 
-    sepia_image = sepia_image.astype('uint8')
-    return sepia_image
+@batched
+def numba_color2gray(
+    image: np.array, out: np.array = None, layout: str = "interleaved"
+) -> np.array:
+    """Convert rgb pixel array to grayscale
 
+    Args:
+        image (np.array): interleaved (H, W, 3) or planar (3, H, W)
+        out (np.array): array to write the result into (optional)
+        layout (str): 'interleaved' or 'planar' (optional)
+    Returns:
+        np.array: gray_image
+    """
+    if is_planar(image, layout):
+        gray_image = output_array(out, image.shape[1:])
+        color2gray_planar_kernel(image, gray_image)
+        return gray_image
+    height, width, _ = image.shape
+    gray_image = output_array(out, (height, width))
+    color2gray_kernel(image, gray_image)
+    return gray_image
 
 
+@batched
+def numba_color2sepia(
+    image: np.array, out: np.array = None, inplace: bool = False, layout: str = "interleaved"
+) -> np.array:
+    """Convert rgb pixel array to sepia
+
+    Args:
+        image (np.array): interleaved (H, W, 3) or planar (3, H, W)
+        out (np.array): array to write the result into (optional)
+        inplace (bool): write the result into `image` (optional)
+        layout (str): 'interleaved' or 'planar' (optional)
+    Returns:
+        np.array: sepia_image
+    """
+    planar = is_planar(image, layout)
+    sepia_image = sepia_output(image, out, inplace)
+    if planar:
+        color2sepia_planar_kernel(image, sepia_image)
+        return sepia_image
+    color2sepia_kernel(image, sepia_image)
+    return sepia_image
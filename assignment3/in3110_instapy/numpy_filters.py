@@ -1,17 +1,42 @@
-"""numpy implementation of image filters"""
+"""numpy implementation of image filters
+
+numpy_color2sepia works in bands of rows by default (`low_memory=True`),
+so large images can be filtered in memory-limited environments.
+It computes one channel of a band at a time, clips it in place
+and writes it straight into the uint8 output, so its peak memory is
+the output (3 MB per megapixel, none if `out` is given)
+plus about 1.2 MiB for the band, whatever the size of the image.
+With `low_memory=False` the whole image is computed at once with einsum,
+which needs about 27 MB per megapixel at its peak
+(the float64 result and the uint8 output), and is slower on large images.
+"""
 from __future__ import annotations
 
 import numpy as np
 
+from .buffers import batched, interleaved_view, is_planar, output_array, sepia_output
 
-def numpy_color2gray(image: np.array) -> np.array:
+# pixels per band of rows in numpy_color2sepia's low-memory mode
+sepia_band_pixels = 2**16
+
+
+@batched
+def numpy_color2gray(
+    image: np.array, out: np.array = None, layout: str = "interleaved"
+) -> np.array:
     """Convert rgb pixel array to grayscale
 
     Args:
-        image (np.array)
+        image (np.array): interleaved (H, W, 3) or planar (3, H, W)
+        out (np.array): array to write the result into (optional)
+        layout (str): 'interleaved' or 'planar' (optional)
     Returns:
         np.array: gray_image
     """
+    if is_planar(image, layout):
+        # the channels below are then the contiguous planes
+        image = interleaved_view(image)
+    out = output_array(out, image.shape[:2])
 
     # henter ut RGB channels fra input
     red_channel = image[:, :, 0]
@@ -22,17 +47,58 @@ def numpy_color2gray(image: np.array) -> np.array:
     gray_image = 0.21 * red_channel + 0.72 * green_channel + 0.07 * blue_channel
 
     # gjør om til riktig datatype
-    gray_image = gray_image.astype(np.uint8)
+    np.copyto(out, gray_image, casting="unsafe")
+
+    return out
 
-    return gray_image
 
+def _sepia_bands(image: np.array, sepia_matrix: np.array, out: np.array) -> None:
+    """Write the sepia of `image` into `out` a band of rows and a channel at a time
 
-def numpy_color2sepia(image: np.array, k: float = 1) -> np.array:
+    Each channel is summed in the same order as the python implementation,
+    in float64, so the truncated results match it exactly.
+    """
+    height, width, _ = image.shape
+    rows = max(1, sepia_band_pixels // max(1, width))
+    channel = np.empty((rows, width))
+    product = np.empty((rows, width))
+    aliased = np.may_share_memory(image, out)
+
+    for start in range(0, height, rows):
+        band = image[start : start + rows]
+        n = band.shape[0]
+        if aliased:
+            # out[...] is written before every channel of the band has been read
+            band = band.copy()
+        for i in range(3):
+            np.multiply(band[:, :, 0], sepia_matrix[i, 0], out=channel[:n])
+            np.multiply(band[:, :, 1], sepia_matrix[i, 1], out=product[:n])
+            channel[:n] += product[:n]
+            np.multiply(band[:, :, 2], sepia_matrix[i, 2], out=product[:n])
+            channel[:n] += product[:n]
+            np.clip(channel[:n], 0, 255, out=channel[:n])
+            np.copyto(out[start : start + n, :, i], channel[:n], casting="unsafe")
+
+
+@batched
+def numpy_color2sepia(
+    image: np.array,
+    k: float = 1,
+    out: np.array = None,
+    inplace: bool = False,
+    low_memory: bool = True,
+    layout: str = "interleaved",
+) -> np.array:
     """Convert rgb pixel array to sepia
 
     Args:
-        image (np.array)
+        image (np.array): interleaved (H, W, 3) or planar (3, H, W)
         k (float): amount of sepia (optional)
+        out (np.array): array to write the result into (optional)
+        inplace (bool): write the result into `image` (optional)
+        low_memory (bool): filter in bands of rows, without
+            full-size temporary arrays (default, see the module docstring)
+        layout (str): 'interleaved' or 'planar' (optional)
 
     The amount of sepia is given as a fraction, k=0 yields no sepia while
     k=1 yields full sepia.
@@ -46,16 +112,24 @@ def numpy_color2sepia(image: np.array, k: float = 1) -> np.array:
     if not 0 <= k <= 1:
         raise ValueError(f"k must be between [0-1], got {k=}")
 
-    sepia_image = np.empty_like(image)
- 
+    planar = is_planar(image, layout)
+    out = sepia_output(image, out, inplace)
+    target = out
+    if planar:
+        image, target = interleaved_view(image), interleaved_view(out)
+
     sepia_matrix = np.array([
         [ 1 - ((1 - 0.393) * k), 0.769 * k, 0.189 * k],
         [ 0.349 * k, 1 - ((1 - 0.686) * k), 0.168 * k],
         [ 0.272 * k, 0.534 * k, 1 - ((1 - 0.131) * k)],
     ])
 
+    if low_memory:
+        _sepia_bands(image, sepia_matrix, target)
+        return out
+
     sepia_image = np.einsum('ijk,lk->ijl', image, sepia_matrix)
-    sepia_image[sepia_image > 255] = 255
+    np.minimum(sepia_image, 255, out=sepia_image)
 
-    sepia_image = sepia_image.astype("uint8")
-    return sepia_image
+    np.copyto(target, sepia_image, casting="unsafe")
+    return out
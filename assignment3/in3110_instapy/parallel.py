@@ -0,0 +1,203 @@
+"""multi-core execution of filters
+
+The image is split into bands of rows, which are filtered independently.
+Implementations that release the GIL (numpy, integer, lut, cython)
+run the bands on a thread pool, writing directly into the output array.
+The numba kernels are already parallel (prange),
+so for numba the number of numba threads is set instead.
+The pure python implementation holds the GIL, so its bands run on
+a process pool, with input and output in shared memory.
+"""
+from __future__ import annotations
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from .buffers import batched, is_planar, output_array, sepia_output
+from .registry import get_backend
+
+
+def default_workers() -> int:
+    """The default number of workers (the number of cpus)"""
+    return os.cpu_count() or 1
+
+
+def split_rows(height: int, workers: int) -> list:
+    """Split `height` rows into at most `workers` (start, stop) bands of similar size"""
+    workers = max(1, min(workers, height))
+    bounds = np.linspace(0, height, workers + 1).astype(int)
+    return [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def output_shape(filter_name: str, shape: tuple, planar: bool = False) -> tuple:
+    """The shape of the filtered image for an input image of `shape`"""
+    if filter_name == "color2gray":
+        return shape[1:] if planar else shape[:-1]
+    return shape
+
+
+def _rows(array: np.array, start: int, stop: int, layout: str) -> np.array:
+    """Rows [start:stop] of an image, interleaved, planar or gray"""
+    if layout == "planar" and array.ndim == 3:
+        return array[:, start:stop]
+    return array[start:stop]
+
+
+def _filter_band(filter_function, image, out, start, stop, layout):
+    """Filter rows [start:stop] of `image` into `out`"""
+    filter_function(
+        _rows(image, start, stop, layout), out=_rows(out, start, stop, layout), layout=layout
+    )
+
+
+def _filter_shared_band(filter_name, implementation, in_handle, out_handle, start, stop, layout):
+    """Filter one band of an image in shared memory (runs in a worker process)"""
+    from . import get_filter
+    from .io import attach_shared
+
+    filter_function = get_filter(filter_name, implementation)
+    with attach_shared(in_handle) as image, attach_shared(out_handle) as out:
+        _filter_band(filter_function, image, out, start, stop, layout)
+
+
+def _run_threads(filter_function, image, out, bands, workers, layout):
+    """Filter bands on a thread pool"""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_filter_band, filter_function, image, out, start, stop, layout)
+            for start, stop in bands
+        ]
+        for future in futures:
+            # re-raise any errors from the workers
+            future.result()
+
+
+def _run_native(filter_function, image, out, workers, layout):
+    """Run a numba filter with `workers` numba threads"""
+    import numba
+
+    previous = numba.get_num_threads()
+    numba.set_num_threads(max(1, min(workers, numba.config.NUMBA_NUM_THREADS)))
+    try:
+        filter_function(image, out=out, layout=layout)
+    finally:
+        numba.set_num_threads(previous)
+
+
+def _run_processes(filter_name, implementation, image, out, bands, workers, layout):
+    """Filter bands on a process pool, sharing input and output memory
+
+    Only the handles of the shared arrays are sent to the workers.
+    """
+    from .io import share_array, shared_array
+
+    with share_array(image) as (_, in_handle), shared_array(out.shape) as (shared_out, out_handle):
+        # spawn, since forking after numba has started its threads can deadlock
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [
+                pool.submit(
+                    _filter_shared_band,
+                    filter_name,
+                    implementation,
+                    in_handle,
+                    out_handle,
+                    start,
+                    stop,
+                    layout,
+                )
+                for start, stop in bands
+            ]
+            for future in futures:
+                # re-raise any errors from the workers
+                future.result()
+        out[...] = shared_out
+
+
+@batched
+def parallel_filter(
+    image: np.array,
+    filter_name: str = "color2gray",
+    implementation: str = "numpy",
+    workers: int = None,
+    out: np.array = None,
+    inplace: bool = False,
+    layout: str = "interleaved",
+) -> np.array:
+    """Apply a filter to an image in parallel bands of rows
+
+    A stack of images, shape (N, H, W, 3), is split into bands
+    of the rows of all its images. Planar images, shape (3, H, W)
+    with `layout="planar"`, are split into bands of rows of each plane.
+
+    Args:
+        image (np.array): the image (or stack of images) to filter
+        filter_name (str): the name of the filter ('color2gray' or 'color2sepia')
+        implementation (str): the implementation to run in each band
+        workers (int): the number of workers (default: number of cpus)
+        out (np.array): array to write the result into (optional)
+        inplace (bool): write the result into `image` (sepia only, optional)
+        layout (str): 'interleaved' or 'planar' (optional)
+    Returns:
+        np.array: the filtered image
+    """
+    from . import get_filter
+
+    if workers is None:
+        workers = default_workers()
+    planar = is_planar(image, layout)
+    if filter_name == "color2sepia":
+        out = sepia_output(image, out, inplace)
+    elif inplace:
+        raise ValueError(f"{filter_name} can't be applied in place")
+    else:
+        out = output_array(out, output_shape(filter_name, image.shape, planar))
+    height = image.shape[1] if planar else image.shape[0]
+    bands = split_rows(height, workers)
+    # how the backend runs in parallel (see registry.py)
+    parallel = get_backend(implementation)["parallel"]
+
+    if parallel == "native":
+        filter_function = get_filter(filter_name, implementation)
+        _run_native(filter_function, image, out, workers, layout)
+    elif len(bands) <= 1:
+        filter_function = get_filter(filter_name, implementation)
+        _filter_band(filter_function, image, out, 0, height, layout)
+    elif parallel == "threads":
+        filter_function = get_filter(filter_name, implementation)
+        _run_threads(filter_function, image, out, bands, workers, layout)
+    else:
+        _run_processes(filter_name, implementation, image, out, bands, workers, layout)
+    return out
+
+
+def get_parallel_filter(
+    filter_name: str = "color2gray", implementation: str = "numpy", workers: int = None
+):
+    """Return a filter function that runs `implementation` in parallel
+
+    Args:
+        filter_name (str): the name of the filter ('color2gray' or 'color2sepia')
+        implementation (str): the implementation to run in each band
+        workers (int): the number of workers (default: number of cpus)
+    Returns:
+        filter_function (function):
+            takes an image and returns the filtered image
+    """
+    # resolve the implementation early, to fail on unknown names
+    from . import get_filter
+
+    get_filter(filter_name, implementation)
+
+    def filter_function(
+        image: np.array, out: np.array = None, inplace: bool = False, layout: str = "interleaved"
+    ) -> np.array:
+        return parallel_filter(
+            image, filter_name, implementation, workers, out=out, inplace=inplace, layout=layout
+        )
+
+    filter_function.__name__ = f"parallel_{implementation}_{filter_name}"
+    return filter_function
@@ -0,0 +1,212 @@
+"""pipelines of several filters
+
+A pipeline is built from stage specifications, e.g.
+
+    pipeline("scale:2", "sepia:k=0.5", "gray")
+
+The gray and sepia filters are both linear maps of each pixel's rgb values,
+so consecutive gray/sepia stages are fused: they are applied in a single
+pass over the image, a band of rows at a time, without intermediate images.
+Each channel is computed as `r * w0 + g * w1 + b * w2`, in the same order
+as the filters, and clipped and truncated to a uint8 value after every stage,
+so a fused pipeline gives exactly the same result as applying
+the filters one after the other (`fuse=False`).
+"""
+from __future__ import annotations
+
+import numpy as np
+
+from .buffers import output_array
+from .resize import downscale
+
+# rows of 0.21, 0.72, 0.07, so gray is 3 equal channels
+gray_matrix = np.array([[0.21, 0.72, 0.07]] * 3)
+
+# number of pixels handled per band, so the float temporaries stay in cache
+band_pixels = 1 << 16
+
+
+def sepia_matrix(k: float = 1) -> np.array:
+    """The sepia matrix for an amount `k` of sepia (same as numpy_color2sepia)"""
+    if not 0 <= k <= 1:
+        raise ValueError(f"k must be between [0-1], got {k=}")
+    return np.array(
+        [
+            [1 - ((1 - 0.393) * k), 0.769 * k, 0.189 * k],
+            [0.349 * k, 1 - ((1 - 0.686) * k), 0.168 * k],
+            [0.272 * k, 0.534 * k, 1 - ((1 - 0.131) * k)],
+        ]
+    )
+
+
+def parse_stage(spec: str) -> dict:
+    """Parse a stage specification
+
+    'gray', 'sepia', 'sepia:k=0.5' (or 'sepia:0.5') and 'scale:2'
+    ('color2gray' and 'color2sepia' are accepted too)
+
+    Args:
+        spec (str): the stage specification
+    Returns:
+        dict: the stage, with 'name' and its parameters
+    """
+    name, _, argument = spec.partition(":")
+    name = name.strip().lower()
+    if name.startswith("color2"):
+        name = name[len("color2") :]
+    if "=" in argument:
+        key, _, argument = argument.partition("=")
+    else:
+        key = None
+
+    if name == "gray":
+        if argument:
+            raise ValueError(f"gray takes no arguments, got {spec!r}")
+        return {"name": "gray", "matrix": gray_matrix, "gray": True}
+    elif name == "sepia":
+        if key not in (None, "k"):
+            raise ValueError(f"Unknown sepia argument in {spec!r}")
+        k = float(argument) if argument else 1.0
+        return {"name": "sepia", "matrix": sepia_matrix(k), "gray": False, "k": k}
+    elif name == "scale":
+        if key not in (None, "factor") or not argument:
+            raise ValueError(f"scale needs a factor, e.g. 'scale:2', got {spec!r}")
+        return {"name": "scale", "factor": float(argument)}
+    else:
+        raise ValueError(f"Unknown pipeline stage {spec!r}")
+
+
+def fuse_stages(stages: list) -> list:
+    """Combine consecutive gray/sepia stages into one 'linear' stage each
+
+    The 'linear' stage has a list of 'matrices', applied in turn.
+    The matrices aren't multiplied together, since the result
+    is truncated to uint8 between the stages.
+    """
+    fused = []
+    for stage in stages:
+        if "matrix" not in stage:
+            fused.append(stage)
+        elif fused and fused[-1]["name"] == "linear":
+            matrices = fused[-1]["matrices"] + [stage["matrix"]]
+            fused[-1] = {"name": "linear", "matrices": matrices, "gray": stage["gray"]}
+        else:
+            fused.append({"name": "linear", "matrices": [stage["matrix"]], "gray": stage["gray"]})
+    return fused
+
+
+def _apply_matrix(values: np.array, matrix: np.array) -> np.array:
+    """Apply a 3x3 color matrix to a band of pixels, clipped to [0, 255] and truncated
+
+    Each channel is summed in the same order as the filters,
+    so the result is the same as theirs.
+    Returns (rows, width, 3) float64 values.
+    """
+    result = np.empty(values.shape[:2] + (3,))
+    product = np.empty(values.shape[:2])
+    # gray has the same weights for every channel, compute it once
+    channels = 1 if (matrix == matrix[0]).all() else 3
+    for i in range(channels):
+        channel = result[..., i]
+        np.multiply(values[..., 0], matrix[i, 0], out=channel)
+        np.multiply(values[..., 1], matrix[i, 1], out=product)
+        channel += product
+        np.multiply(values[..., 2], matrix[i, 2], out=product)
+        channel += product
+    if channels == 1:
+        result[..., 1] = result[..., 0]
+        result[..., 2] = result[..., 0]
+    np.clip(result, 0, 255, out=result)
+    np.floor(result, out=result)
+    return result
+
+
+def apply_matrices(
+    image: np.array, matrices: list, gray: bool = False, out: np.array = None
+) -> np.array:
+    """Apply 3x3 color matrices to each pixel in turn, a band of rows at a time
+
+    After each matrix, values are clipped to [0, 255] and truncated,
+    like the filters, so the result is the same as applying them in turn.
+
+    Args:
+        image (np.array): (height, width, 3) or gray (height, width) image
+        matrices (list): the 3x3 matrices, in the order they are applied
+        gray (bool): return a single (gray) channel
+        out (np.array): array to write the result into (optional)
+    Returns:
+        np.array: the filtered image
+    """
+    if image.ndim == 2:
+        # a gray image has the same value in all three channels
+        image = np.broadcast_to(image[..., None], image.shape + (3,))
+    height, width, _ = image.shape
+    out = output_array(out, (height, width) if gray else (height, width, 3))
+    rows = max(1, band_pixels // max(1, width))
+    for start in range(0, height, rows):
+        stop = min(start + rows, height)
+        values = image[start:stop]
+        for matrix in matrices:
+            values = _apply_matrix(values, matrix)
+        if gray:
+            values = values[..., 0]
+        np.copyto(out[start:stop], values, casting="unsafe")
+    return out
+
+
+def _apply_unfused(stage: dict, image: np.array) -> np.array:
+    """Apply a gray or sepia stage on its own, with the numpy filters"""
+    from .numpy_filters import numpy_color2gray, numpy_color2sepia
+
+    if image.ndim == 2:
+        image = np.repeat(image[..., None], 3, axis=2)
+    if stage["name"] == "gray":
+        return numpy_color2gray(image)
+    return numpy_color2sepia(image, k=stage["k"])
+
+
+class Pipeline:
+    """A sequence of filter stages, applied with `pipeline(image)`"""
+
+    def __init__(self, *specs: str, fuse: bool = True):
+        """Build a pipeline from stage specifications
+
+        Args:
+            *specs (str): the stages, e.g. 'scale:2', 'sepia:k=0.5', 'gray'
+            fuse (bool): fuse consecutive gray/sepia stages into one pass
+        """
+        if not specs:
+            raise ValueError("A pipeline needs at least one stage")
+        self.specs = specs
+        self.fuse = fuse
+        self.stages = [parse_stage(spec) for spec in specs]
+        self._steps = fuse_stages(self.stages) if fuse else self.stages
+
+    def __repr__(self):
+        specs = ", ".join(repr(spec) for spec in self.specs)
+        return f"Pipeline({specs}, fuse={self.fuse})"
+
+    def __call__(self, image: np.array, out: np.array = None) -> np.array:
+        """Apply the pipeline to an image
+
+        Args:
+            image (np.array): the (height, width, 3) uint8 image
+            out (np.array): array to write the result into (optional)
+        Returns:
+            np.array: the filtered image
+        """
+        for i, step in enumerate(self._steps):
+            last = i == len(self._steps) - 1
+            if step["name"] == "scale":
+                image = downscale(image, step["factor"])
+            elif step["name"] == "linear":
+                image = apply_matrices(
+                    image, step["matrices"], step["gray"], out=out if last else None
+                )
+            else:
+                image = _apply_unfused(step, image)
+
+        if out is not None and image is not out:
+            out[...] = image
+            return out
+        return image
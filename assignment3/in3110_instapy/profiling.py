@@ -1,19 +1,24 @@
 """
 Profiling (IN4110 only)
+
+Profiles the filter implementations with cProfile or line_profiler,
+and times the stages (decode, resize, filter, encode) of filtering a file
+(`instapy --profile`, see cli.run_filter).
+The profilers are imported when used, since the cli imports this module.
 """
 from __future__ import annotations
 
-import cProfile
-import pstats
+import inspect
+import json
+import sys
+import time
+from contextlib import contextmanager
 
 import in3110_instapy
-import line_profiler
-
-from . import io
 
 
 def profile_with_cprofile(filter, image, ncalls=3):
-    """Profile filter(image) with line_profiler
+    """Profile filter(image) with cProfile
 
     Statistics will be printed to stdout.
 
@@ -23,19 +28,24 @@ def profile_with_cprofile(filter, image, ncalls=3):
         image (ndarray): image to filter
         ncalls (int): number of repetitions to measure
     """
+    import cProfile
+    import pstats
+
     profiler = cProfile.Profile()
     # run `filter(image)` in the profiler
-    ...
-    stats = pstats.Stats(profiler)
+    for _ in range(ncalls):
+        profiler.runcall(filter, image)
+    stats = pstats.Stats(profiler, stream=sys.stdout)
     # print the top 10 results, sorted by cumulative time
-    # (check sort_stats and print_stats docstrings)
-    ...
+    stats.sort_stats("cumulative").print_stats(10)
 
 
 def profile_with_line_profiler(filter, image, ncalls=3):
     """Profile filter(image) with line_profiler
 
     Statistics will be printed to stdout.
+    Compiled Cython filters are only measured
+    when built with line tracing (INSTAPY_CYTHON_PROFILE=1).
 
     Args:
 
@@ -43,45 +53,99 @@ def profile_with_line_profiler(filter, image, ncalls=3):
         image (ndarray): image to filter
         ncalls (int): number of repetitions to measure
     """
+    import line_profiler
+
     # create the LineProfiler
     profiler = line_profiler.LineProfiler()
     # tell it to measure the function we are given
-    profiler.add_function(filter)
+    # (not the wrapper from buffers.batched)
+    profiler.add_function(inspect.unwrap(filter))
     # Measure filter(image)
-    ...
+    for _ in range(ncalls):
+        profiler.runcall(filter, image)
     # print statistics
-    ...
+    profiler.print_stats(stream=sys.stdout)
 
 
-def run_profiles(profiler: str = "cprofile"):
+def run_profiles(
+    profiler: str = "cprofile",
+    implementations: list = None,
+    filter_names: list = None,
+    width: int = 640,
+    height: int = 480,
+):
     """Run profiles of every implementation
 
+    Implementations that aren't available (e.g. Cython not compiled) are skipped.
+
     Args:
 
         profiler (str): either 'line_profiler' or 'cprofile'
+        implementations (list): the implementations to profile (default: all)
+        filter_names (list): the filters to profile (default: all)
+        width, height (int): size of the random image to profile on
     """
+    from . import io
+    from .benchmark import filter_names as all_filter_names
+    from .benchmark import implementations as all_implementations
+
     # Select which profile function to use
     if profiler == "line_profiler":
-        profile_func = ...
+        profile_func = profile_with_line_profiler
     elif profiler.lower() == "cprofile":
-        profile_func = ...
+        profile_func = profile_with_cprofile
     else:
         raise ValueError(f"{profiler=} must be 'line_profiler' or 'cprofile'")
 
     # construct a random 640x480 image
-    image = ...
+    image = io.random_image(width, height)
 
-    filter_names = ...
-    implementations = ...
+    filter_names = filter_names or all_filter_names
+    implementations = implementations or all_implementations
     for filter_name in filter_names:
         for implementation in implementations:
+            try:
+                filter = in3110_instapy.get_filter(filter_name, implementation)
+            except ImportError as e:
+                print(f"Skipping {implementation} {filter_name}: {e}")
+                continue
             print(f"Profiling {implementation} {filter_name} with {profiler}:")
-            filter = in3110_instapy.get_filter(filter_name, implementation)  #
-            # call it once
+            # call it once, so compilation isn't measured
             filter(image)
             profile_func(filter, image)
 
 
+@contextmanager
+def stage_timer(timings: dict, stage: str):
+    """Add the time spent in a `with` block to timings[stage] (in seconds)
+
+    Does nothing if `timings` is None.
+    """
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def format_stage_timings(timings: dict, **info) -> str:
+    """The stage timings of filtering one file, as a line of JSON
+
+    Args:
+        timings (dict): seconds spent in each stage
+        **info: extra fields to include (e.g. file, implementation)
+    Returns:
+        str: JSON with the `info` fields, the 'stages' and their 'total'
+    """
+    record = dict(info)
+    record["stages"] = timings
+    record["total"] = sum(timings.values())
+    return json.dumps(record)
+
+
 if __name__ == "__main__":
     print("Begin cProfile")
     run_profiles("cprofile")
@@ -1,70 +1,119 @@
-"""pure Python implementation of image filters"""
+"""pure Python implementation of image filters
+
+The reference implementation, used where numba isn't installed.
+Each row is read as flat bytes (r, g, b, r, g, b, ...) through a memoryview,
+and the channels are iterated with zip instead of indexing the array pixel by pixel.
+The weighted channels are looked up in 256-entry tables of the same float products,
+so the results are exactly those of computing `0.21 * r + ...` for every pixel.
+
+Pass `trace=` to see each filtered row (e.g. `print_pixels`, the old debug output).
+The check for it is once per row, so there is no cost when it is off.
+"""
 from __future__ import annotations
 
+from typing import Callable
+
 import numpy as np
 
+from .buffers import batched, output_array, sepia_output
+
+gray_weights = (0.21, 0.72, 0.07)
+
+sepia_matrix = (
+    (0.393, 0.769, 0.189),
+    (0.349, 0.686, 0.168),
+    (0.272, 0.534, 0.131),
+)
+
+
+def _products(weight: float) -> list:
+    """weight * value for every uint8 value"""
+    return [value * weight for value in range(256)]
+
+
+_gray_tables = [_products(weight) for weight in gray_weights]
+_sepia_tables = [[_products(weight) for weight in row] for row in sepia_matrix]
+
 
-def python_color2gray(image: np.array) -> np.array:
+def _rows(image: np.array):
+    """Yield (y, row) for each row of `image`, as a memoryview of its bytes"""
+    data = memoryview(np.ascontiguousarray(image)).cast("B")
+    row_bytes = image.shape[1] * image.shape[2]
+    for y in range(image.shape[0]):
+        yield y, data[y * row_bytes : (y + 1) * row_bytes]
+
+
+def print_pixels(y: int, row: bytes, filtered: bytes) -> None:
+    """A `trace` hook printing each filtered pixel of a row"""
+    channels = len(filtered) // (len(row) // 3)
+    for x in range(len(row) // 3):
+        values = filtered[x * channels : (x + 1) * channels]
+        if channels == 1:
+            print(f"Pixel ({x}, {y}): gray={values[0]}")
+        else:
+            print(f"Pixel ({x}, {y}): R={values[0]}, G={values[1]}, B={values[2]}")
+
+
+@batched
+def python_color2gray(
+    image: np.array, out: np.array = None, trace: Callable = None
+) -> np.array:
     """Convert rgb pixel array to grayscale
 
     Args:
         image (np.array)
+        out (np.array): array to write the result into (optional)
+        trace (callable): trace(y, row, gray_row) is called with the bytes
+            of each row once filtered (optional)
     Returns:
         np.array: gray_image
     """
     height, width, _ = image.shape
-
-    # lager tomt array for å lagre bilde
-    gray_image = np.empty((height, width), dtype=np.uint8)
-
-    # itererer gjennom pixler for å sette riktig verdi
-    for i in range(height):
-        for j in range(width):
-            # henter ut verdi for nåværende pixel
-            red, green, blue = image[i, j]
-            # gjør om til grayscale
-            gray_value = int(0.21 * red + 0.72 * green + 0.07 * blue)
-
-            # lager grayscale verdier
-            gray_image[i, j] = gray_value
+    gray_image = output_array(out, (height, width))
+    red, green, blue = _gray_tables
+
+    for y, row in _rows(image):
+        gray_row = bytes(
+            [
+                int(red[r] + green[g] + blue[b])
+                for r, g, b in zip(row[0::3], row[1::3], row[2::3])
+            ]
+        )
+        gray_image[y] = np.frombuffer(gray_row, dtype=np.uint8)
+        if trace is not None:
+            trace(y, row, gray_row)
 
     return gray_image
 
 
-def python_color2sepia(image: np.array) -> np.array:
+@batched
+def python_color2sepia(
+    image: np.array, out: np.array = None, inplace: bool = False, trace: Callable = None
+) -> np.array:
     """Convert rgb pixel array to sepia
 
     Args:
         image (np.array)
+        out (np.array): array to write the result into (optional)
+        inplace (bool): write the result into `image` (optional)
+        trace (callable): trace(y, row, sepia_row) is called with the bytes
+            of each row once filtered (optional)
     Returns:
         np.array: sepia_image
     """
-    sepia_image = np.empty_like(image)
-    shape =  np.asarray((np.shape(image)))
-
-    sepia_matrix = [
-    [ 0.393, 0.769, 0.189],
-    [ 0.349, 0.686, 0.168],
-    [ 0.272, 0.534, 0.131],
-]
-    #itererer gjennom pixler for å sette riktig verdi ved hjelp av sepia matrix
-    for y in range(shape[0]):
-        for x in range(shape[1]):
-            r, g, b = image[y, x]
-            
-            red_channel = int(r * sepia_matrix[0][0] + g * sepia_matrix[0][1] + b * sepia_matrix[0][2])
-            green_channel = int(r * sepia_matrix[1][0] + g * sepia_matrix[1][1] + b * sepia_matrix[1][2])
-            blue_channel = int(r * sepia_matrix[2][0] + g * sepia_matrix[2][1] + b * sepia_matrix[2][2])
-       
-            red_channel = min(255, red_channel)
-            green_channel = min(255, green_channel)
-            blue_channel = min(255, blue_channel)
-
-            # Debug print statements
-            print(f"Pixel ({x}, {y}): R={red_channel}, G={green_channel}, B={blue_channel}")
-
-            sepia_image[y, x] = (red_channel, green_channel, blue_channel)
-
-
-    sepia_image = sepia_image.astype('uint8')
+    sepia_image = sepia_output(image, out, inplace)
+    height, width, _ = image.shape
+    (rr, rg, rb), (gr, gg, gb), (br, bg, bb) = _sepia_tables
+    sepia_row = bytearray(width * 3)
+
+    # each row is read before it is written, so `sepia_image` may be `image`
+    for y, row in _rows(image):
+        pixels = list(zip(row[0::3], row[1::3], row[2::3]))
+        sepia_row[0::3] = bytes([min(255, int(rr[r] + rg[g] + rb[b])) for r, g, b in pixels])
+        sepia_row[1::3] = bytes([min(255, int(gr[r] + gg[g] + gb[b])) for r, g, b in pixels])
+        sepia_row[2::3] = bytes([min(255, int(br[r] + bg[g] + bb[b])) for r, g, b in pixels])
+        sepia_image[y] = np.frombuffer(sepia_row, dtype=np.uint8).reshape(width, 3)
+        if trace is not None:
+            trace(y, row, bytes(sepia_row))
+
     return sepia_image
@@ -0,0 +1,320 @@
+"""registry of filter implementations (backends)
+
+Each backend declares what it supports:
+
+- 'module': the module with its filters, named `{backend}_{filter}`
+- 'filters': the filters it implements
+- 'dtypes': the image dtypes it accepts
+- 'out': whether its filters accept an `out` array
+- 'inplace': whether color2sepia accepts `inplace=True`
+- 'planar': whether its filters take `layout="planar"` themselves,
+  with kernels for planar (3, H, W) images; get_filter gives
+  the filters of the other backends interleaved views of planar images
+- 'parallel': how parallel.py runs it on several cores:
+  'threads' (releases the GIL), 'native' (parallel itself) or 'processes'
+- 'requires': modules that must be installed
+- 'compiled': whether the module must be a compiled extension (Cython)
+- 'exact': whether its results are byte-identical to the python implementation
+
+Other packages can add backends with `register_backend`.
+
+`implementation="auto"` picks the fastest available backend for the size
+of each image, from a short calibration benchmark that is run once
+per machine and cached on disk (see `calibrate`).
+Only exact backends are candidates, so 'auto' never changes the pixel values.
+"""
+from __future__ import annotations
+
+import importlib.machinery
+import importlib.util
+import json
+import math
+import os
+from pathlib import Path
+
+backends = {}
+
+# image sizes (width, height) timed by the calibration
+calibration_sizes = [(64, 48), (640, 480), (1920, 1080)]
+
+
+def register_backend(
+    name: str,
+    module: str = None,
+    filters: tuple = ("color2gray", "color2sepia"),
+    dtypes: tuple = ("uint8",),
+    out: bool = True,
+    inplace: bool = True,
+    planar: bool = False,
+    parallel: str = "threads",
+    requires: tuple = (),
+    compiled: bool = False,
+    exact: bool = False,
+    calibrate: bool = True,
+) -> dict:
+    """Register a filter implementation
+
+    Args:
+        name (str): the implementation name, as passed to get_filter
+        module (str): the module with the filters (default: in3110_instapy.{name}_filters)
+        filters (tuple): the filters it implements
+        dtypes (tuple): the image dtypes it accepts
+        out (bool): whether its filters accept an `out` array
+        inplace (bool): whether color2sepia accepts `inplace=True`
+        planar (bool): whether its filters take `layout="planar"` (planar kernels)
+        parallel (str): 'threads', 'native' or 'processes' (see parallel.py)
+        requires (tuple): modules that must be installed for it to work
+        compiled (bool): whether the module must be a compiled extension
+        exact (bool): whether its results are byte-identical to the python implementation
+        calibrate (bool): whether 'auto' may pick it (only if exact)
+    Returns:
+        dict: the backend
+    """
+    if parallel not in {"threads", "native", "processes"}:
+        raise ValueError(f"Unknown {parallel=}, must be 'threads', 'native' or 'processes'")
+    backend = {
+        "name": name,
+        "module": module or f"in3110_instapy.{name}_filters",
+        "filters": tuple(filters),
+        "dtypes": tuple(dtypes),
+        "out": out,
+        "inplace": inplace,
+        "planar": planar,
+        "parallel": parallel,
+        "requires": tuple(requires),
+        "compiled": compiled,
+        "exact": exact,
+        "calibrate": calibrate,
+    }
+    backends[name] = backend
+    return backend
+
+
+# the pure python implementation is far too slow for 'auto'
+register_backend("python", parallel="processes", exact=True, calibrate=False)
+register_backend("numpy", planar=True, exact=True)
+register_backend("numba", planar=True, parallel="native", requires=("numba",), exact=True)
+register_backend("integer", exact=True)
+register_backend("lut", exact=True)
+register_backend("cython", compiled=True, exact=True)
+
+
+def get_backend(name: str) -> dict:
+    """The registered backend `name`
+
+    Unregistered names are looked up by convention,
+    in the module in3110_instapy.{name}_filters.
+    """
+    if name in backends:
+        return backends[name]
+    return {
+        "name": name,
+        "module": f"in3110_instapy.{name}_filters",
+        "filters": ("color2gray", "color2sepia"),
+        "dtypes": ("uint8",),
+        "out": True,
+        "inplace": True,
+        "planar": False,
+        "parallel": "processes",
+        "requires": (),
+        "compiled": False,
+        "exact": False,
+        "calibrate": False,
+    }
+
+
+def is_available(name: str) -> bool:
+    """Whether a backend can be used on this machine, without importing it"""
+    backend = get_backend(name)
+    for module in backend["requires"]:
+        if importlib.util.find_spec(module) is None:
+            return False
+    spec = importlib.util.find_spec(backend["module"])
+    if spec is None:
+        return False
+    if backend["compiled"]:
+        # the pure-python source is importable too, but refuses to run
+        return spec.origin is not None and spec.origin.endswith(
+            tuple(importlib.machinery.EXTENSION_SUFFIXES)
+        )
+    return True
+
+
+def available_backends() -> list:
+    """The names of the backends that can be used on this machine"""
+    return [name for name in backends if is_available(name)]
+
+
+def supports(
+    name: str,
+    filter_name: str,
+    dtype=None,
+    out: bool = False,
+    inplace: bool = False,
+    planar: bool = False,
+) -> bool:
+    """Whether a backend supports a filter (and dtype, out array, inplace or planar kernels)"""
+    backend = get_backend(name)
+    if dtype is not None:
+        import numpy as np
+
+        dtype = np.dtype(dtype).name
+    return (
+        filter_name in backend["filters"]
+        and (dtype is None or dtype in backend["dtypes"])
+        and (not out or backend["out"])
+        and (not inplace or backend["inplace"])
+        and (not planar or backend["planar"])
+    )
+
+
+def candidates(filter_name: str) -> list:
+    """The implementations 'auto' chooses between for a filter
+
+    The available exact backends that allow calibration,
+    and their 'parallel-' variants on machines with several cpus.
+    """
+    names = [
+        name
+        for name in available_backends()
+        if backends[name]["exact"]
+        and backends[name]["calibrate"]
+        and supports(name, filter_name)
+    ]
+    if (os.cpu_count() or 1) > 1:
+        names += [f"parallel-{name}" for name in names if backends[name]["parallel"] != "native"]
+    return names
+
+
+def cache_dir() -> Path:
+    """The directory for cached calibrations
+
+    $INSTAPY_CACHE_DIR, or in3110_instapy in $XDG_CACHE_HOME (default: ~/.cache)
+    """
+    if os.environ.get("INSTAPY_CACHE_DIR"):
+        return Path(os.environ["INSTAPY_CACHE_DIR"])
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "in3110_instapy"
+
+
+def calibration_path() -> Path:
+    """The calibration file for this machine"""
+    from .benchmark import machine_fingerprint
+
+    return cache_dir() / f"calibration-{machine_fingerprint()}.json"
+
+
+def calibrate(filter_names: list = None, repeat: int = 3, save: bool = True) -> dict:
+    """Time every candidate implementation on a few image sizes
+
+    Args:
+        filter_names (list): the filters to calibrate (default: both)
+        repeat (int): timed calls per implementation and size (the fastest is kept)
+        save (bool): save the calibration to `calibration_path()`
+    Returns:
+        dict: 'candidates' (the implementations timed, by filter)
+            and 'seconds' by filter, pixel count and implementation
+    """
+    from . import get_filter, io
+    from .benchmark import time_calls
+
+    if filter_names is None:
+        filter_names = ["color2gray", "color2sepia"]
+    calibration = {"candidates": {}, "seconds": {}}
+    for filter_name in filter_names:
+        names = candidates(filter_name)
+        calibration["candidates"][filter_name] = names
+        calibration["seconds"][filter_name] = {}
+        for width, height in calibration_sizes:
+            image = io.random_image(width, height)
+            seconds = {}
+            for name in names:
+                filter_function = get_filter(filter_name, name)
+                seconds[name] = min(time_calls(filter_function, image, warmup=1, repeat=repeat))
+            calibration["seconds"][filter_name][str(width * height)] = seconds
+
+    if save:
+        path = calibration_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(calibration, indent=2))
+        os.replace(tmp_path, path)
+    return calibration
+
+
+# the calibration used by 'auto', loaded on first use
+_calibration = {}
+
+
+def load_calibration(filter_name: str) -> dict:
+    """The calibration for a filter, from disk, or calibrating if needed
+
+    A cached calibration is only used if the same implementations are
+    still available (e.g. not after Cython has been compiled).
+
+    Returns:
+        dict: seconds by pixel count and implementation
+    """
+    if filter_name in _calibration:
+        return _calibration[filter_name]
+    path = calibration_path()
+    calibration = None
+    if path.exists():
+        try:
+            calibration = json.loads(path.read_text())
+        except ValueError:
+            # a corrupt file, calibrate again
+            calibration = None
+    if (
+        calibration is None
+        or filter_name not in calibration["seconds"]
+        or calibration["candidates"].get(filter_name) != candidates(filter_name)
+    ):
+        calibration = calibrate()
+    _calibration.update(calibration["seconds"])
+    return _calibration[filter_name]
+
+
+def choose_implementation(filter_name: str, shape: tuple, calibration: dict = None) -> str:
+    """The fastest implementation of a filter for an image of `shape`
+
+    Uses the calibrated size closest to the image's (in log pixel count).
+
+    Args:
+        filter_name (str): the filter
+        shape (tuple): the image shape
+        calibration (dict): seconds by pixel count and implementation
+            (default: load_calibration(filter_name))
+    Returns:
+        str: the implementation name
+    """
+    if calibration is None:
+        calibration = load_calibration(filter_name)
+    # the pixels of one image, or of all images in a (N, H, W, 3) stack
+    pixels = max(1, math.prod(shape) // 3)
+    closest = min(calibration, key=lambda size: abs(math.log(int(size) / pixels)))
+    seconds = calibration[closest]
+    return min(seconds, key=seconds.get)
+
+
+def auto_filter(filter_name: str, workers: int = None):
+    """Return a filter function that runs the fastest implementation for each image
+
+    Args:
+        filter_name (str): the filter ('color2gray' or 'color2sepia')
+        workers (int): if given, the chosen implementation runs
+            in parallel on this many cores (as 'parallel-{implementation}')
+    Returns:
+        filter_function (function):
+            takes an image and returns the filtered image
+    """
+    from . import get_filter
+
+    def filter_function(image, *args, **kwargs):
+        implementation = choose_implementation(filter_name, image.shape)
+        if workers and not implementation.startswith("parallel-"):
+            implementation = f"parallel-{implementation}"
+        return get_filter(filter_name, implementation, workers=workers)(image, *args, **kwargs)
+
+    filter_function.__name__ = f"auto_{filter_name}"
+    return filter_function
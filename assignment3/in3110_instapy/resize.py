@@ -0,0 +1,78 @@
+"""downscaling images
+
+Downscaling averages the pixels each output pixel covers (box/area filter).
+Integer factors are averaged with NumPy, by reshaping the image into blocks;
+other factors use PIL's box filter.
+"""
+from __future__ import annotations
+
+import numpy as np
+from PIL import Image
+
+
+def scaled_size(width: int, height: int, factor: float) -> tuple:
+    """The (width, height) of an image downscaled by `factor`"""
+    if factor < 1:
+        raise ValueError(f"Only downscaling is supported, got {factor=}")
+    return max(1, int(width / factor)), max(1, int(height / factor))
+
+
+def box_average(image: np.array, factor: int) -> np.array:
+    """Downscale by an integer factor, averaging factor x factor blocks
+
+    Rows and columns that don't fill a whole block are dropped.
+
+    Args:
+        image (np.array): (height, width, 3) or (height, width) uint8 image
+        factor (int): the downscaling factor
+    Returns:
+        np.array: the downscaled image
+    """
+    height, width = image.shape[0] // factor, image.shape[1] // factor
+    blocks = image[: height * factor, : width * factor].reshape(
+        (height, factor, width, factor) + image.shape[2:]
+    )
+    total = blocks.sum(axis=(1, 3), dtype=np.uint32)
+    # round to nearest
+    area = factor * factor
+    total += area // 2
+    total //= area
+    return total.astype(np.uint8)
+
+
+def resize_area(image: np.array, size: tuple) -> np.array:
+    """Downscale an image to `size` = (width, height), averaging areas
+
+    Args:
+        image (np.array): (height, width, 3) or (height, width) uint8 image
+        size (tuple): the (width, height) to downscale to
+    Returns:
+        np.array: the downscaled image
+    """
+    width, height = size
+    if image.shape[:2] == (height, width):
+        return image
+    factor = image.shape[0] // height
+    if image.shape[:2] == (height * factor, width * factor):
+        return box_average(image, factor)
+    resized = Image.fromarray(np.ascontiguousarray(image)).resize(
+        size, Image.Resampling.BOX
+    )
+    return np.asarray(resized)
+
+
+def downscale(image: np.array, factor: float) -> np.array:
+    """Downscale an image by `factor`, averaging areas
+
+    Args:
+        image (np.array): (height, width, 3) or (height, width) uint8 image
+        factor (float): the downscaling factor (>= 1)
+    Returns:
+        np.array: the downscaled image
+    """
+    if factor == 1:
+        return image
+    size = scaled_size(image.shape[1], image.shape[0], factor)
+    if float(factor).is_integer() and factor <= min(image.shape[:2]):
+        return box_average(image, int(factor))
+    return resize_area(image, size)
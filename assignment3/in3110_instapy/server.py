@@ -0,0 +1,395 @@
+"""HTTP service filtering uploaded images
+
+Run with `instapy serve`. Endpoints:
+
+- `POST /color2gray` and `POST /color2sepia`: the body is an image file,
+  the response is the filtered image (PNG, or `?format=jpeg`, etc.,
+  with `?quality=` for JPEG and WebP).
+  `?implementation=numba` selects the implementation, one of the
+  available backends (see registry.py) or the server's default.
+- `GET /healthz`: 200 while the server is running
+- `GET /readyz`: 200 once the filters are loaded (and compiled),
+  503 before that, or when the server is at its limit of pending requests
+- `GET /metrics`: the filter metrics, in the Prometheus text format
+
+Decoding, filtering and encoding run in a thread pool, off the event loop.
+Concurrent requests for the same filter and image size are batched:
+their images are stacked, shape (N, H, W, 3), and filtered in one call,
+which costs less than many small calls.
+At most `max_pending` requests are handled at a time;
+more are rejected right away with 503 and a Retry-After header,
+instead of queueing without bound.
+
+Only what's needed for this service is implemented of HTTP/1.1
+(Content-Length bodies, keep-alive), with no dependencies.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import io as pyio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+from PIL import Image
+
+from . import get_filter, io, metrics, registry
+
+filter_names = ["color2gray", "color2sepia"]
+
+# image formats that can be asked for with ?format=, and their content type
+content_types = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "bmp": "image/bmp",
+    "tiff": "image/tiff",
+}
+
+
+class HTTPError(Exception):
+    """An error response"""
+
+    def __init__(self, status: HTTPStatus, message: str = None, headers: dict = None):
+        self.status = status
+        self.message = message or status.phrase
+        self.headers = headers or {}
+        super().__init__(self.message)
+
+
+def decode_upload(data: bytes) -> np.array:
+    """Decode an uploaded image file to an rgb array"""
+    try:
+        image = Image.open(pyio.BytesIO(data))
+        return np.asarray(image.convert("RGB"))
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"Can't decode image: {e}")
+
+
+def encode_image(array: np.array, format: str = "png", **options) -> bytes:
+    """Encode an image array as an image file
+
+    Args:
+        array (np.array): the image
+        format (str): the image format
+        **options: encoder options, passed to io.write_image
+    """
+    buffer = pyio.BytesIO()
+    io.write_image(array, buffer, format=format, **options)
+    return buffer.getvalue()
+
+
+def filter_batch(filter_function, images: list) -> list:
+    """Filter several images of the same size with one call
+
+    The images are stacked, filtered, and split again.
+    """
+    if len(images) == 1:
+        return [filter_function(images[0])]
+    return list(filter_function(np.stack(images)))
+
+
+class FilterService:
+    """The state of the service: filters, batches waiting to run and limits"""
+
+    def __init__(
+        self,
+        implementation: str = "numpy",
+        max_pending: int = 64,
+        max_batch: int = 16,
+        batch_delay: float = 0.002,
+        max_body_bytes: int = 64 * 2**20,
+        threads: int = None,
+    ):
+        """
+        Args:
+            implementation (str): the default implementation
+            max_pending (int): requests handled at a time, more get 503
+            max_batch (int): the most images filtered in one call
+            batch_delay (float): seconds to wait for more images of the same size
+            max_body_bytes (int): the largest upload accepted
+            threads (int): threads decoding, filtering and encoding
+                (default: ThreadPoolExecutor's default)
+        """
+        self.implementation = implementation
+        # the implementations clients may choose,
+        # not e.g. 'parallel-' ones that start process pools
+        self.implementations = set(registry.available_backends()) | {implementation}
+        self.max_pending = max_pending
+        self.max_batch = max_batch
+        self.batch_delay = batch_delay
+        self.max_body_bytes = max_body_bytes
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="instapy")
+        self.ready = False
+        self.pending = 0
+        self.stats = {"requests": 0, "rejected": 0, "batches": 0, "batched_images": 0}
+        # images waiting to be filtered, by (filter, implementation, shape)
+        self._batches = {}
+
+    def get_filter(self, filter_name: str, implementation: str):
+        """The (instrumented) filter function"""
+        return get_filter(filter_name, implementation, instrument=True)
+
+    async def load_filter(self, filter_name: str, implementation: str):
+        """The filter function, imported (and compiled) in the thread pool
+
+        Importing a backend can take seconds (e.g. compiling the numba kernels),
+        which mustn't block the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self.get_filter, filter_name, implementation
+        )
+
+    async def warm_up(self, implementations: list = None) -> None:
+        """Load (and compile) the filters, then report ready"""
+        loop = asyncio.get_running_loop()
+        image = np.zeros((8, 8, 3), dtype=np.uint8)
+        for implementation in implementations or [self.implementation]:
+            for filter_name in filter_names:
+                filter_function = await self.load_filter(filter_name, implementation)
+                await loop.run_in_executor(self.executor, filter_function, image)
+        # the warm-up calls shouldn't count in the metrics
+        metrics.reset()
+        self.ready = True
+
+    async def filter_image(self, filter_name: str, implementation: str, image: np.array):
+        """Filter an image, batched with other images of the same size"""
+        loop = asyncio.get_running_loop()
+        key = (filter_name, implementation, image.shape)
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = self._batches[key] = []
+            loop.call_later(self.batch_delay, self._run_batch, key, batch)
+        future = loop.create_future()
+        batch.append((image, future))
+        if len(batch) >= self.max_batch:
+            self._run_batch(key, batch)
+        return await future
+
+    def _run_batch(self, key: tuple, batch: list) -> None:
+        """Start filtering a batch in the thread pool"""
+        if self._batches.get(key) is not batch:
+            # already started, when it filled up
+            return
+        del self._batches[key]
+        filter_name, implementation, _ = key
+        # already loaded by handle_filter, so this is a cache lookup
+        filter_function = self.get_filter(filter_name, implementation)
+        images = [image for image, _ in batch]
+        self.stats["batches"] += 1
+        self.stats["batched_images"] += len(images)
+        task = asyncio.get_running_loop().run_in_executor(
+            self.executor, filter_batch, filter_function, images
+        )
+
+        def done(task):
+            cancelled = task.cancelled()
+            error = None if cancelled else task.exception()
+            for i, (_, future) in enumerate(batch):
+                if future.done():
+                    continue
+                if cancelled:
+                    future.cancel()
+                elif error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(task.result()[i])
+
+        task.add_done_callback(done)
+
+    async def handle_filter(self, filter_name: str, query: dict, body: bytes) -> tuple:
+        """Decode, filter and encode one upload
+
+        Returns:
+            tuple: (content type, encoded image)
+        """
+        implementation = query.get("implementation", self.implementation)
+        if implementation not in self.implementations:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Unknown implementation {implementation!r}")
+        format = query.get("format", "png").lower()
+        if format == "jpg":
+            format = "jpeg"
+        if format not in content_types:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Unknown format {format!r}")
+        options = {}
+        if "quality" in query:
+            try:
+                options["quality"] = int(query["quality"])
+            except ValueError:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, f"Bad quality {query['quality']!r}")
+        try:
+            await self.load_filter(filter_name, implementation)
+        except ImportError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Unknown implementation {implementation!r}")
+
+        loop = asyncio.get_running_loop()
+        image = await loop.run_in_executor(self.executor, decode_upload, body)
+        filtered = await self.filter_image(filter_name, implementation, image)
+        encode = functools.partial(encode_image, filtered, format, **options)
+        data = await loop.run_in_executor(self.executor, encode)
+        return content_types[format], data
+
+    def check_available(self) -> None:
+        """Raise 503 if the filters aren't loaded yet, or too many requests are pending"""
+        if not self.ready:
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "Not ready", {"Retry-After": "1"})
+        if self.pending >= self.max_pending:
+            self.stats["rejected"] += 1
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "Too many requests", {"Retry-After": "1"})
+
+    async def handle(self, method: str, path: str, body: bytes) -> tuple:
+        """Handle one request
+
+        Returns:
+            tuple: (status, content type, body, extra headers)
+        """
+        url = urlsplit(path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        route = url.path.rstrip("/") or "/"
+
+        if route == "/healthz":
+            return HTTPStatus.OK, "text/plain", b"ok\n", {}
+        if route == "/readyz":
+            if self.ready and self.pending < self.max_pending:
+                return HTTPStatus.OK, "text/plain", b"ready\n", {}
+            return HTTPStatus.SERVICE_UNAVAILABLE, "text/plain", b"not ready\n", {}
+        if route == "/metrics":
+            return HTTPStatus.OK, "text/plain; version=0.0.4", metrics.to_prometheus().encode(), {}
+        if route.lstrip("/") not in filter_names:
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+        if method != "POST":
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, headers={"Allow": "POST"})
+        self.check_available()
+
+        self.pending += 1
+        try:
+            content_type, data = await self.handle_filter(route.lstrip("/"), query, body)
+        finally:
+            self.pending -= 1
+        return HTTPStatus.OK, content_type, data, {}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve the requests of one connection (keep-alive)"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                keep_alive = await self._serve_one(request_line, reader, writer)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _serve_one(self, request_line: bytes, reader, writer) -> bool:
+        """Read one request, and write its response
+
+        Returns:
+            bool: whether to keep the connection open
+        """
+        start = time.perf_counter()
+        try:
+            method, path, version = request_line.decode("latin-1").split()
+        except ValueError:
+            self._respond(writer, HTTPStatus.BAD_REQUEST, "text/plain", b"Bad request\n")
+            return False
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if not line.strip():
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+        self.stats["requests"] += 1
+        try:
+            try:
+                length = int(headers.get("content-length", 0))
+            except ValueError:
+                length = -1
+            if length < 0:
+                # the body can't be skipped, so close the connection
+                keep_alive = False
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Bad Content-Length")
+            if length > self.max_body_bytes:
+                # don't read it, and close the connection
+                keep_alive = False
+                raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+            if method == "POST" and urlsplit(path).path.strip("/") in filter_names:
+                try:
+                    self.check_available()
+                except HTTPError:
+                    # rejected before reading the upload, so close the connection
+                    keep_alive = False
+                    raise
+            body = await reader.readexactly(length) if length else b""
+            status, content_type, data, extra = await self.handle(method, path, body)
+        except HTTPError as e:
+            status, content_type, extra = e.status, "text/plain", e.headers
+            data = f"{e.message}\n".encode()
+        except Exception as e:
+            status, content_type, extra = HTTPStatus.INTERNAL_SERVER_ERROR, "text/plain", {}
+            data = f"{type(e).__name__}: {e}\n".encode()
+        extra = dict(extra, **{"X-Elapsed-Seconds": f"{time.perf_counter() - start:.6f}"})
+        self._respond(writer, status, content_type, data, extra, keep_alive)
+        return keep_alive
+
+    def _respond(self, writer, status, content_type, data, headers=None, keep_alive=False):
+        """Write a response"""
+        lines = [
+            f"HTTP/1.1 {status.value} {status.phrase}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(data)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + data)
+
+
+async def start_server(
+    host: str = "127.0.0.1", port: int = 8000, warm_up: bool = True, **options
+) -> tuple:
+    """Start the service (in the running event loop)
+
+    Args:
+        host (str): the address to listen on
+        port (int): the port to listen on (0: any free port)
+        warm_up (bool): load the filters before accepting requests
+        **options: passed to FilterService
+    Returns:
+        tuple: (asyncio.Server, FilterService)
+    """
+    service = FilterService(**options)
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    if warm_up:
+        # ready once loaded, /healthz answers in the meantime
+        asyncio.get_running_loop().create_task(service.warm_up())
+    else:
+        service.ready = True
+    return server, service
+
+
+def serve(host: str = "127.0.0.1", port: int = 8000, **options) -> None:
+    """Run the service until interrupted"""
+
+    async def main():
+        server, service = await start_server(host, port, **options)
+        address = server.sockets[0].getsockname()
+        url = f"http://{address[0]}:{address[1]}"
+        print(json.dumps({"listening": url, "implementation": service.implementation}), flush=True)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,68 @@
+"""stacks of same-size images, filtered with one call
+
+Every filter accepts a stack of images, shape (N, H, W, 3),
+which costs less than N calls when the images are small.
+`pack_images` groups the images of a list by size
+into contiguous stacks, and `filter_images` filters a list
+of images of any sizes a stack at a time.
+"""
+from __future__ import annotations
+
+from typing import Callable
+
+import numpy as np
+
+
+def pack_images(images: list, max_batch: int = None) -> list:
+    """Group same-size images into contiguous stacks
+
+    Args:
+        images (list): rgb image arrays, of any sizes
+        max_batch (int): the most images in a stack (default: no limit)
+    Returns:
+        list: (indices, stack) tuples, where `stack` has shape (N, H, W, 3)
+            and `indices` are the positions of its images in `images`,
+            in the order the sizes first appear
+    """
+    groups = {}
+    for i, image in enumerate(images):
+        groups.setdefault((image.shape, image.dtype.str), []).append(i)
+
+    packed = []
+    for indices in groups.values():
+        step = max_batch or len(indices)
+        for start in range(0, len(indices), step):
+            chunk = indices[start : start + step]
+            packed.append((chunk, np.stack([images[i] for i in chunk])))
+    return packed
+
+
+def unpack_images(packed: list, count: int) -> list:
+    """Split filtered stacks into a list of images, in their original order
+
+    Args:
+        packed (list): (indices, stack) tuples, as from pack_images
+        count (int): the number of images
+    Returns:
+        list: the images, views of the stacks
+    """
+    images = [None] * count
+    for indices, stack in packed:
+        for i, image in zip(indices, stack):
+            images[i] = image
+    return images
+
+
+def filter_images(filter_function: Callable, images: list, max_batch: int = None) -> list:
+    """Filter a list of images, one call per stack of same-size images
+
+    Args:
+        filter_function (callable): the filter, from get_filter
+        images (list): rgb image arrays, of any sizes
+        max_batch (int): the most images filtered in one call (default: no limit)
+    Returns:
+        list: the filtered images, in the same order
+    """
+    packed = pack_images(images, max_batch)
+    filtered = [(indices, filter_function(stack)) for indices, stack in packed]
+    return unpack_images(filtered, len(images))
@@ -1,14 +1,15 @@
 from __future__ import annotations
 
+import functools
+import json
+import subprocess
+import sys
+import textwrap
 import time
 from typing import Callable
-from PIL import Image
 
 from . import get_filter, io
 
-from .numpy_filters import numpy_color2gray
-from .numba_filters import numba_color2gray
-
 
 def time_one(filter_function: Callable, *arguments, calls: int = 3) -> float:
     """Return the time for one call
@@ -37,52 +38,94 @@ def time_one(filter_function: Callable, *arguments, calls: int = 3) -> float:
     return total_time / calls
 
 
+def time_cold_start(filter_name: str, implementation: str, filename: str) -> float:
+    """Return the time for the first call in a fresh process
+
+    This includes importing the implementation and any compilation
+    (or loading from the compilation cache), which `time_one` doesn't measure.
+
+    Args:
+        filter_name (str): the name of the filter
+        implementation (str): the name of the implementation
+        filename (str): the image file to use
+    Returns:
+        time (float):
+            The time (in seconds) to import and run the filter once
+    """
+    code = textwrap.dedent(
+        f"""
+        import json, time
+        from in3110_instapy import io
+        image = io.read_image({str(filename)!r})
+        start = time.perf_counter()
+        from in3110_instapy import get_filter
+        get_filter({filter_name!r}, {implementation!r})(image)
+        print(json.dumps(time.perf_counter() - start))
+        """
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    # the last line, in case the filter prints anything
+    return json.loads(result.stdout.splitlines()[-1])
+
+
 def make_reports(filename: str = "test/rain.jpg", calls: int = 3):
     """
     Make timing reports for all implementations and filters,
     run for a given image.
 
+    The timings are measured by `benchmark.run_benchmarks`,
+    and also written as JSON to timing-report.json.
+
     Args:
         filename (str): the image file to use
+        calls (int): the number of timed calls (after one warmup call)
     """
+    from . import benchmark
+
     # Load the image
     image = io.read_image(filename)
     height, width, _ = image.shape
     print(f"Timing performed using {filename}: {width}x{height}")
 
-    # Define the filter names and implementations
-    filter_names = ["color2gray", "color2sepia"]
-    implementations = ["numpy", "numba"]
+    report = benchmark.run_benchmarks(
+        sizes=[],
+        images={filename: image},
+        max_python_pixels=None,
+        warmup=1,
+        repeat=calls,
+        verbose=False,
+    )
+    benchmark.write_json(report, "timing-report.json")
 
     report_lines = []  # To store lines for the report
+    for filter_name in benchmark.filter_names:
+        results = [r for r in report["results"] if r["filter"] == filter_name]
+        reference = [r for r in results if r["implementation"] == "python"]
+        reference_time = reference[0]["median"] if reference else None
+        if reference_time is not None:
+            report_lines.append(
+                f"Reference (pure Python) filter time {filter_name}: {reference_time:.3f}s ({calls=})"
+            )
 
-    for filter_name in filter_names:
-        # Get the reference filter function
-        reference_filter = get_filter(filter_name, "python")
-        if reference_filter is None:
-            continue
-
-        # Time the reference implementation
-        reference_time = time_one(reference_filter, image, calls=calls)
-        report_lines.append(
-            f"Reference (pure Python) filter time {filter_name}: {reference_time:.3f}s ({calls=})"
-        )
-
-        # Iterate through the implementations
-        for implementation in implementations:
-            filter_function = get_filter(filter_name, implementation)
-            if filter_function is None:
+        for result in results:
+            implementation = result["implementation"]
+            if implementation == "python":
                 continue
-
-            # Time the filter
-            filter_time = time_one(filter_function, image, calls=calls)
-
-            # Calculate speedup relative to the reference (pure Python) implementation
-            speedup = reference_time / filter_time
-
+            filter_time = result["median"]
+            # speedup relative to the reference (pure Python) implementation
+            speedup = f" (speedup={reference_time / filter_time:.2f}x)" if reference_time else ""
             report_lines.append(
-                f"Timing: {implementation} {filter_name}: {filter_time:.6f}s (speedup={speedup:.2f}x)"
+                f"Timing: {implementation} {filter_name}: {filter_time:.6f}s{speedup}"
+                f" p95={result['p95']:.6f}s, {result['megapixels_per_second']:.1f} MP/s"
             )
+            if not implementation.startswith("parallel-"):
+                # Time the first call in a new process (import, compilation)
+                cold_time = time_cold_start(filter_name, implementation, filename)
+                report_lines.append(
+                    f"Cold start: {implementation} {filter_name}: {cold_time:.3f}s (import and first call)"
+                )
 
     # Save the report to a file
     with open("timing-report.txt", "w") as report_file:
@@ -91,7 +134,91 @@ def make_reports(filename: str = "test/rain.jpg", calls: int = 3):
             report_file.write(line + "\n")
 
 
+def numba_scaling_report(filename: str = "test/rain.jpg", calls: int = 3):
+    """
+    Report how the numba filters scale with the number of threads,
+    from 1 thread up to all available threads.
+
+    Args:
+        filename (str): the image file to use
+        calls (int): the number of calls to average over
+    """
+    import numba
+
+    image = io.read_image(filename)
+    height, width, _ = image.shape
+    max_threads = numba.config.NUMBA_NUM_THREADS
+    # powers of two, and all threads
+    thread_counts = [2**n for n in range(max_threads.bit_length()) if 2**n < max_threads]
+    thread_counts.append(max_threads)
+
+    report_lines = [f"Numba thread scaling using {filename}: {width}x{height}", ""]
+    previous = numba.get_num_threads()
+    try:
+        for filter_name in ["color2gray", "color2sepia"]:
+            filter_function = get_filter(filter_name, "numba")
+            # compile (or load from cache) before timing
+            filter_function(image)
+            single_time = None
+            for threads in thread_counts:
+                numba.set_num_threads(threads)
+                filter_time = time_one(filter_function, image, calls=calls)
+                if single_time is None:
+                    single_time = filter_time
+                report_lines.append(
+                    f"numba {filter_name} {threads=}: {filter_time:.6f}s (speedup={single_time / filter_time:.2f}x)"
+                )
+    finally:
+        numba.set_num_threads(previous)
+
+    for line in report_lines:
+        print(line)
+    return report_lines
+
+
+def lut_report(
+    filename: str = "test/rain.jpg",
+    sizes: tuple = ((1920, 1080), (6000, 4000)),
+    calls: int = 3,
+):
+    """
+    Compare the lookup-table filters with the numpy (einsum) filters,
+    on a given image and on random images of the given sizes.
+
+    Args:
+        filename (str): the image file to use
+        sizes (tuple): (width, height) of the random images
+        calls (int): the number of calls to average over
+    """
+    images = {filename: io.read_image(filename)}
+    for width, height in sizes:
+        images[f"random {width}x{height}"] = io.random_image(width, height)
+
+    report_lines = []
+    for name, image in images.items():
+        height, width, _ = image.shape
+        report_lines.append(f"Lookup tables vs numpy using {name}: {width}x{height}")
+        for filter_name in ["color2gray", "color2sepia"]:
+            numpy_filter = get_filter(filter_name, "numpy")
+            if filter_name == "color2sepia":
+                # the einsum path, not the default low-memory bands
+                numpy_filter = functools.partial(numpy_filter, low_memory=False)
+            lut_filter = get_filter(filter_name, "lut")
+            # build the tables before timing
+            lut_filter(image[:1])
+            numpy_time = time_one(numpy_filter, image, calls=calls)
+            lut_time = time_one(lut_filter, image, calls=calls)
+            report_lines.append(
+                f"{filter_name}: numpy {numpy_time:.6f}s, lut {lut_time:.6f}s (speedup={numpy_time / lut_time:.2f}x)"
+            )
+
+    for line in report_lines:
+        print(line)
+    return report_lines
+
 
 if __name__ == "__main__":
     # run as `python -m in3110_instapy.timing`
     make_reports()
+    numba_scaling_report()
+    lut_report()
@@ -1,38 +1,68 @@
+import os
+import sys
+
 from setuptools import setup
 
-# IN4110: set to True when you are ready for the Cython implementation
-use_cython = False
+# build the Cython implementation (set INSTAPY_CYTHON=0 to skip it)
+use_cython = os.environ.get("INSTAPY_CYTHON", "1") != "0"
+# profiling build (INSTAPY_CYTHON_PROFILE=1) enables line tracing,
+# which slows down the compiled code, so it is off for release builds
+cython_profile = os.environ.get("INSTAPY_CYTHON_PROFILE", "0") == "1"
 
 
 if use_cython:
     from Cython.Build import cythonize
     from setuptools import Extension
 
+    # keep float operations in source order (no fused multiply-add),
+    # so results match the python implementation exactly
+    extra_compile_args = ["-O3", "-ffp-contract=off"]
+    extra_link_args = []
+    if sys.platform == "darwin":
+        # Apple clang doesn't ship OpenMP, prange runs serially
+        pass
+    elif sys.platform == "win32":
+        extra_compile_args = ["/O2", "/fp:precise", "/openmp"]
+    else:
+        extra_compile_args.append("-fopenmp")
+        extra_link_args.append("-fopenmp")
+
+    define_macros = []
+    if cython_profile:
+        define_macros = [
+            ("CYTHON_TRACE", "1"),
+            ("CYTHON_TRACE_NOGIL", "1"),
+        ]
+
     extensions = [
         # A single module that is stand alone and has no special requisites
         Extension(
             "in3110_instapy.cython_filters",
             ["in3110_instapy/cython_filters.py"],
-            # enable profiling
-            define_macros=[
-                ("CYTHON_TRACE", "1"),
-                ("CYTHON_TRACE_NOGIL", "1"),
-            ],
+            define_macros=define_macros,
+            extra_compile_args=extra_compile_args,
+            extra_link_args=extra_link_args,
         ),
     ]
     cython_directives = {
         "language_level": 3,
-        # enable profiling
-        "binding": True,
-        "profile": True,
-        "linetrace": True,
-        # you may want to add some compiler directives here
-        # to optimize compilation
+        "boundscheck": False,
+        "wraparound": False,
+        "initializedcheck": False,
+        "cdivision": True,
     }
+    if cython_profile:
+        cython_directives.update(
+            {
+                "binding": True,
+                "profile": True,
+                "linetrace": True,
+            }
+        )
     ext_modules = cythonize(
         extensions,
         compiler_directives=cython_directives,
-        annotate=True,
+        annotate=cython_profile,
     )
 else:
     ext_modules = []
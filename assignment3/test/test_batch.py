@@ -0,0 +1,73 @@
+import numpy.testing as nt
+
+import in3110_instapy
+from in3110_instapy import io
+from in3110_instapy.batch import find_images, run_batch
+
+
+def make_images(directory, n=3):
+    directory.mkdir()
+    images = {}
+    for i in range(n):
+        image = io.random_image(40, 30)
+        io.write_image(image, directory / f"image{i}.png")
+        images[f"image{i}.png"] = image
+    # not an image, should be ignored
+    (directory / "notes.txt").write_text("not an image")
+    return images
+
+
+def test_find_images(tmp_path):
+    make_images(tmp_path / "in")
+
+    assert [p.name for p in find_images(tmp_path / "in")] == ["image0.png", "image1.png", "image2.png"]
+    assert [p.name for p in find_images(str(tmp_path / "in" / "image[01].png"))] == ["image0.png", "image1.png"]
+
+
+def test_run_batch(tmp_path):
+    images = make_images(tmp_path / "in")
+    out_dir = tmp_path / "out"
+
+    stats = run_batch(tmp_path / "in", out_dir, "numpy", "color2sepia", processes=2)
+
+    assert stats["filtered"] == 3
+    assert stats["skipped"] == 0
+    color2sepia = in3110_instapy.get_filter("color2sepia", "numpy")
+    for name, image in images.items():
+        nt.assert_array_equal(io.read_image(out_dir / name), color2sepia(image))
+
+    # outputs are up to date now
+    stats = run_batch(tmp_path / "in", out_dir, "numpy", "color2sepia", processes=2)
+    assert stats["filtered"] == 0
+    assert stats["skipped"] == 3
+
+    stats = run_batch(tmp_path / "in", out_dir, "numpy", "color2sepia", processes=2, force=True)
+    assert stats["filtered"] == 3
+
+
+def test_run_batch_recursive(tmp_path):
+    (tmp_path / "in").mkdir()
+    first = make_images(tmp_path / "in" / "a", n=1)
+    second = make_images(tmp_path / "in" / "b", n=1)
+    out_dir = tmp_path / "out"
+
+    stats = run_batch(str(tmp_path / "in" / "**" / "*.png"), out_dir, "numpy", "color2gray", processes=1)
+
+    # same names in different directories don't overwrite each other
+    assert stats["filtered"] == 2
+    color2gray = in3110_instapy.get_filter("color2gray", "numpy")
+    nt.assert_array_equal(io.read_image(out_dir / "a" / "image0.png"), color2gray(first["image0.png"]))
+    nt.assert_array_equal(io.read_image(out_dir / "b" / "image0.png"), color2gray(second["image0.png"]))
+
+
+def test_run_batch_errors(tmp_path):
+    make_images(tmp_path / "in", n=2)
+    (tmp_path / "in" / "broken.png").write_bytes(b"not a png")
+
+    stats = run_batch(tmp_path / "in", tmp_path / "out", "numpy", "color2gray", processes=1)
+
+    assert stats["filtered"] == 2
+    assert stats["failed"] == 1
+    (file, message), = stats["errors"]
+    assert file.endswith("broken.png")
+    assert (tmp_path / "out" / "image1.png").exists()
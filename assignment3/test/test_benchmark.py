@@ -0,0 +1,146 @@
+import csv
+import json
+from pathlib import Path
+
+import pytest
+
+from in3110_instapy import benchmark
+
+
+def test_summarize():
+    stats = benchmark.summarize([0.3, 0.1, 0.2, 0.4, 0.5], pixels=1_000_000)
+    assert stats["min"] == 0.1
+    assert stats["median"] == 0.3
+    assert 0.4 <= stats["p95"] <= 0.5
+    assert stats["megapixels_per_second"] == pytest.approx(1 / 0.3)
+
+
+def test_peak_memory(image):
+    def allocate(image):
+        return image.astype(float)
+
+    assert benchmark.peak_memory(allocate, image) >= image.size * 8
+
+
+def test_run_benchmarks(image, tmp_path):
+    report = benchmark.run_benchmarks(
+        sizes=["thumbnail"],
+        implementations=["python", "numpy", "parallel-numpy"],
+        images={"image": image},
+        max_python_pixels=160 * 120,
+        warmup=0,
+        repeat=2,
+        verbose=False,
+    )
+    assert report["machine"]["cpu_count"]
+    results = report["results"]
+    # python is skipped on the larger image
+    assert len(results) == 2 * (3 + 2)
+    for result in results:
+        assert len(result["times"]) == 2
+        assert result["min"] <= result["median"] <= result["p95"]
+        assert result["peak_memory_bytes"] > 0
+
+    json_file = tmp_path / "bench.json"
+    csv_file = tmp_path / "bench.csv"
+    benchmark.write_json(report, json_file)
+    benchmark.write_csv(report, csv_file)
+    assert json.loads(json_file.read_text()) == report
+    with open(csv_file) as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == len(results)
+    assert list(rows[0]) == benchmark.result_fields
+
+
+def test_unavailable_skipped(image):
+    report = benchmark.run_benchmarks(
+        sizes=[],
+        implementations=["numpy", "nosuch"],
+        images={"image": image},
+        repeat=1,
+        memory=False,
+        verbose=False,
+    )
+    assert {r["implementation"] for r in report["results"]} == {"numpy"}
+
+
+def test_machine_fingerprint():
+    info = benchmark.machine_info()
+    # the cpu model, not just the architecture
+    assert info["processor"] == benchmark.cpu_model()
+    assert benchmark.machine_fingerprint(dict(info, processor="Other CPU")) != benchmark.machine_fingerprint(info)
+    assert benchmark.machine_fingerprint(info) == benchmark.machine_fingerprint()
+    assert benchmark.machine_fingerprint(dict(info, numpy="0.0")) != benchmark.machine_fingerprint(info)
+
+
+def test_mann_whitney_u():
+    # 2 of the 252 orderings of 5 + 5 values have U >= 24
+    u, p = benchmark.mann_whitney_u([5, 6, 7, 8, 9], [1, 2, 3, 4, 5.5])
+    assert u == 24
+    assert p == pytest.approx(2 / 252)
+
+    u, p = benchmark.mann_whitney_u([1, 2, 3], [4, 5, 6])
+    assert u == 0
+    assert p == 1
+
+    # ties use the normal approximation
+    u, p = benchmark.mann_whitney_u([2, 2, 3, 3] * 5, [1, 1, 2, 2] * 5)
+    assert p < 0.001
+    u, p = benchmark.mann_whitney_u([1, 2] * 5, [1, 2] * 5)
+    assert p > 0.4
+
+
+def test_compare_reports():
+    def report(times):
+        result = {"filter": "color2gray", "implementation": "numpy", "size": "s"}
+        result.update(width=1, height=1, times=times, median=sorted(times)[2])
+        return {"results": [result]}
+
+    baseline = report([1.0, 1.1, 1.0, 0.9, 1.0])
+    (same,) = benchmark.compare_reports(baseline, report([1.0, 0.9, 1.1, 1.0, 1.0]))
+    assert not same["regression"]
+    (slower,) = benchmark.compare_reports(baseline, report([2.0, 2.1, 2.2, 1.9, 2.0]))
+    assert slower["regression"]
+    assert slower["slowdown"] == pytest.approx(1)
+    # significant, but below the threshold
+    (small,) = benchmark.compare_reports(
+        baseline, report([1.2, 1.2, 1.2, 1.2, 1.2]), threshold=0.5
+    )
+    assert not small["regression"]
+
+
+def test_regression_gate(tmp_path, capsys):
+    # runs offline, on the test fixture
+    fixture = str(Path(__file__).parent / "rain.jpg")
+    args = [
+        "--sizes",
+        "--image",
+        fixture,
+        "--implementations",
+        "numpy",
+        "--filters",
+        "color2gray",
+        "--repeat",
+        "5",
+        "--no-memory",
+        "--baseline-dir",
+        str(tmp_path),
+    ]
+    with pytest.raises(SystemExit) as e:
+        benchmark.main(args + ["--compare"])
+    assert "No baseline" in str(e.value.code)
+
+    benchmark.main(args + ["--save-baseline"])
+    (path,) = tmp_path.glob("baseline-*.json")
+    assert path.name == f"baseline-{benchmark.machine_fingerprint()}.json"
+
+    # pretend the baseline was 10 times faster
+    baseline = json.loads(path.read_text())
+    for result in baseline["results"]:
+        result["times"] = [t / 10 for t in result["times"]]
+        result["median"] /= 10
+    path.write_text(json.dumps(baseline))
+    with pytest.raises(SystemExit) as e:
+        benchmark.main(args + ["--compare"])
+    assert e.value.code
+    assert "REGRESSION" in capsys.readouterr().out
@@ -1,10 +1,25 @@
 import numpy.testing as nt
-from in3110_instapy.cython_filters import cython_color2gray, cython_color2sepia
+import pytest
+
+cython_filters = pytest.importorskip("in3110_instapy.cython_filters")
+cython_color2gray = cython_filters.cython_color2gray
+cython_color2sepia = cython_filters.cython_color2sepia
 
 
 def test_color2gray(image, reference_gray):
-    ...
+    gray = cython_color2gray(image)
+
+    nt.assert_array_equal(gray, reference_gray)
 
 
 def test_color2sepia(image, reference_sepia):
-    ...
+    sepia = cython_color2sepia(image)
+
+    nt.assert_array_equal(sepia, reference_sepia)
+
+
+def test_read_only(image, reference_gray):
+    # const memoryviews accept read-only arrays
+    image.setflags(write=False)
+
+    nt.assert_array_equal(cython_color2gray(image), reference_gray)
@@ -0,0 +1,151 @@
+import io as pyio
+import threading
+
+import numpy as np
+import numpy.testing as nt
+import pytest
+from PIL import Image, ImageSequence
+
+from in3110_instapy import frames, get_filter
+from in3110_instapy.cli import main
+
+
+def random_frames(n=5, width=32, height=24):
+    return np.random.randint(0, 255, size=(n, height, width, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("filter_name", ["color2gray", "color2sepia"])
+def test_raw_stream(filter_name):
+    video = random_frames()
+    filter_function = get_filter(filter_name, "numpy")
+    output = pyio.BytesIO()
+    count = frames.filter_raw_stream(
+        filter_function,
+        32,
+        24,
+        input=pyio.BytesIO(video.tobytes()),
+        output=output,
+        gray=filter_name == "color2gray",
+    )
+    assert count == len(video)
+    expected = np.array([filter_function(frame) for frame in video])
+    result = np.frombuffer(output.getvalue(), dtype=np.uint8).reshape(expected.shape)
+    nt.assert_array_equal(result, expected)
+
+
+def test_raw_stream_rgb_output():
+    video = random_frames(3)
+    gray = get_filter("color2gray", "numpy")
+    output = pyio.BytesIO()
+    frames.filter_raw_stream(
+        gray, 32, 24, pyio.BytesIO(video.tobytes()), output, gray=True, rgb_output=True
+    )
+    result = np.frombuffer(output.getvalue(), dtype=np.uint8).reshape(video.shape)
+    for i, frame in enumerate(video):
+        for channel in range(3):
+            nt.assert_array_equal(result[i, ..., channel], gray(frame))
+
+
+def test_partial_frame():
+    data = random_frames(2).tobytes()[:-10]
+    with pytest.raises(ValueError, match="middle of a frame"):
+        frames.filter_raw_stream(
+            get_filter("color2gray", "numpy"), 32, 24, pyio.BytesIO(data), pyio.BytesIO(), gray=True
+        )
+
+
+def test_buffers_reused():
+    video = random_frames(20)
+    seen = set()
+    n = iter(range(len(video)))
+
+    def read_frame(buffer):
+        i = next(n, None)
+        if i is None:
+            return None
+        buffer[...] = video[i]
+        return buffer, i
+
+    def write_frame(buffer, i):
+        seen.add(id(buffer))
+        nt.assert_array_equal(buffer, video[i] // 2)
+
+    def halve(frame, out):
+        np.floor_divide(frame, 2, out=out)
+
+    count = frames.filter_frames(
+        read_frame, halve, write_frame, video.shape[1:], video.shape[1:], prefetch=2
+    )
+    assert count == 20
+    assert len(seen) <= 3
+
+
+def test_errors_raised():
+    def read_frame(buffer):
+        return buffer, {}
+
+    def write_frame(buffer, info):
+        raise OSError("disk full")
+
+    with pytest.raises(OSError, match="disk full"):
+        frames.filter_frames(
+            read_frame, lambda frame, out: None, write_frame, (2, 2, 3), (2, 2, 3)
+        )
+
+
+def test_filter_errors_stop_decoder():
+    threads = threading.active_count()
+
+    def read_frame(buffer):
+        # an endless stream, the decoder must be stopped
+        return buffer, {}
+
+    def fail(frame, out):
+        raise ValueError("bad frame")
+
+    with pytest.raises(ValueError, match="bad frame"):
+        frames.filter_frames(read_frame, fail, lambda buffer, info: None, (2, 2, 3), (2, 2, 3))
+    assert threading.active_count() == threads
+
+
+def test_animation_frame_sizes(tmp_path):
+    pages = [random_frames(1)[0], np.ascontiguousarray(random_frames(1)[0][:10, :20])]
+    file = tmp_path / "pages.tiff"
+    images = [Image.fromarray(page) for page in pages]
+    images[0].save(file, save_all=True, append_images=images[1:])
+
+    out_file = tmp_path / "out.tiff"
+    main([str(file), "-g", "-i", "numpy", "-o", str(out_file)])
+
+    gray = get_filter("color2gray", "numpy")
+    with Image.open(out_file) as result:
+        for frame, page in zip(ImageSequence.Iterator(result), pages):
+            nt.assert_array_equal(np.asarray(frame.convert("L")), gray(page))
+
+
+@pytest.mark.parametrize("suffix", [".gif", ".png", ".tiff"])
+def test_animation(tmp_path, suffix):
+    video = random_frames(4)
+    images = [Image.fromarray(frame) for frame in video]
+    file = tmp_path / f"in{suffix}"
+    images[0].save(file, save_all=True, append_images=images[1:], duration=[40, 50, 60, 70], loop=0)
+    assert frames.is_animated(file)
+    decoded = [np.asarray(frame.convert("RGB")) for frame in ImageSequence.Iterator(Image.open(file))]
+
+    out_file = tmp_path / f"out{suffix}"
+    main([str(file), "-g", "-i", "numpy", "-o", str(out_file)])
+
+    gray = get_filter("color2gray", "numpy")
+    with Image.open(out_file) as result:
+        assert result.n_frames == 4
+        for frame, original in zip(ImageSequence.Iterator(result), decoded):
+            nt.assert_array_equal(np.asarray(frame.convert("L")), gray(original))
+        if suffix != ".tiff":
+            result.seek(2)
+            assert result.info["duration"] == 60
+
+
+def test_not_animated(tmp_path, image):
+    file = tmp_path / "still.png"
+    Image.fromarray(image).save(file)
+    assert not frames.is_animated(file)
@@ -0,0 +1,72 @@
+"""Import-time budget
+
+Starting instapy (or importing the package) must not import heavy backends,
+which are only imported when a filter from them is used.
+"""
+import json
+import subprocess
+import sys
+
+import pytest
+
+# seconds, far above what is measured (about 0.01s and 0.03s),
+# so only an eager import of a heavy backend goes over
+import_budget = 0.25
+help_budget = 0.5
+
+heavy_modules = ["numba", "Cython", "line_profiler", "cProfile"]
+
+
+def run_python(code: str) -> dict:
+    """Run code in a fresh interpreter, timing it
+
+    Returns:
+        dict: 'seconds' it took and the 'modules' imported
+    """
+    script = f"""
+import json, sys, time
+start = time.perf_counter()
+try:
+{code}
+except SystemExit:
+    pass
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "modules": sorted(sys.modules)}}))
+"""
+    result = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_import_budget():
+    result = run_python("    import in3110_instapy")
+    for module in heavy_modules + ["numpy", "PIL"]:
+        assert module not in result["modules"]
+    assert result["seconds"] < import_budget
+
+
+def test_help_budget():
+    result = run_python("    from in3110_instapy.cli import main; main(['--help'])")
+    for module in heavy_modules + ["numpy", "PIL"]:
+        assert module not in result["modules"]
+    assert result["seconds"] < help_budget
+
+
+@pytest.mark.parametrize("module", ["timing", "benchmark", "profiling", "io"])
+def test_no_numba_on_import(module):
+    result = run_python(f"    import in3110_instapy.{module}")
+    for module in heavy_modules:
+        assert module not in result["modules"]
+
+
+def test_numba_imported_on_use():
+    result = run_python(
+        "    import in3110_instapy; in3110_instapy.get_filter('color2gray', 'numpy')"
+    )
+    assert "numba" not in result["modules"]
+    pytest.importorskip("numba")
+    result = run_python(
+        "    import in3110_instapy; in3110_instapy.get_filter('color2gray', 'numba')"
+    )
+    assert "numba" in result["modules"]
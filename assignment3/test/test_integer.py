@@ -0,0 +1,27 @@
+import numpy as np
+import numpy.testing as nt
+from in3110_instapy.integer_filters import integer_color2gray, integer_color2sepia
+from in3110_instapy.python_filters import python_color2gray, python_color2sepia
+
+
+def test_color2gray(image, reference_gray):
+    gray = integer_color2gray(image)
+
+    assert gray.dtype == np.uint8
+    nt.assert_array_equal(gray, reference_gray)
+
+
+def test_color2sepia(image, reference_sepia):
+    sepia = integer_color2sepia(image)
+
+    assert sepia.dtype == np.uint8
+    nt.assert_array_equal(sepia, reference_sepia)
+
+
+def test_exact_ties():
+    # pixels where the weighted sum is exactly a whole number,
+    # which float rounding may put just below
+    image = np.array([[[100, 100, 100], [255, 255, 255], [0, 0, 0], [50, 200, 30]]], dtype=np.uint8)
+
+    nt.assert_array_equal(integer_color2gray(image), python_color2gray(image))
+    nt.assert_array_equal(integer_color2sepia(image), python_color2sepia(image))
@@ -0,0 +1,88 @@
+import io as pyio
+from pathlib import Path
+
+import numpy as np
+import numpy.testing as nt
+import pytest
+from PIL import Image
+
+from in3110_instapy import get_filter, io
+from in3110_instapy.cli import main, run_filter
+
+test_dir = Path(__file__).absolute().parent
+
+
+def test_read_image_gray():
+    image = io.read_image(test_dir / "rain.jpg")
+    gray = io.read_image(test_dir / "rain.jpg", gray=True)
+    assert gray.shape == image.shape[:2]
+    # luma, close to color2gray but with other weights
+    expected = get_filter("color2gray", "numpy")(image)
+    assert np.abs(gray.astype(int) - expected).mean() < 5
+
+    small = io.read_image(test_dir / "rain.jpg", scale=2, gray=True)
+    assert small.shape == (image.shape[0] // 2, image.shape[1] // 2)
+
+
+def test_read_image_converts_to_rgb(tmp_path):
+    rgba = np.zeros((4, 5, 4), dtype=np.uint8)
+    Image.fromarray(rgba).save(tmp_path / "rgba.png")
+    assert io.read_image(tmp_path / "rgba.png").shape == (4, 5, 3)
+
+
+def test_to_pil_image(image):
+    gray = get_filter("color2gray", "numpy")(image)
+    assert io.to_pil_image(gray).mode == "L"
+    assert io.to_pil_image(gray[:, :, None]).mode == "L"
+    nt.assert_array_equal(np.asarray(io.to_pil_image(io.to_planar(image), "planar")), image)
+
+
+def test_to_pil_image_other_arrays(image):
+    rgba = np.dstack([image, np.full(image.shape[:2], 7, dtype=np.uint8)])
+    pil_image = io.to_pil_image(rgba)
+    assert pil_image.mode == "RGBA"
+    nt.assert_array_equal(np.asarray(pil_image), rgba)
+
+    gray16 = np.arange(12, dtype=np.uint16).reshape(3, 4) * 1000
+    pil_image = io.to_pil_image(gray16)
+    assert pil_image.mode.startswith("I;16")
+    nt.assert_array_equal(np.asarray(pil_image), gray16)
+
+    with pytest.raises(TypeError):
+        io.to_pil_image(image.astype(np.float64))
+
+    # strided arrays are written correctly too
+    nt.assert_array_equal(np.asarray(io.to_pil_image(image[:, ::2])), image[:, ::2])
+
+
+def test_write_image_options(image):
+    sizes = {}
+    for options in [{}, {"quality": 30}, {"optimize": True, "progressive": True}]:
+        buffer = pyio.BytesIO()
+        io.write_image(image, buffer, format="jpeg", **options)
+        sizes[str(options)] = len(buffer.getvalue())
+        assert Image.open(buffer).size == (image.shape[1], image.shape[0])
+    assert sizes["{'quality': 30}"] < sizes["{}"]
+
+    # options a format doesn't use are ignored
+    buffer = pyio.BytesIO()
+    io.write_image(image, buffer, format="png", quality=30, compress_level=1)
+    nt.assert_array_equal(np.asarray(Image.open(buffer)), image)
+
+
+def test_run_filter_fast_gray(tmp_path):
+    out_file = tmp_path / "gray.png"
+    timings = run_filter(
+        test_dir / "rain.jpg", out_file, implementation="numpy", fast_gray=True, profile=True
+    )
+    # decoding is the filter
+    assert "filter" not in timings
+    gray = np.asarray(Image.open(out_file))
+    nt.assert_array_equal(gray, io.read_image(test_dir / "rain.jpg", gray=True))
+
+
+def test_cli_encoder_options(tmp_path):
+    out_file = tmp_path / "sepia.jpg"
+    main([str(test_dir / "rain.jpg"), "-se", "-i", "numpy", "-o", str(out_file), "--quality", "50", "--progressive"])
+    with Image.open(out_file) as image:
+        assert image.info.get("progressive")
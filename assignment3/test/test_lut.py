@@ -0,0 +1,31 @@
+import numpy as np
+import numpy.testing as nt
+from in3110_instapy.lut_filters import lut_color2gray, lut_color2sepia, sepia_tables
+from in3110_instapy.numpy_filters import numpy_color2sepia
+
+
+def test_color2gray(image, reference_gray):
+    gray = lut_color2gray(image)
+
+    assert gray.dtype == np.uint8
+    nt.assert_array_equal(gray, reference_gray)
+
+
+def test_color2sepia(image, reference_sepia):
+    sepia = lut_color2sepia(image)
+
+    assert sepia.dtype == np.uint8
+    nt.assert_array_equal(sepia, reference_sepia)
+
+
+def test_color2sepia_k(image):
+    sepia = lut_color2sepia(image, k=0.5)
+
+    nt.assert_allclose(sepia, numpy_color2sepia(image, k=0.5), atol=1)
+
+
+def test_tables_cached():
+    sepia_tables.cache_clear()
+
+    assert sepia_tables(0.5) is sepia_tables(0.5)
+    assert sepia_tables.cache_info().hits == 1
@@ -0,0 +1,64 @@
+import json
+
+import numpy as np
+import pytest
+
+from in3110_instapy import get_filter, metrics
+from in3110_instapy.numpy_filters import numpy_color2gray
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_not_instrumented_by_default(monkeypatch):
+    monkeypatch.delenv("INSTAPY_METRICS", raising=False)
+    assert get_filter("color2gray", "numpy") is numpy_color2gray
+    monkeypatch.setenv("INSTAPY_METRICS", "1")
+    assert get_filter("color2gray", "numpy") is not numpy_color2gray
+
+
+def test_instrumented(image):
+    gray = get_filter("color2gray", "numpy", instrument=True)
+    sepia = get_filter("color2sepia", "numpy", instrument=True)
+    np.testing.assert_array_equal(gray(image), numpy_color2gray(image))
+    out = np.empty(image.shape[:2], dtype=np.uint8)
+    gray(image, out=out)
+    sepia(image, inplace=True)
+    with pytest.raises(ValueError):
+        gray(image, out=np.empty((1, 1), dtype=np.uint8))
+
+    snapshot = metrics.snapshot()
+    by_filter = {entry["filter"]: entry for entry in snapshot["filters"]}
+    gray_metrics = by_filter["color2gray"]
+    assert gray_metrics["implementation"] == "numpy"
+    assert gray_metrics["calls"] == 3
+    assert gray_metrics["errors"] == 1
+    pixels = image.shape[0] * image.shape[1]
+    assert gray_metrics["pixels"] == 2 * pixels
+    # only the first call allocated its output
+    assert gray_metrics["bytes_allocated"] == pixels
+    assert sum(gray_metrics["buckets"]) == 3
+    assert by_filter["color2sepia"]["bytes_allocated"] == 0
+    assert json.loads(metrics.to_json()) == snapshot
+
+
+def test_prometheus(image, tmp_path):
+    gray = get_filter("color2gray", "numpy", instrument=True)
+    gray(image)
+    gray(image)
+
+    text = metrics.to_prometheus()
+    labels = 'filter="color2gray",implementation="numpy"'
+    assert f"instapy_filter_calls_total{{{labels}}} 2" in text
+    assert f'instapy_filter_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in text
+    assert f"instapy_filter_duration_seconds_count{{{labels}}} 2" in text
+    assert "# TYPE instapy_filter_duration_seconds histogram" in text
+
+    metrics.write_metrics(tmp_path / "instapy.prom")
+    assert (tmp_path / "instapy.prom").read_text() == text
+    metrics.write_metrics(tmp_path / "instapy.json")
+    assert json.loads((tmp_path / "instapy.json").read_text()) == metrics.snapshot()
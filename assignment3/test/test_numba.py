@@ -1,5 +1,14 @@
+import numpy as np
 import numpy.testing as nt
-from in3110_instapy.numba_filters import numba_color2gray, numba_color2sepia
+from in3110_instapy.numba_filters import (
+    color2gray_kernel,
+    color2gray_planar_kernel,
+    color2sepia_kernel,
+    color2sepia_planar_kernel,
+    compile_kernels,
+    numba_color2gray,
+    numba_color2sepia,
+)
 from in3110_instapy.python_filters import python_color2gray, python_color2sepia
 
 #Bruker python metodene til å teste ,siden hvis de er like så er shape, data type og pixler like
@@ -7,19 +16,40 @@ from in3110_instapy.python_filters import python_color2gray, python_color2sepia
 def test_color2gray(image, reference_gray):
     gray = numba_color2gray(image)
 
-    assert (reference_gray == gray)
+    nt.assert_array_equal(gray, reference_gray)
 
 
 def test_color2sepia(image, reference_sepia):
     sepia = numba_color2sepia(image)
 
-    assert (reference_sepia == sepia)
+    nt.assert_array_equal(sepia, reference_sepia)
 
 
+def test_kernels_write_output(image, reference_gray, reference_sepia):
+    gray = np.zeros(image.shape[:2], dtype=np.uint8)
+    color2gray_kernel(image, gray)
+    nt.assert_array_equal(gray, reference_gray)
+
+    sepia = np.zeros_like(image)
+    color2sepia_kernel(image, sepia)
+    nt.assert_array_equal(sepia, reference_sepia)
+
+
+def test_compile_kernels(image, reference_gray):
+    # every supported signature, including read-only images
+    kernels = [color2gray_kernel, color2sepia_kernel, color2gray_planar_kernel, color2sepia_planar_kernel]
+    assert compile_kernels() == sum(len(kernel.signatures) for kernel in kernels)
+    assert len(color2gray_kernel.signatures) == len(color2gray_kernel.overloads) >= 8
+    image.setflags(write=False)
+    nt.assert_array_equal(numba_color2gray(image), reference_gray)
+    # no new compilation for read-only or sliced images
+    numba_color2sepia(image[::2, ::2])
+    assert len(color2gray_kernel.overloads) == len(color2gray_kernel.signatures)
+    assert len(color2sepia_kernel.overloads) == len(color2sepia_kernel.signatures)
 
 
 if __name__ == "__main__":
     image_path = "rain.jpg"
     test_color2gray(image_path, python_color2gray(image_path))
     
-    test_color2sepia(image_path, python_color2sepia(image_path))
\ No newline at end of file
+    test_color2sepia(image_path, python_color2sepia(image_path))
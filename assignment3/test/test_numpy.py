@@ -1,5 +1,10 @@
+import tracemalloc
+
 import numpy.testing as nt
 import numpy as np
+import pytest
+
+from in3110_instapy import io
 from in3110_instapy.numpy_filters import numpy_color2gray, numpy_color2sepia
 from in3110_instapy.python_filters import python_color2gray, python_color2sepia
 
@@ -8,7 +13,7 @@ from in3110_instapy.python_filters import python_color2gray, python_color2sepia
 def test_color2gray(image, reference_gray):
     gray = numpy_color2gray(image)
 
-    assert (reference_gray == gray)
+    nt.assert_array_equal(gray, reference_gray)
 
 
 def test_color2sepia(image, reference_sepia):
@@ -17,6 +22,33 @@ def test_color2sepia(image, reference_sepia):
     nt.assert_allclose(sepia, reference_sepia, rtol=1, atol=0)
 
 
+@pytest.mark.parametrize("k", [0, 0.5, 1])
+def test_color2sepia_low_memory(image, reference_sepia, k):
+    sepia = numpy_color2sepia(image, k=k, low_memory=True)
+    nt.assert_allclose(sepia, numpy_color2sepia(image, k=k, low_memory=False), atol=1)
+    if k == 1:
+        # summed in the same order as the python implementation
+        nt.assert_array_equal(sepia, reference_sepia)
+
+    expected = sepia.copy()
+    numpy_color2sepia(image, k=k, inplace=True)
+    nt.assert_array_equal(image, expected)
+
+
+def test_color2sepia_low_memory_peak():
+    image = io.random_image(1000, 1000)
+    out = np.empty_like(image)
+    numpy_color2sepia(image, out=out)
+    tracemalloc.start()
+    try:
+        numpy_color2sepia(image, out=out)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # only the band, not the image size
+    assert peak < 2 * 2**20
+
+
 if __name__ == "__main__":
     image_path = "rain.jpg"
     test_color2gray(image_path, python_color2gray(image_path))
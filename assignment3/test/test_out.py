@@ -0,0 +1,69 @@
+"""Tests for the out= and inplace= arguments of every implementation"""
+import numpy as np
+import numpy.testing as nt
+import pytest
+
+import in3110_instapy
+
+implementations = [
+    "python",
+    "numpy",
+    "numba",
+    "integer",
+    "lut",
+    "cython",
+    "parallel-numpy",
+    "parallel-numba",
+]
+
+
+def get_filter(filter_name, implementation):
+    if implementation == "cython":
+        pytest.importorskip("in3110_instapy.cython_filters")
+    return in3110_instapy.get_filter(filter_name, implementation)
+
+
+@pytest.mark.parametrize("implementation", implementations)
+def test_color2gray_out(image, reference_gray, implementation):
+    color2gray = get_filter("color2gray", implementation)
+    out = np.zeros(image.shape[:2], dtype=np.uint8)
+
+    result = color2gray(image, out=out)
+
+    assert result is out
+    nt.assert_array_equal(out, reference_gray)
+
+
+@pytest.mark.parametrize("implementation", implementations)
+def test_color2sepia_out(image, implementation):
+    color2sepia = get_filter("color2sepia", implementation)
+    # compare with the same implementation without `out`,
+    # so this only tests writing into `out`
+    expected = color2sepia(image)
+    out = np.zeros_like(image)
+
+    result = color2sepia(image, out=out)
+
+    assert result is out
+    nt.assert_array_equal(out, expected)
+
+
+@pytest.mark.parametrize("implementation", implementations)
+def test_color2sepia_inplace(image, implementation):
+    color2sepia = get_filter("color2sepia", implementation)
+    expected = color2sepia(image)
+
+    result = color2sepia(image, inplace=True)
+
+    assert result is image
+    nt.assert_array_equal(image, expected)
+
+
+@pytest.mark.parametrize("implementation", ["numpy", "numba", "integer", "lut"])
+def test_out_checked(image, implementation):
+    color2gray = get_filter("color2gray", implementation)
+
+    with pytest.raises(ValueError):
+        color2gray(image, out=np.zeros((2, 2), dtype=np.uint8))
+    with pytest.raises(ValueError):
+        color2gray(image, out=np.zeros(image.shape[:2], dtype=np.float64))
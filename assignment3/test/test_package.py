@@ -24,13 +24,15 @@ def test_import():
 )
 @pytest.mark.parametrize(
     "implementation",
-    ["python", "numpy", "numba"],
+    ["python", "numpy", "numba", "integer", "lut"],
 )
 def test_get_filter(filter_name, implementation):
     """Can we load our filter functions"""
     import in3110_instapy  # noqa
 
     filter_function = in3110_instapy.get_filter(filter_name, implementation)
+    # resolved filters are cached
+    assert in3110_instapy.get_filter(filter_name, implementation) is filter_function
 
 
 def test_io():
@@ -42,3 +44,13 @@ def test_io():
     assert len(image.shape) == 3
     assert image.dtype == np.uint8
     assert image.shape[2] == 3
+
+
+def test_help_lists_subcommands(capsys):
+    from in3110_instapy.cli import main, subcommands
+
+    with pytest.raises(SystemExit):
+        main(["--help"])
+    out = capsys.readouterr().out
+    for name in subcommands:
+        assert f"  {name} " in out
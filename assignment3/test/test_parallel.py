@@ -0,0 +1,27 @@
+import numpy.testing as nt
+import pytest
+import in3110_instapy
+from in3110_instapy.parallel import split_rows
+
+
+def test_split_rows():
+    bands = split_rows(10, 3)
+    assert bands[0][0] == 0
+    assert bands[-1][1] == 10
+    assert len(bands) == 3
+    # more workers than rows
+    assert len(split_rows(2, 8)) == 2
+
+
+@pytest.mark.parametrize("implementation", ["numpy", "numba", "integer", "python"])
+def test_color2gray(image, reference_gray, implementation):
+    gray = in3110_instapy.get_filter("color2gray", f"parallel-{implementation}", workers=3)(image)
+
+    nt.assert_array_equal(gray, reference_gray)
+
+
+@pytest.mark.parametrize("implementation", ["integer", "python"])
+def test_color2sepia(image, reference_sepia, implementation):
+    sepia = in3110_instapy.get_filter("color2sepia", f"parallel-{implementation}", workers=3)(image)
+
+    nt.assert_array_equal(sepia, reference_sepia)
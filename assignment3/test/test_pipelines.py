@@ -0,0 +1,70 @@
+import numpy as np
+import numpy.testing as nt
+import pytest
+
+import in3110_instapy
+from in3110_instapy.numpy_filters import numpy_color2gray, numpy_color2sepia
+from in3110_instapy.pipelines import fuse_stages, parse_stage
+
+
+def test_parse_stage():
+    assert parse_stage("gray")["name"] == "gray"
+    assert parse_stage("color2sepia")["k"] == 1
+    assert parse_stage("sepia:k=0.5")["k"] == 0.5
+    assert parse_stage("sepia:0.25")["k"] == 0.25
+    assert parse_stage("scale:2")["factor"] == 2
+    with pytest.raises(ValueError):
+        parse_stage("blur")
+    with pytest.raises(ValueError):
+        parse_stage("sepia:k=2")
+
+
+def test_fuse_stages():
+    stages = [parse_stage(spec) for spec in ["scale:2", "sepia:k=0.5", "gray", "sepia"]]
+
+    fused = fuse_stages(stages)
+
+    assert [stage["name"] for stage in fused] == ["scale", "linear"]
+    # applied in turn, since the result is truncated between the stages
+    assert len(fused[1]["matrices"]) == 3
+    for matrix, stage in zip(fused[1]["matrices"], stages[1:]):
+        nt.assert_array_equal(matrix, stage["matrix"])
+    assert not fused[1]["gray"]
+
+
+@pytest.mark.parametrize(
+    "specs",
+    [("gray",), ("sepia",), ("sepia:k=0.5", "gray"), ("gray", "sepia"), ("gray", "sepia", "sepia:k=0.3")],
+)
+def test_fused_matches_unfused(image, specs):
+    fused = in3110_instapy.pipeline(*specs)(image)
+    unfused = in3110_instapy.pipeline(*specs, fuse=False)(image)
+
+    assert fused.shape == unfused.shape
+    assert fused.dtype == np.uint8
+    nt.assert_array_equal(fused, unfused)
+
+
+def test_single_stage(image):
+    nt.assert_array_equal(in3110_instapy.pipeline("gray")(image), numpy_color2gray(image))
+    nt.assert_array_equal(in3110_instapy.pipeline("sepia")(image), numpy_color2sepia(image))
+    nt.assert_array_equal(
+        in3110_instapy.pipeline("sepia:k=0.5")(image), numpy_color2sepia(image, k=0.5)
+    )
+
+
+def test_scale(image):
+    height, width, _ = image.shape
+
+    result = in3110_instapy.pipeline("scale:2", "gray")(image)
+
+    assert result.shape == (height // 2, width // 2)
+
+
+def test_out(image):
+    out = np.empty(image.shape[:2], dtype=np.uint8)
+
+    result = in3110_instapy.pipeline("sepia", "gray")(image, out=out)
+
+    assert result is out
+    nt.assert_array_equal(out, in3110_instapy.pipeline("sepia", "gray")(image))
@@ -0,0 +1,97 @@
+import numpy as np
+import numpy.testing as nt
+import pytest
+
+from in3110_instapy import benchmark, get_filter, io, registry
+
+
+def test_to_planar(image):
+    planes = io.to_planar(image)
+    assert planes.shape == (3,) + image.shape[:2]
+    assert planes.flags.c_contiguous
+    nt.assert_array_equal(planes[1], image[:, :, 1])
+    nt.assert_array_equal(io.from_planar(planes), image)
+
+    out = np.empty_like(image)
+    assert io.from_planar(planes, out=out) is out
+    nt.assert_array_equal(out, image)
+
+
+def test_is_planar(image):
+    assert io.is_planar(io.to_planar(image), "planar")
+    assert not io.is_planar(image, "interleaved")
+    # the layout is never guessed from the shape
+    assert not io.is_planar(io.to_planar(image), "interleaved")
+    with pytest.raises(ValueError):
+        io.is_planar(image, "planar")
+    with pytest.raises(ValueError):
+        io.is_planar(image, "rows")
+
+
+@pytest.mark.parametrize("filter_name", ["color2gray", "color2sepia"])
+@pytest.mark.parametrize(
+    "implementation",
+    ["python", "numpy", "numba", "integer", "lut", "cython", "parallel-numpy", "parallel-numba"],
+)
+def test_planar_filter(image, filter_name, implementation):
+    try:
+        filter_function = get_filter(filter_name, implementation)
+    except ImportError:
+        pytest.skip(f"{implementation} is not available")
+    image = image[:40, :50]
+    planes = io.to_planar(image)
+    expected = filter_function(image)
+
+    filtered = filter_function(planes, layout="planar")
+    if filter_name == "color2sepia":
+        assert filtered.shape == planes.shape
+        filtered = io.from_planar(filtered)
+    nt.assert_array_equal(filtered, expected)
+
+    out = np.empty(filter_function(planes, layout="planar").shape, dtype=np.uint8)
+    assert filter_function(planes, out=out, layout="planar") is out
+    if filter_name == "color2sepia":
+        nt.assert_array_equal(io.from_planar(out), expected)
+        assert filter_function(planes, inplace=True, layout="planar") is planes
+        nt.assert_array_equal(io.from_planar(planes), expected)
+
+
+@pytest.mark.parametrize("implementation", ["numpy", "numba", "lut", "parallel-numpy"])
+def test_planar_three_wide(image, implementation):
+    # a planar image 3 pixels wide has the shape of an interleaved image 3 rows high
+    image = image[:20, :3]
+    planes = io.to_planar(image)
+    assert planes.shape == (3, 20, 3)
+    sepia = get_filter("color2sepia", implementation)
+    nt.assert_array_equal(io.from_planar(sepia(planes, layout="planar")), sepia(image))
+    # and without a layout, it is an interleaved image
+    nt.assert_array_equal(sepia(planes), sepia(np.ascontiguousarray(planes)))
+
+
+def test_registry_planar(image):
+    assert registry.supports("numba", "color2gray", planar=True)
+    assert registry.supports("numpy", "color2sepia", planar=True)
+    assert not registry.supports("lut", "color2gray", planar=True)
+    # stacks of planar images aren't supported
+    with pytest.raises(ValueError):
+        get_filter("color2gray", "numpy")(io.to_planar(image)[None], layout="planar")
+
+
+def test_benchmark_layouts(image):
+    report = benchmark.run_benchmarks(
+        sizes=[],
+        implementations=["numpy"],
+        filters=["color2gray"],
+        images={"test": image},
+        warmup=0,
+        repeat=2,
+        memory=False,
+        verbose=False,
+        layouts=["interleaved", "planar"],
+    )
+    assert [result["layout"] for result in report["results"]] == ["interleaved", "planar"]
+    assert report["results"][1]["width"] == image.shape[1]
+    # results without a layout, from older baselines, are interleaved
+    old_result = dict(report["results"][0])
+    del old_result["layout"]
+    assert len(benchmark.compare_reports({"results": [old_result]}, report)) == 1
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from in3110_instapy import io
+from in3110_instapy.cli import main, run_filter
+from in3110_instapy.profiling import run_profiles, stage_timer
+
+
+def test_cprofile(capsys):
+    run_profiles("cprofile", implementations=["numpy"], width=32, height=24)
+    out = capsys.readouterr().out
+    assert "Profiling numpy color2gray with cprofile" in out
+    assert "Profiling numpy color2sepia with cprofile" in out
+    assert "numpy_color2sepia" in out
+    assert "cumulative" in out
+
+
+def test_line_profiler(capsys):
+    pytest.importorskip("line_profiler")
+    run_profiles(
+        "line_profiler",
+        implementations=["numpy"],
+        filter_names=["color2gray"],
+        width=32,
+        height=24,
+    )
+    out = capsys.readouterr().out
+    assert "Function: numpy_color2gray" in out
+    assert "Line #" in out
+
+
+def test_bad_profiler():
+    with pytest.raises(ValueError):
+        run_profiles("perf")
+
+
+def test_stage_timer():
+    timings = {}
+    for _ in range(2):
+        with stage_timer(timings, "filter"):
+            pass
+    assert list(timings) == ["filter"]
+    assert timings["filter"] >= 0
+
+    # no timings to record
+    with stage_timer(None, "filter"):
+        pass
+
+
+def test_run_filter_profile(tmp_path, capsys):
+    file = tmp_path / "in.png"
+    out_file = tmp_path / "out.png"
+    io.write_image(io.random_image(64, 48), file)
+
+    timings = run_filter(file, out_file, implementation="numpy", scale=2, profile=True)
+    assert {"decode", "resize", "filter", "encode"} <= set(timings)
+    record = json.loads(capsys.readouterr().err.splitlines()[-1])
+    assert record["stages"] == timings
+    assert record["total"] == pytest.approx(sum(timings.values()))
+    assert record["implementation"] == "numpy"
+
+    main([str(file), "-o", str(out_file), "-i", "numpy", "--profile"])
+    record = json.loads(capsys.readouterr().err.splitlines()[-1])
+    # no resize stage when not downscaling
+    assert "resize" not in record["stages"]
+    assert "encode" in record["stages"]
@@ -0,0 +1,122 @@
+import numpy as np
+import numpy.testing as nt
+import pytest
+
+import in3110_instapy
+from in3110_instapy import registry
+
+
+def test_backends():
+    assert {"python", "numpy", "numba", "integer", "lut", "cython"} <= set(registry.backends)
+    assert registry.get_backend("numba")["parallel"] == "native"
+    assert registry.get_backend("numpy")["parallel"] == "threads"
+    assert registry.supports("numpy", "color2sepia", dtype=np.uint8, out=True, inplace=True)
+    assert not registry.supports("numpy", "color2blue")
+    assert not registry.supports("numpy", "color2gray", dtype=np.float32)
+
+
+def test_is_available():
+    assert registry.is_available("numpy")
+    assert not registry.is_available("nosuch")
+    # cython is available exactly when the compiled module imports
+    try:
+        in3110_instapy.get_filter("color2gray", "cython")
+    except ImportError:
+        compiled = False
+    else:
+        compiled = True
+    assert registry.is_available("cython") == compiled
+    assert "python" not in registry.candidates("color2gray")
+
+
+@pytest.fixture
+def mine_backend(tmp_path, monkeypatch):
+    """A backend 'mine', unregistered and uncached again after the test"""
+    (tmp_path / "my_filters.py").write_text(
+        "from in3110_instapy.numpy_filters import numpy_color2gray as mine_color2gray\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    yield registry.register_backend("mine", module="my_filters", filters=("color2gray",))
+    registry.backends.pop("mine", None)
+    in3110_instapy._resolve_filter.cache_clear()
+
+
+def test_register_backend(mine_backend, image):
+    assert registry.is_available("mine")
+    gray = in3110_instapy.get_filter("color2gray", "mine")
+    nt.assert_array_equal(gray(image), in3110_instapy.get_filter("color2gray", "numpy")(image))
+    # not declared exact, so 'auto' doesn't pick it
+    assert "mine" not in registry.candidates("color2gray")
+
+    with pytest.raises(ValueError):
+        registry.register_backend("bad", parallel="gpu")
+
+
+def test_candidates_exact(image, reference_gray, reference_sepia):
+    for filter_name, reference in [("color2gray", reference_gray), ("color2sepia", reference_sepia)]:
+        for name in registry.candidates(filter_name):
+            backend = name[len("parallel-") :] if name.startswith("parallel-") else name
+            assert registry.get_backend(backend)["exact"]
+            result = in3110_instapy.get_filter(filter_name, name)(image)
+            nt.assert_array_equal(result, reference)
+
+
+def test_choose_implementation():
+    calibration = {
+        "3072": {"numpy": 1.0, "numba": 2.0},
+        "2073600": {"numpy": 2.0, "numba": 1.0},
+    }
+    assert registry.choose_implementation("color2gray", (40, 60, 3), calibration) == "numpy"
+    assert registry.choose_implementation("color2gray", (1000, 2000, 3), calibration) == "numba"
+
+
+def test_auto(tmp_path, monkeypatch, image, reference_gray):
+    monkeypatch.setenv("INSTAPY_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(registry, "_calibration", {})
+    monkeypatch.setattr(registry, "calibration_sizes", [(32, 24), (320, 180)])
+    monkeypatch.setattr(registry, "candidates", lambda filter_name: ["numpy", "integer"])
+
+    gray = in3110_instapy.get_filter("color2gray", "auto")
+    result = gray(image)
+    assert result.shape == image.shape[:2]
+    assert np.abs(result.astype(int) - reference_gray).max() <= 1
+    assert registry.calibration_path().exists()
+
+    # later processes load the calibration from disk
+    monkeypatch.setattr(registry, "_calibration", {})
+
+    def calibrate(*args, **kwargs):
+        raise AssertionError("calibrated again")
+
+    monkeypatch.setattr(registry, "calibrate", calibrate)
+    assert registry.choose_implementation("color2sepia", image.shape) in {"numpy", "integer"}
+
+
+def test_auto_workers(monkeypatch, image, reference_gray):
+    calibration = {"3072": {"numpy": 1.0, "parallel-numpy": 2.0}}
+    monkeypatch.setattr(registry, "_calibration", {"color2gray": calibration})
+    chosen = []
+    real_get_filter = in3110_instapy.get_filter
+
+    def get_filter(filter, implementation="python", workers=None, instrument=None):
+        chosen.append((implementation, workers))
+        return real_get_filter(filter, implementation, workers, instrument)
+
+    monkeypatch.setattr(in3110_instapy, "get_filter", get_filter)
+    gray = registry.auto_filter("color2gray", workers=2)
+    nt.assert_array_equal(gray(image), reference_gray)
+    # 'auto' is resolved to an implementation, then run on 2 cores
+    assert chosen[0] == ("parallel-numpy", 2)
+
+
+def test_run_filter_auto_workers(tmp_path, monkeypatch):
+    from in3110_instapy import io
+    from in3110_instapy.cli import run_filter
+
+    calibration = {"3072": {"numpy": 1.0}}
+    monkeypatch.setattr(registry, "_calibration", {"color2gray": calibration})
+    file = tmp_path / "in.png"
+    out_file = tmp_path / "out.png"
+    io.write_image(io.random_image(32, 24), file)
+    run_filter(file, out_file, implementation="auto", workers=2)
+    assert io.read_image(out_file).shape == (24, 32)
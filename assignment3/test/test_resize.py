@@ -0,0 +1,66 @@
+import numpy as np
+import numpy.testing as nt
+import pytest
+
+from in3110_instapy import io
+from in3110_instapy.resize import box_average, downscale, resize_area, scaled_size
+
+
+def test_box_average():
+    image = np.array(
+        [
+            [[0, 0, 0], [2, 4, 6], [9, 9, 9]],
+            [[4, 4, 4], [2, 5, 7], [9, 9, 9]],
+        ],
+        dtype=np.uint8,
+    )
+
+    small = box_average(image, 2)
+
+    # the last column doesn't fill a block, and is dropped
+    assert small.shape == (1, 1, 3)
+    # (0 + 2 + 4 + 2) / 4 = 2, (0 + 4 + 4 + 5) / 4 = 3.25, (0 + 6 + 4 + 7) / 4 = 4.25
+    nt.assert_array_equal(small[0, 0], [2, 3, 4])
+
+
+def test_box_average_matches_mean(image):
+    small = box_average(image, 4)
+
+    h, w = small.shape[:2]
+    expected = image[: h * 4, : w * 4].reshape(h, 4, w, 4, 3).mean(axis=(1, 3))
+    nt.assert_allclose(small, expected, atol=0.5)
+
+
+@pytest.mark.parametrize("factor", [1, 2, 3, 2.5, 7.3])
+def test_downscale_size(image, factor):
+    height, width, _ = image.shape
+
+    small = downscale(image, factor)
+
+    assert small.shape == (int(height / factor), int(width / factor), 3)
+    assert small.dtype == np.uint8
+
+
+def test_downscale_gray(image):
+    gray = image[..., 0]
+
+    assert downscale(gray, 2).shape == (gray.shape[0] // 2, gray.shape[1] // 2)
+    assert resize_area(gray, (100, 50)).shape == (50, 100)
+
+
+def test_upscale_not_supported():
+    with pytest.raises(ValueError):
+        scaled_size(10, 10, 0.5)
+
+
+@pytest.mark.parametrize("suffix", [".jpg", ".png"])
+def test_read_image_scaled(tmp_path, suffix):
+    filename = tmp_path / f"image{suffix}"
+    io.write_image(io.random_image(640, 480), filename)
+
+    image = io.read_image(filename, scale=4)
+
+    assert image.shape == (120, 160, 3)
+    # close to downscaling the fully decoded image
+    full = downscale(io.read_image(filename), 4)
+    assert np.abs(image.astype(int) - full).mean() < 8
@@ -0,0 +1,173 @@
+import asyncio
+import http.client
+import io as pyio
+import time
+
+import numpy as np
+import numpy.testing as nt
+from PIL import Image
+
+from in3110_instapy import get_filter
+from in3110_instapy.server import FilterService, filter_batch, start_server
+
+
+def request(port, method, path, body=None):
+    """Make one request (blocking), returning (status, headers, body)"""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        connection.request(method, path, body=body)
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        connection.close()
+
+
+def png_bytes(image):
+    buffer = pyio.BytesIO()
+    Image.fromarray(image).save(buffer, format="png")
+    return buffer.getvalue()
+
+
+def run_with_server(test, **options):
+    """Run `await test(port, service)` against a server on localhost"""
+
+    async def main():
+        server, service = await start_server("127.0.0.1", 0, **options)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            await test(port, service)
+
+    asyncio.run(main())
+
+
+async def call(*args):
+    return await asyncio.get_running_loop().run_in_executor(None, request, *args)
+
+
+def test_filter_batch(image):
+    gray = get_filter("color2gray", "numpy")
+    results = filter_batch(gray, [image, image[::-1].copy()])
+    nt.assert_array_equal(results[0], gray(image))
+    nt.assert_array_equal(results[1], gray(image[::-1]))
+
+
+def test_endpoints(image):
+    async def test(port, service):
+        status, _, body = await call(port, "GET", "/healthz")
+        assert status == 200
+        # wait for the warm-up
+        for _ in range(100):
+            status, _, _ = await call(port, "GET", "/readyz")
+            if status == 200:
+                break
+            await asyncio.sleep(0.05)
+        assert status == 200
+
+        status, headers, body = await call(port, "POST", "/color2sepia", png_bytes(image))
+        assert status == 200
+        assert headers["Content-Type"] == "image/png"
+        result = np.asarray(Image.open(pyio.BytesIO(body)))
+        nt.assert_array_equal(result, get_filter("color2sepia", "numpy")(image))
+
+        status, _, body = await call(port, "POST", "/color2gray?implementation=integer", png_bytes(image))
+        assert status == 200
+        result = np.asarray(Image.open(pyio.BytesIO(body)))
+        nt.assert_array_equal(result, get_filter("color2gray", "integer")(image))
+
+        status, headers, body = await call(port, "POST", "/color2gray?format=jpeg&quality=50", png_bytes(image))
+        assert status == 200
+        assert headers["Content-Type"] == "image/jpeg"
+        assert (await call(port, "POST", "/color2gray?quality=high", png_bytes(image)))[0] == 400
+
+        status, _, body = await call(port, "GET", "/metrics")
+        assert status == 200
+        assert b'instapy_filter_calls_total{filter="color2sepia",implementation="numpy"} 1' in body
+
+        assert (await call(port, "POST", "/color2gray", b"not an image"))[0] == 400
+        for implementation in ["nosuch", "parallel-python", "parallel-parallel-numpy"]:
+            path = f"/color2gray?implementation={implementation}"
+            assert (await call(port, "POST", path, png_bytes(image)))[0] == 400
+        assert (await call(port, "POST", "/color2blue", b""))[0] == 404
+        assert (await call(port, "GET", "/color2gray"))[0] == 405
+
+    run_with_server(test)
+
+
+def test_healthz_while_loading(monkeypatch):
+    get_filter = FilterService.get_filter
+
+    def slow_get_filter(self, filter_name, implementation):
+        # like importing and compiling a backend
+        time.sleep(1)
+        return get_filter(self, filter_name, implementation)
+
+    monkeypatch.setattr(FilterService, "get_filter", slow_get_filter)
+
+    async def test(port, service):
+        await asyncio.sleep(0.05)
+        start = time.perf_counter()
+        assert (await call(port, "GET", "/healthz"))[0] == 200
+        assert time.perf_counter() - start < 0.5
+        assert (await call(port, "GET", "/readyz"))[0] == 503
+
+    run_with_server(test)
+
+
+def test_too_large():
+    async def test(port, service):
+        assert (await call(port, "POST", "/color2gray", b"x" * 2000))[0] == 413
+
+    run_with_server(test, warm_up=False, max_body_bytes=1000)
+
+
+def test_bad_content_length():
+    async def test(port, service):
+        for length in ["abc", "-5"]:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(
+                f"POST /color2gray HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode()
+                + b"GET /healthz HTTP/1.1\r\n\r\n"
+            )
+            response = await reader.read()
+            writer.close()
+            assert response.startswith(b"HTTP/1.1 400 ")
+            assert b"Connection: close" in response
+            # the connection is closed, the rest isn't parsed as another request
+            assert response.count(b"HTTP/1.1") == 1
+
+    run_with_server(test, warm_up=False)
+
+
+def test_batching(image):
+    async def test(port, service):
+        images = [np.roll(image, i, axis=0) for i in range(4)]
+        responses = await asyncio.gather(
+            *[call(port, "POST", "/color2gray", png_bytes(im)) for im in images]
+        )
+        gray = get_filter("color2gray", "numpy")
+        for (status, _, body), im in zip(responses, images):
+            assert status == 200
+            nt.assert_array_equal(np.asarray(Image.open(pyio.BytesIO(body))), gray(im))
+        # all four filtered in one call
+        assert service.stats["batches"] == 1
+        assert service.stats["batched_images"] == 4
+
+    run_with_server(test, warm_up=False, batch_delay=0.5, max_batch=4)
+
+
+def test_backpressure(image):
+    async def test(port, service):
+        first = asyncio.ensure_future(call(port, "POST", "/color2gray", png_bytes(image)))
+        # the first request waits for its batch, so the service is full
+        while service.pending == 0:
+            await asyncio.sleep(0.01)
+        status, headers, _ = await call(port, "POST", "/color2gray", png_bytes(image))
+        assert status == 503
+        assert headers["Retry-After"] == "1"
+        # rejected before the upload is read
+        assert headers["Connection"] == "close"
+        assert (await call(port, "GET", "/readyz"))[0] == 503
+        assert (await first)[0] == 200
+        assert service.stats["rejected"] == 1
+
+    run_with_server(test, warm_up=False, batch_delay=0.5, max_pending=1)
@@ -0,0 +1,59 @@
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import numpy.testing as nt
+import pytest
+
+from in3110_instapy import io
+
+
+def gray_band(in_handle, out_handle, start, stop):
+    from in3110_instapy import get_filter
+
+    gray = get_filter("color2gray", "numpy")
+    with io.attach_shared(in_handle) as image, io.attach_shared(out_handle) as out:
+        gray(image[start:stop], out=out[start:stop])
+
+
+def test_shared_array():
+    with io.shared_array((4, 5, 3)) as (array, handle):
+        assert array.shape == (4, 5, 3)
+        assert array.dtype == np.uint8
+        # only the handle needs to be sent to other processes
+        assert pickle.loads(pickle.dumps(handle)) == handle
+        array[...] = 7
+        with io.attach_shared(handle) as attached:
+            nt.assert_array_equal(attached, array)
+            attached[0, 0, 0] = 1
+        assert array[0, 0, 0] == 1
+
+    # removed at the end of the block
+    with pytest.raises(FileNotFoundError):
+        with io.attach_shared(handle):
+            pass
+
+
+def test_share_array_dtype():
+    data = np.arange(12, dtype=np.float32).reshape(3, 4)
+    with io.share_array(data) as (shared, handle):
+        with io.attach_shared(handle) as attached:
+            assert attached.dtype == np.float32
+            nt.assert_array_equal(attached, data)
+
+
+def test_workers_write_shared_output(image):
+    from in3110_instapy import get_filter
+
+    context = multiprocessing.get_context("spawn")
+    with io.share_array(image) as (_, in_handle), io.shared_array(image.shape[:2]) as (out, out_handle):
+        with ProcessPoolExecutor(2, mp_context=context) as pool:
+            half = image.shape[0] // 2
+            futures = [
+                pool.submit(gray_band, in_handle, out_handle, 0, half),
+                pool.submit(gray_band, in_handle, out_handle, half, image.shape[0]),
+            ]
+            for future in futures:
+                future.result()
+        nt.assert_array_equal(out, get_filter("color2gray", "numpy")(image))
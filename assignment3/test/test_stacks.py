@@ -0,0 +1,74 @@
+import numpy as np
+import numpy.testing as nt
+import pytest
+
+from in3110_instapy import get_filter, io
+from in3110_instapy.stacks import filter_images, pack_images, unpack_images
+
+
+@pytest.fixture
+def stack():
+    return np.stack([io.random_image(40, 30) for _ in range(3)])
+
+
+@pytest.mark.parametrize("filter_name", ["color2gray", "color2sepia"])
+@pytest.mark.parametrize(
+    "implementation",
+    ["python", "numpy", "numba", "integer", "lut", "cython", "parallel-numpy"],
+)
+def test_filter_stack(stack, filter_name, implementation):
+    try:
+        filter_function = get_filter(filter_name, implementation)
+    except ImportError:
+        pytest.skip(f"{implementation} is not available")
+    filtered = filter_function(stack)
+    expected_shape = stack.shape[:3] if filter_name == "color2gray" else stack.shape
+    assert filtered.shape == expected_shape
+    for image, result in zip(stack, filtered):
+        nt.assert_array_equal(result, filter_function(image))
+
+    out = np.empty(expected_shape, dtype=np.uint8)
+    assert filter_function(stack, out=out) is not None
+    nt.assert_array_equal(out, filtered)
+
+
+def test_filter_stack_inplace(stack):
+    color2sepia = get_filter("color2sepia", "numpy")
+    expected = color2sepia(stack)
+    color2sepia(stack, inplace=True)
+    nt.assert_array_equal(stack, expected)
+
+    # a strided stack can't be filtered in place, since it can't be viewed as rows
+    strided = stack[:, 1:]
+    with pytest.raises(ValueError):
+        color2sepia(strided, inplace=True)
+    # but it can be filtered into a new array
+    nt.assert_array_equal(color2sepia(strided)[1], color2sepia(strided[1]))
+
+
+def test_pack_images():
+    small = [io.random_image(16, 8) for _ in range(3)]
+    large = [io.random_image(32, 16) for _ in range(2)]
+    images = [small[0], large[0], small[1], small[2], large[1]]
+
+    packed = pack_images(images)
+    assert [indices for indices, _ in packed] == [[0, 2, 3], [1, 4]]
+    for indices, stack in packed:
+        assert stack.flags.c_contiguous
+        for i, image in zip(indices, stack):
+            nt.assert_array_equal(image, images[i])
+
+    packed = pack_images(images, max_batch=2)
+    assert [indices for indices, _ in packed] == [[0, 2], [3], [1, 4]]
+
+    for image, unpacked in zip(images, unpack_images(packed, len(images))):
+        nt.assert_array_equal(unpacked, image)
+
+
+def test_filter_images():
+    images = [io.random_image(16, 8), io.random_image(32, 16), io.random_image(16, 8)]
+    color2gray = get_filter("color2gray", "numpy")
+    filtered = filter_images(color2gray, images, max_batch=4)
+    assert len(filtered) == len(images)
+    for image, result in zip(images, filtered):
+        nt.assert_array_equal(result, color2gray(image))
@@ -0,0 +1,100 @@
+import mmap
+
+import numpy as np
+import numpy.testing as nt
+import pytest
+
+import in3110_instapy
+from in3110_instapy import io
+from in3110_instapy.cli import run_filter
+
+
+def is_mapped(array):
+    """Whether an array's memory is a memory-mapped file"""
+    while isinstance(array.base, np.ndarray):
+        array = array.base
+    base = array.base
+    if isinstance(base, memoryview):
+        base = base.obj
+    return isinstance(base, mmap.mmap)
+
+
+@pytest.mark.parametrize("suffix", [".npy", ".ppm", ".tif"])
+def test_open_image_rows_mapped(tmp_path, image, suffix):
+    filename = tmp_path / f"image{suffix}"
+    if suffix == ".npy":
+        np.save(filename, image)
+    else:
+        io.write_image(image, filename)
+
+    rows = io.open_image_rows(filename)
+
+    assert is_mapped(rows)
+    nt.assert_array_equal(rows, image)
+
+
+def test_open_image_rows_decoded(tmp_path, image):
+    filename = tmp_path / "image.png"
+    io.write_image(image, filename)
+
+    rows = io.open_image_rows(filename)
+
+    assert not is_mapped(rows)
+    nt.assert_array_equal(rows, image)
+
+
+def test_strip_rows():
+    assert io.strip_rows(1000, memory_budget=1000 * io.streaming_bytes_per_pixel * 10) == 10
+    # always at least one row
+    assert io.strip_rows(1000, memory_budget=1) == 1
+
+
+@pytest.mark.parametrize("out_suffix", [".npy", ".ppm", ".png"])
+@pytest.mark.parametrize("filter_name", ["color2gray", "color2sepia"])
+def test_stream_filter(tmp_path, image, filter_name, out_suffix):
+    in_file = tmp_path / "image.ppm"
+    out_file = tmp_path / f"filtered{out_suffix}"
+    io.write_image(image, in_file)
+    filter_function = in3110_instapy.get_filter(filter_name, "numba")
+
+    # a small budget, so the image is filtered in many strips
+    io.stream_filter(
+        filter_function,
+        in_file,
+        out_file,
+        gray=filter_name == "color2gray",
+        memory_budget=image.shape[1] * io.streaming_bytes_per_pixel * 7,
+    )
+
+    if out_suffix == ".npy":
+        filtered = np.load(out_file)
+    else:
+        filtered = io.read_image(out_file)
+    nt.assert_array_equal(filtered, filter_function(image))
+    # no temporary files left behind
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted([in_file.name, out_file.name])
+
+
+def test_stream_filter_closes_mapping(tmp_path, image, monkeypatch):
+    in_file = tmp_path / "image.ppm"
+    io.write_image(image, in_file)
+    maps = []
+    map_image = io._map_image
+
+    def record(filename):
+        mapped = map_image(filename)
+        maps.append(mapped[1])
+        return mapped
+
+    monkeypatch.setattr(io, "_map_image", record)
+    filter_function = in3110_instapy.get_filter("color2sepia", "numpy")
+    io.stream_filter(filter_function, in_file, tmp_path / "filtered.ppm")
+    assert maps[0].closed
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_gray_input_rejected(tmp_path, image, stream):
+    in_file = tmp_path / "gray.pgm"
+    io.write_image(image[:, :, 0], in_file)
+    with pytest.raises(ValueError, match="rgb image"):
+        run_filter(in_file, tmp_path / "out.ppm", "numpy", "color2sepia", stream=stream)